@@ -135,8 +135,8 @@ main() {
     log "Iniciando Event Embeddings Generator..."
     log "Comando: $cmd"
     
-    # Validar variables de entorno requeridas
-    if [ -z "$DB_SOURCE_HOST" ] || [ -z "$DB_DEST_HOST" ]; then
+    # Validar variables de entorno requeridas (el coordinador de shards solo usa PGVector)
+    if [ -z "$DB_DEST_HOST" ] || { [ "$cmd" != "finalize-shards" ] && [ -z "$DB_SOURCE_HOST" ]; }; then
         error "Variables de entorno DB_SOURCE_HOST y DB_DEST_HOST son requeridas"
         exit 1
     fi
@@ -154,6 +154,36 @@ main() {
             exec python /app/src/generate_embeddings.py
             ;;
             
+        "finalize-shards")
+            # Paso coordinador de la generación distribuida (solo necesita PGVector)
+            log "Finalizando ejecución distribuida ${SHARD_RUN_ID}..."
+            exec python -m src.sharding finalize
+            ;;
+            
+        "benchmark-ann")
+            # Barrido de parámetros HNSW vs búsqueda exacta sobre los vectores almacenados
+            shift
+            exec python -m src.benchmark_ann "$@"
+            ;;
+            
+        "benchmark-queries")
+            # Servicio de consultas por micro-lotes vs una consulta por pasada
+            shift
+            exec python -m src.query_service bench "$@"
+            ;;
+            
+        "partitions")
+            # Particiones por evento (VECTOR_STORAGE=partitioned)
+            shift
+            exec python -m src.partitions "$@"
+            ;;
+            
+        "autotune")
+            # Calibrar BATCH_SIZE y los hilos de torch para este nodo (perfil en CACHE_DIR)
+            shift
+            exec python -m src.autotune "$@"
+            ;;
+            
         "init-only")
             # Solo inicializar las bases de datos
             init_source_db || exit 1
@@ -86,11 +86,27 @@ CREATE TABLE IF NOT EXISTS embeddings_sync_log (
     metadata JSONB DEFAULT '{}'
 );
 
+-- Tablas del generador: las crea el módulo que las usa (CREATE TABLE IF NOT EXISTS antes de la
+-- primera escritura), que guarda la única definición de su esquema; no se duplican aquí:
+--   embeddings_run_checkpoints  src/checkpoint.py    CHECKPOINTS_DDL
+--   embeddings_shards           src/sharding.py      SHARDS_DDL
+--   agenda_events               src/events.py        EVENTS_DDL (y la vista agenda_documents)
+--   agenda_query_lexicon        src/query_router.py  LEXICON_DDL
+--   agenda_centroids            src/centroids.py     CENTROIDS_DDL
+--   session_neighbors           src/neighbors.py     NEIGHBORS_DDL
+
+-- Almacenamiento particionado por evento (VECTOR_STORAGE=partitioned): agenda_session_vectors
+-- no se crea aquí. El generador la crea con vector(EMBEDDING_DIM) (y su índice GIN sobre
+-- cmetadata), una partición agenda_session_vectors_e<event_id> por evento y su índice HNSW.
+
 -- ============================================
 -- ÍNDICES
 -- ============================================
 
 -- Índices HNSW para búsquedas vectoriales
+-- El índice de la colección de agendas lo gestiona el generador como índice parcial de
+-- langchain_pg_embedding (WHERE collection_id = ...), uno por colección: se elimina antes de cargas masivas y se construye una vez al final (HNSW_M,
+-- HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, HNSW_MAINTENANCE_WORK_MEM, HNSW_PARALLEL_WORKERS).
 CREATE INDEX IF NOT EXISTS idx_session_embeddings_vector
 ON session_embeddings USING hnsw (embedding vector_cosine_ops)
 WITH (m = 16, ef_construction = 64);
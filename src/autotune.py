@@ -0,0 +1,216 @@
+"""
+Throughput autotuner for encode batch size and torch thread count
+
+Encodes a sample of real agenda documents (``generate_agenda_content``) over a
+grid of batch sizes x torch intra-op thread counts, keeps the configuration
+with the best texts/sec and stores it in ``CACHE_DIR`` keyed by model and CPU
+signature. The generator loads the stored profile automatically::
+
+    python -m src.autotune --sample 256 --batch-sizes 8,16,32,64,128 --threads 1,2,4
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from .cpu import effective_cpus
+from .utils import get_logger, parse_int_list
+
+logger = get_logger("autotune")
+
+
+@dataclass
+class TunePoint:
+    """Throughput of one batch size / thread count combination"""
+    batch_size: int
+    threads: int
+    texts_per_sec: float
+    seconds: float
+
+
+@dataclass
+class TuneProfile:
+    """Best configuration for a model on a CPU signature, plus the measured curve"""
+    model_name: str
+    cpu_signature: str
+    batch_size: int
+    threads: int
+    texts_per_sec: float
+    sample_size: int
+    created_at: float = field(default_factory=time.time)
+    points: List[TunePoint] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TuneProfile":
+        points = [TunePoint(**p) for p in data.pop("points", [])]
+        return cls(points=points, **data)
+
+
+def cpu_signature() -> str:
+    """
+    Human-readable CPU identity: model name, architecture and usable CPUs (quota-aware)
+    """
+    model = platform.processor() or "unknown"
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{model}|{platform.machine()}|{effective_cpus()}cpu"
+
+
+def profile_path(cache_dir: str, model_name: str, signature: str) -> str:
+    key = hashlib.sha256(f"{model_name}|{signature}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, "autotune", f"{key}.json")
+
+
+def save_profile(cache_dir: str, profile: TuneProfile) -> str:
+    path = profile_path(cache_dir, profile.model_name, profile.cpu_signature)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(asdict(profile), f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def load_profile(cache_dir: str, model_name: str, signature: Optional[str] = None) -> Optional[TuneProfile]:
+    """
+    Stored profile for this model on this CPU, or ``None``
+    """
+    path = profile_path(cache_dir, model_name, signature or cpu_signature())
+    try:
+        with open(path, encoding="utf-8") as f:
+            return TuneProfile.from_dict(json.load(f))
+    except (OSError, ValueError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logger.warning(f"Ignoring unreadable autotune profile {path}: {e}")
+        return None
+
+
+def calibrate(encode, texts: List[str], batch_sizes: List[int], thread_counts: List[int],
+              set_threads) -> List[TunePoint]:
+    """
+    Time ``encode(texts, batch_size)`` for every grid point.
+
+    ``set_threads(n)`` switches the intra-op thread count; each thread setting
+    gets one warm-up pass so first-call overhead is not measured.
+    """
+    points = []
+    for threads in thread_counts:
+        set_threads(threads)
+        encode(texts[:max(batch_sizes)], max(batch_sizes))
+        for batch_size in batch_sizes:
+            started = time.perf_counter()
+            encode(texts, batch_size)
+            elapsed = time.perf_counter() - started
+            point = TunePoint(batch_size, threads, len(texts) / elapsed if elapsed else 0.0, elapsed)
+            logger.info(f"batch={batch_size:<4} threads={threads:<3} {point.texts_per_sec:8.1f} texts/s")
+            points.append(point)
+    return points
+
+
+def best_point(points: List[TunePoint], tolerance: float = 0.02) -> TunePoint:
+    """
+    Fastest point; within ``tolerance`` of it, prefer fewer threads and smaller batches
+    (same throughput for less CPU and memory, and measurement noise is not a win)
+    """
+    top = max(p.texts_per_sec for p in points)
+    close = [p for p in points if p.texts_per_sec >= top * (1 - tolerance)]
+    return min(close, key=lambda p: (p.threads, p.batch_size))
+
+
+def format_curve(points: List[TunePoint]) -> str:
+    """
+    texts/sec table: one row per thread count, one column per batch size
+    """
+    batch_sizes = sorted({p.batch_size for p in points})
+    thread_counts = sorted({p.threads for p in points})
+    by_key = {(p.threads, p.batch_size): p.texts_per_sec for p in points}
+    best = best_point(points)
+    header = f"{'threads':>8}" + "".join(f"{f'bs={b}':>11}" for b in batch_sizes)
+    lines = ["texts/sec", header, "-" * len(header)]
+    for t in thread_counts:
+        cells = []
+        for b in batch_sizes:
+            mark = "*" if (t, b) == (best.threads, best.batch_size) else " "
+            cells.append(f"{by_key.get((t, b), 0.0):>10.1f}{mark}")
+        lines.append(f"{t:>8}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def sample_agenda_texts(generator, size: int, seed: int = 42) -> List[str]:
+    """
+    Real documents as the generator would embed them, sampled from the source DB
+    """
+    sessions = generator.fetch_simple_sessions() or []
+    random.Random(seed).shuffle(sessions)
+    sessions = generator.clean_session_data(sessions[:size])
+    sessions = generator.fetch_speakers_for_sessions(sessions)
+    sessions = generator.fetch_tags_for_sessions(sessions)
+    return [generator.generate_agenda_content(s) for s in sessions]
+
+
+def default_thread_counts() -> List[int]:
+    cpus = effective_cpus()
+    counts, n = [], 1
+    while n < cpus:
+        counts.append(n)
+        n *= 2
+    return counts + [cpus]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate encode batch size and torch threads")
+    parser.add_argument("--sample", type=int, default=256, help="Agenda documents to encode per grid point")
+    parser.add_argument("--batch-sizes", default="8,16,32,64,128")
+    parser.add_argument("--threads", default=",".join(map(str, default_thread_counts())))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dry-run", action="store_true", help="Print the curve without saving the profile")
+    args = parser.parse_args(argv)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    from .generate_embeddings import SimpleAgendaEmbeddingsGenerator
+
+    generator = SimpleAgendaEmbeddingsGenerator()
+    texts = sample_agenda_texts(generator, args.sample, args.seed)
+    if not texts:
+        logger.error("No sessions available in the source database to calibrate with")
+        return 1
+
+    model_name = generator.embedding_model_name
+    model = SentenceTransformer(model_name, device=os.getenv("EMBEDDING_DEVICE", "cpu"))
+    signature = cpu_signature()
+    logger.info(f"Calibrating {model_name} on {signature} with {len(texts)} documents")
+
+    def encode(batch: List[str], batch_size: int):
+        model.encode(batch, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+
+    points = calibrate(encode, texts, parse_int_list(args.batch_sizes), parse_int_list(args.threads),
+                       torch.set_num_threads)
+    best = best_point(points)
+    print(format_curve(points))
+
+    profile = TuneProfile(model_name, signature, best.batch_size, best.threads,
+                          best.texts_per_sec, len(texts), points=points)
+    if not args.dry_run:
+        path = save_profile(os.getenv("CACHE_DIR", "/cache/.cache"), profile)
+        logger.info(f"Saved profile to {path}")
+    logger.info(f"Best: batch_size={best.batch_size}, threads={best.threads} ({best.texts_per_sec:.1f} texts/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+ANN recall/latency tuning harness: HNSW vs exact search
+
+Takes the stored agenda vectors plus a query set (the smoke-test queries of
+the generator and synthetic queries sampled from session texts), computes the
+exact top-k with NumPy as ground truth, then sweeps HNSW build parameters
+(``m``, ``ef_construction``) and ``hnsw.ef_search`` over a scratch copy of the
+vectors in Postgres. The output is a recall@k / p50 / p99 latency / index
+size table to pick parameters from data::
+
+    python -m src.benchmark_ann --k 10 --m 8,16,32 --ef-construction 32,64,128 \\
+        --ef-search 10,20,40,80,160 --synthetic 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import psycopg
+from psycopg import sql
+
+from .snapshot import normalize_rows
+from .utils import (
+    dest_conninfo, env_conninfo, format_bytes, get_logger, parse_int_list, top_k, vector_literal,
+)
+from .vector_db import load_collection_vectors
+
+SCRATCH_TABLE = "ann_bench_vectors"
+SCRATCH_INDEX = "ann_bench_vectors_hnsw"
+
+logger = get_logger("benchmark_ann")
+
+
+@dataclass
+class BenchmarkRow:
+    """One measured configuration"""
+    method: str
+    m: Optional[int]
+    ef_construction: Optional[int]
+    ef_search: Optional[int]
+    recall_at_k: float
+    p50_ms: float
+    p99_ms: float
+    build_seconds: float = 0.0
+    index_bytes: int = 0
+
+
+def bench_conninfo() -> Optional[Dict]:
+    """
+    Connection params of the scratch database (``BENCH_DB_*``), or ``None`` when it is
+    not configured or resolves to the destination database: the sweep drops and rebuilds
+    tables and HNSW indexes, so it never defaults to ``DB_DEST``
+    """
+    if not os.getenv("BENCH_DB_HOST"):
+        return None
+    conninfo, dest = env_conninfo("BENCH_DB"), dest_conninfo()
+    if all(str(conninfo[key]) == str(dest[key]) for key in ("host", "port", "dbname")):
+        return None
+    return conninfo
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Ground-truth row indices of the ``k`` most similar vectors per query (cosine)
+    """
+    return top_k(normalize_rows(queries) @ normalize_rows(vectors).T, k)
+
+
+def recall(found: Sequence[Sequence[int]], truth: Sequence[Sequence[int]]) -> float:
+    """
+    Mean fraction of the true top-k ids present in each result list
+    """
+    hits = [len(set(f) & set(t)) / len(t) for f, t in zip(found, truth) if len(t)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def synthetic_queries(metadatas: List[Dict], documents: List[str], count: int, seed: int = 42) -> List[str]:
+    """
+    Sample realistic queries from stored sessions: names, tag/period phrases and text windows
+    """
+    if not metadatas:
+        return []
+    rng = np.random.default_rng(seed)
+    queries = []
+    for i in rng.integers(0, len(metadatas), size=count):
+        metadata, document = metadatas[i], documents[i]
+        kind = len(queries) % 3
+        if kind == 0:
+            queries.append(metadata.get("session_name", ""))
+        elif kind == 1:
+            tag = (metadata.get("session_tags") or "General").split(",")[0].strip()
+            queries.append(f"charlas de {tag} por la {metadata.get('period_of_day', 'mañana')}")
+        else:
+            words = document.split()
+            start = int(rng.integers(0, max(1, len(words) - 12)))
+            queries.append(" ".join(words[start:start + 12]))
+    return [q for q in queries if q]
+
+
+def load_scratch_table(conn: psycopg.Connection, ids: np.ndarray, vectors: np.ndarray):
+    """
+    Copy the vectors into an unlogged scratch table for the sweep
+    """
+    dimension = vectors.shape[1]
+    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(SCRATCH_TABLE)))
+    conn.execute(
+        sql.SQL("CREATE UNLOGGED TABLE {} (id BIGINT PRIMARY KEY, embedding vector({}))").format(
+            sql.Identifier(SCRATCH_TABLE), sql.Literal(dimension)
+        )
+    )
+    with conn.cursor() as cur:
+        with cur.copy(sql.SQL("COPY {} (id, embedding) FROM STDIN").format(sql.Identifier(SCRATCH_TABLE))) as copy:
+            for session_id, vector in zip(ids, vectors):
+                copy.write_row((int(session_id), vector_literal(vector)))
+    conn.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(SCRATCH_TABLE)))
+    conn.commit()
+
+
+def time_queries(conn: psycopg.Connection, queries: np.ndarray, k: int):
+    """
+    Run every query once; return ``(result id lists, latencies in ms)``
+    """
+    statement = sql.SQL("SELECT id FROM {} ORDER BY embedding <=> %s::vector LIMIT %s").format(
+        sql.Identifier(SCRATCH_TABLE)
+    )
+    results, latencies = [], []
+    with conn.cursor() as cur:
+        for query in queries:
+            literal = vector_literal(query)
+            started = time.perf_counter()
+            cur.execute(statement, (literal, k))
+            rows = cur.fetchall()
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append([row[0] for row in rows])
+    return results, np.asarray(latencies)
+
+
+def run_benchmark(conn: psycopg.Connection, ids: np.ndarray, vectors: np.ndarray, queries: np.ndarray,
+                  k: int, m_values: List[int], ef_construction_values: List[int],
+                  ef_search_values: List[int], maintenance_work_mem: str = "1GB") -> List[BenchmarkRow]:
+    """
+    Measure NumPy brute force, exact SQL and every HNSW configuration against ground truth
+    """
+    truth_rows = exact_top_k(vectors, queries, k)
+    truth = [[int(ids[r]) for r in row] for row in truth_rows]
+    rows: List[BenchmarkRow] = []
+
+    latencies = []
+    normalized = normalize_rows(vectors)
+    for query in normalize_rows(queries):
+        started = time.perf_counter()
+        scores = normalized @ query
+        top_k(scores, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    rows.append(BenchmarkRow("numpy-exact", None, None, None, 1.0,
+                             float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)),
+                             index_bytes=normalized.nbytes))
+
+    load_scratch_table(conn, ids, vectors)
+    found, latencies = time_queries(conn, queries, k)
+    rows.append(BenchmarkRow("pg-exact", None, None, None, recall(found, truth),
+                             float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))))
+
+    conn.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+    for m in m_values:
+        for ef_construction in ef_construction_values:
+            conn.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(SCRATCH_INDEX)))
+            started = time.perf_counter()
+            conn.execute(
+                sql.SQL("CREATE INDEX {} ON {} USING hnsw (embedding vector_cosine_ops) "
+                        "WITH (m = {}, ef_construction = {})").format(
+                    sql.Identifier(SCRATCH_INDEX), sql.Identifier(SCRATCH_TABLE),
+                    sql.Literal(m), sql.Literal(ef_construction),
+                )
+            )
+            conn.commit()
+            build_seconds = time.perf_counter() - started
+            index_bytes = conn.execute(
+                "SELECT pg_relation_size(to_regclass(%s))", (SCRATCH_INDEX,)
+            ).fetchone()[0]
+
+            # Small catalogs make the planner prefer a seq scan; force the index
+            conn.execute("SET enable_seqscan = off")
+            for ef_search in ef_search_values:
+                conn.execute("SELECT set_config('hnsw.ef_search', %s, false)", (str(ef_search),))
+                found, latencies = time_queries(conn, queries, k)
+                rows.append(BenchmarkRow(
+                    "hnsw", m, ef_construction, ef_search, recall(found, truth),
+                    float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)),
+                    build_seconds, int(index_bytes),
+                ))
+            conn.execute("RESET enable_seqscan")
+
+    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(SCRATCH_TABLE)))
+    conn.commit()
+    return rows
+
+
+def format_table(rows: List[BenchmarkRow], k: int) -> str:
+    header = f"{'method':<12}{'m':>5}{'ef_c':>7}{'ef_s':>7}{f'recall@{k}':>12}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}{'index':>12}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(
+            f"{r.method:<12}{r.m or '-':>5}{r.ef_construction or '-':>7}{r.ef_search or '-':>7}"
+            f"{r.recall_at_k:>12.4f}{r.p50_ms:>10.3f}{r.p99_ms:>10.3f}{r.build_seconds:>10.2f}"
+            f"{format_bytes(r.index_bytes) if r.index_bytes else '-':>12}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="HNSW vs exact search recall/latency benchmark")
+    parser.add_argument("--collection", default=os.getenv("PGVECTOR_COLLECTION_NAME", "agenda_sessions"))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--m", default="8,16,32")
+    parser.add_argument("--ef-construction", default="32,64,128")
+    parser.add_argument("--ef-search", default="10,20,40,80,160")
+    parser.add_argument("--synthetic", type=int, default=200, help="Synthetic queries sampled from sessions")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the rows as JSON to this file")
+    args = parser.parse_args(argv)
+
+    bench = bench_conninfo()
+    if bench is None:
+        logger.error("Set BENCH_DB_* to a scratch database other than DB_DEST_*: the sweep drops and builds tables")
+        return 2
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from .generate_embeddings import AGENDA_TEST_QUERIES
+
+    # Vectors come from the generator's database; the sweep runs in the scratch BENCH_DB_*
+    with psycopg.connect(**dest_conninfo()) as conn:
+        ids, vectors, metadatas, documents = load_collection_vectors(conn, args.collection)
+    if not len(ids):
+        logger.error(f"Collection '{args.collection}' is empty")
+        return 1
+
+    query_texts = list(AGENDA_TEST_QUERIES) + synthetic_queries(metadatas, documents, args.synthetic, args.seed)
+    model = HuggingFaceEmbeddings(
+        model_name=os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/multi-qa-mpnet-base-dot-v1"),
+        encode_kwargs={"normalize_embeddings": True},
+    )
+    queries = np.asarray(model.embed_documents(query_texts), dtype=np.float32)
+    logger.info(f"{len(ids)} vectors, {len(query_texts)} queries, k={args.k}")
+
+    with psycopg.connect(**bench) as conn:
+        rows = run_benchmark(
+            conn, ids, vectors, queries, args.k,
+            parse_int_list(args.m), parse_int_list(args.ef_construction), parse_int_list(args.ef_search),
+            maintenance_work_mem=os.getenv("HNSW_MAINTENANCE_WORK_MEM", "1GB"),
+        )
+
+    print(format_table(rows, args.k))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in rows], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
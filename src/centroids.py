@@ -0,0 +1,300 @@
+"""
+Track and tag centroids for two-stage (coarse-routed) search
+
+Sessions already come in natural clusters: their ``track_name`` and their
+tags. At the end of each run the generator stores, per cluster, the
+normalized mean of its members' embeddings and the member session ids in
+``agenda_centroids``. Searching then scores the query against the few dozen
+centroids first and runs the exact search only over the members of the
+best ``n_probe`` clusters. The same centroids answer "related tracks/tags"
+instantly (centroid-to-centroid cosine).
+
+``python -m src.centroids bench`` compares routed and flat exact search
+(recall@k, p50/p99 latency, candidates scanned) on the stored vectors and on
+synthetically grown catalogs (each session replicated with noise).
+"""
+
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import psycopg
+
+from .snapshot import normalize_rows
+from .utils import PostgresStore, dest_conninfo, get_logger, parse_int_list, top_k, vector_literal
+
+CENTROIDS_DDL = """
+CREATE TABLE IF NOT EXISTS agenda_centroids (
+    collection_name VARCHAR(255) NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    centroid vector NOT NULL,
+    member_ids INTEGER[] NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (collection_name, kind, name)
+);
+"""
+
+TRACK = "track"
+TAG = "tag"
+
+logger = get_logger("centroids")
+
+
+@dataclass
+class Cluster:
+    """One track or tag: unit-norm centroid and member session ids"""
+    kind: str
+    name: str
+    centroid: np.ndarray
+    member_ids: List[int]
+
+
+def session_clusters(metadata: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    ``(kind, name)`` of every cluster a session belongs to
+    """
+    clusters = []
+    if metadata.get("track_name"):
+        clusters.append((TRACK, str(metadata["track_name"])))
+    tags = metadata.get("tag_list")
+    if tags is None:
+        tags = [t.strip() for t in str(metadata.get("session_tags") or "").split(",")]
+    clusters.extend((TAG, str(tag)) for tag in tags if tag and tag != "General")
+    return clusters
+
+
+def compute_centroids(ids: Sequence[int], vectors: np.ndarray,
+                      metadatas: Sequence[Dict[str, Any]]) -> List[Cluster]:
+    """
+    Normalized mean of the (normalized) member vectors of every track and tag
+    """
+    if not len(ids):
+        return []
+    normalized = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    rows: Dict[Tuple[str, str], List[int]] = {}
+    for row, metadata in enumerate(metadatas):
+        for key in session_clusters(metadata):
+            rows.setdefault(key, []).append(row)
+    clusters = []
+    for (kind, name), members in sorted(rows.items()):
+        centroid = normalize_rows(normalized[members].mean(axis=0, keepdims=True))[0]
+        clusters.append(Cluster(kind, name, centroid, [int(ids[r]) for r in members]))
+    return clusters
+
+
+class CentroidIndex:
+    """
+    Coarse-routed exact search over the session vectors
+    """
+
+    def __init__(self, clusters: List[Cluster], ids: Sequence[int], vectors: np.ndarray):
+        self.clusters = clusters
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        self.centroids = np.vstack([c.centroid for c in clusters]) if clusters else np.empty((0, 0), np.float32)
+        row_by_id = {int(session_id): row for row, session_id in enumerate(self.ids)}
+        self.members = [np.asarray([row_by_id[i] for i in c.member_ids if i in row_by_id], dtype=np.int64)
+                        for c in clusters]
+        # Sessions outside every cluster are always scanned so routing never hides them
+        clustered = np.concatenate(self.members) if self.members else np.empty(0, np.int64)
+        self.unclustered = np.setdiff1d(np.arange(len(self.ids)), clustered)
+
+    def route(self, query: np.ndarray, n_probe: int) -> List[int]:
+        """
+        Indices of the ``n_probe`` clusters closest to the query
+        """
+        if not self.clusters:
+            return []
+        return top_k(self.centroids @ query, n_probe).tolist()
+
+    def candidates(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        probed = [self.members[c] for c in self.route(query, n_probe)]
+        return np.unique(np.concatenate(probed + [self.unclustered]))
+
+    def search(self, query_embedding: Sequence[float], k: int = 5, n_probe: int = 3) -> List[Tuple[int, float]]:
+        """
+        ``(session_id, score)`` of the top-k among the best clusters' members
+        """
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32)[None, :])[0]
+        rows = self.candidates(query, n_probe)
+        if not len(rows):
+            return []
+        scores = self.vectors[rows] @ query
+        return [(int(self.ids[rows[i]]), float(scores[i])) for i in top_k(scores, k)]
+
+    def related(self, kind: str, name: str, k: int = 5, of_kind: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Clusters (default: of the same kind) whose centroids are closest to ``kind``/``name``
+        """
+        index = next((i for i, c in enumerate(self.clusters) if c.kind == kind and c.name == name), None)
+        if index is None:
+            return []
+        scores = self.centroids @ self.centroids[index]
+        of_kind = of_kind or kind
+        ranked = [(self.clusters[i].name, float(scores[i])) for i in np.argsort(-scores)
+                  if i != index and self.clusters[i].kind == of_kind]
+        return ranked[:k]
+
+
+class CentroidStore(PostgresStore):
+    """
+    Persist centroids and member ids next to the collection
+    """
+    DDL = CENTROIDS_DDL
+
+    def save(self, collection_name: str, clusters: Iterable[Cluster]) -> int:
+        rows = [(collection_name, c.kind, c.name, vector_literal(c.centroid), c.member_ids) for c in clusters]
+        self.ensure_schema()
+        with self._connect() as conn:
+            # Replace the whole set: tracks or tags that disappeared must not keep routing queries
+            conn.execute("DELETE FROM agenda_centroids WHERE collection_name = %s", (collection_name,))
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO agenda_centroids (collection_name, kind, name, centroid, member_ids) "
+                    "VALUES (%s, %s, %s, %s::vector, %s)",
+                    rows,
+                )
+        self.logger.info(f"Stored {len(rows)} centroid(s) for collection '{collection_name}'")
+        return len(rows)
+
+    def load(self, collection_name: str) -> List[Cluster]:
+        with self._connect() as conn:
+            if not self._table_exists(conn, "agenda_centroids"):
+                return []
+            rows = conn.execute(
+                "SELECT kind, name, centroid::real[], member_ids FROM agenda_centroids "
+                "WHERE collection_name = %s ORDER BY kind, name",
+                (collection_name,),
+            ).fetchall()
+        return [Cluster(r[0], r[1], np.asarray(r[2], dtype=np.float32), list(r[3])) for r in rows]
+
+    def refresh(self, conn: psycopg.Connection, collection_name: str) -> List[Cluster]:
+        """
+        Recompute the centroids from the stored collection and save them
+        """
+        from .vector_db import load_collection_vectors
+
+        ids, vectors, metadatas, _ = load_collection_vectors(conn, collection_name)
+        clusters = compute_centroids(ids, vectors, metadatas)
+        self.save(collection_name, clusters)
+        return clusters
+
+
+def grow_catalog(ids: np.ndarray, vectors: np.ndarray, metadatas: List[Dict[str, Any]], scale: int,
+                 noise: float = 0.1, seed: int = 42) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+    """
+    Replicate every session ``scale`` times with Gaussian noise, keeping its track and tags
+    """
+    if scale <= 1:
+        return np.asarray(ids), np.asarray(vectors, dtype=np.float32), list(metadatas)
+    rng = np.random.default_rng(seed)
+    base = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    copies = np.repeat(base, scale, axis=0)
+    # Per-coordinate sigma noise/sqrt(dim): the noise vector has norm ~noise
+    copies += rng.standard_normal(copies.shape).astype(np.float32) * (noise / np.sqrt(base.shape[1]))
+    grown_ids = np.arange(1, len(copies) + 1, dtype=np.int64)
+    return grown_ids, normalize_rows(copies), [m for m in metadatas for _ in range(scale)]
+
+
+def bench_routing(ids: np.ndarray, vectors: np.ndarray, metadatas: List[Dict[str, Any]], queries: np.ndarray,
+                  k: int, n_probes: Sequence[int]) -> List[Dict[str, Any]]:
+    """
+    Flat exact vs centroid-routed exact search: recall@k, latency and candidates scanned
+    """
+    from .benchmark_ann import exact_top_k, recall
+
+    index = CentroidIndex(compute_centroids(ids, vectors, metadatas), ids, vectors)
+    truth = [[int(ids[r]) for r in row] for row in exact_top_k(vectors, queries, k)]
+    queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        scores = index.vectors @ query
+        top_k(scores, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    rows = [{"method": "flat", "n_probe": None, "recall": 1.0, "scanned": len(ids),
+             "p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99))}]
+
+    for n_probe in n_probes:
+        found, latencies, scanned = [], [], []
+        for query in queries:
+            started = time.perf_counter()
+            hits = index.search(query, k, n_probe)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found.append([session_id for session_id, _ in hits])
+            scanned.append(len(index.candidates(query, n_probe)))
+        rows.append({"method": "routed", "n_probe": n_probe, "recall": recall(found, truth),
+                     "scanned": float(np.mean(scanned)),
+                     "p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99))})
+    return rows
+
+
+def format_rows(rows: List[Dict[str, Any]], n: int, clusters: int, k: int) -> str:
+    header = f"{'catalog':>9}{'clusters':>10}{'method':>8}{'n_probe':>9}{f'recall@{k}':>11}{'scanned':>10}{'p50 ms':>9}{'p99 ms':>9}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        lines.append(f"{n:>9}{clusters:>10}{r['method']:>8}{r['n_probe'] or '-':>9}{r['recall']:>11.4f}"
+                     f"{r['scanned']:>10.0f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Track/tag centroids and routed search")
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh = sub.add_parser("refresh", help="Recompute and store the centroids of the collection")
+    related = sub.add_parser("related", help="Tracks/tags closest to a track or tag")
+    related.add_argument("kind", choices=(TRACK, TAG))
+    related.add_argument("name")
+    related.add_argument("--k", type=int, default=5)
+    bench = sub.add_parser("bench", help="Routed vs flat search as the catalog grows")
+    bench.add_argument("--k", type=int, default=10)
+    bench.add_argument("--n-probe", default="1,2,4,8")
+    bench.add_argument("--scales", default="1,10,100", help="Catalog sizes as multiples of the stored sessions")
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--noise", type=float, default=0.1)
+    bench.add_argument("--seed", type=int, default=42)
+    for sub_parser in (refresh, related, bench):
+        sub_parser.add_argument("--collection", default=os.getenv("PGVECTOR_COLLECTION_NAME", "agenda_sessions"))
+    args = parser.parse_args(argv)
+
+    from .vector_db import load_collection_vectors
+
+    conninfo = dest_conninfo()
+    store = CentroidStore(conninfo)
+    with psycopg.connect(**conninfo) as conn:
+        if args.command == "refresh":
+            store.refresh(conn, args.collection)
+            return 0
+        ids, vectors, metadatas, _ = load_collection_vectors(conn, args.collection)
+    if not len(ids):
+        logger.error(f"Collection '{args.collection}' is empty")
+        return 1
+
+    if args.command == "related":
+        index = CentroidIndex(store.load(args.collection) or compute_centroids(ids, vectors, metadatas), ids, vectors)
+        for name, score in index.related(args.kind, args.name, args.k):
+            print(f"{score:.4f}  {name}")
+        return 0
+
+    rng = np.random.default_rng(args.seed)
+    for scale in parse_int_list(args.scales):
+        grown_ids, grown, grown_meta = grow_catalog(ids, vectors, metadatas, scale, args.noise, args.seed)
+        # Held-out style queries: perturbed copies of random stored sessions
+        picks = rng.integers(0, len(grown), size=args.queries)
+        queries = grown[picks] + rng.standard_normal((args.queries, grown.shape[1])).astype(np.float32) * (
+            args.noise / np.sqrt(grown.shape[1]))
+        rows = bench_routing(grown_ids, grown, grown_meta, queries, args.k, parse_int_list(args.n_probe))
+        clusters = len({key for m in grown_meta for key in session_clusters(m)})
+        print(format_rows(rows, len(grown_ids), clusters, args.k))
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+Run checkpoints for resumable embedding generation
+
+Each run commits its documents in batches ordered by session id and records
+the last committed id in ``embeddings_run_checkpoints``. A restarted Job
+finds the unfinished run with the same collection and model fingerprint (and
+the same run id, when one is configured) and resumes after that id instead of
+starting over.
+"""
+
+import hashlib
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from .utils import PostgresStore, safe_json_dumps
+
+CHECKPOINTS_DDL = """
+CREATE TABLE IF NOT EXISTS embeddings_run_checkpoints (
+    run_id VARCHAR(64) PRIMARY KEY,
+    collection_name VARCHAR(255) NOT NULL,
+    model_fingerprint VARCHAR(64) NOT NULL,
+    last_session_id INTEGER,
+    sessions_committed INTEGER DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'running',
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_run_checkpoints_lookup
+ON embeddings_run_checkpoints(collection_name, model_fingerprint, status);
+"""
+
+
+def model_fingerprint(model_name: str, dimension: int, normalize: bool) -> str:
+    """
+    Stable fingerprint of everything that makes stored vectors comparable
+    """
+    raw = f"{model_name}|{dimension}|{normalize}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class Checkpoint:
+    """State of one generation run"""
+    run_id: str
+    collection_name: str
+    model_fingerprint: str
+    last_session_id: Optional[int] = None
+    sessions_committed: int = 0
+    resumed: bool = False
+    skipped_sessions: int = 0
+
+
+class CheckpointStore(PostgresStore):
+    """
+    Persist run checkpoints in the vector database
+    """
+    DDL = CHECKPOINTS_DDL
+
+    def __init__(self, conninfo: Dict[str, Any], max_age_hours: float = 0):
+        super().__init__(conninfo)
+        self.max_age_hours = max_age_hours
+
+    def begin(self, collection_name: str, fingerprint: str, run_id: Optional[str] = None) -> Checkpoint:
+        """
+        Resume an unfinished run for this collection/fingerprint, or start a new one.
+
+        With an explicit ``run_id`` only that run can be resumed: any other
+        unfinished run of the collection belongs to an earlier deployment (its
+        rows carry another ``generation_run`` marker) and is marked
+        ``abandoned``. Without one the latest unfinished run is resumed, unless
+        it has not advanced for ``max_age_hours`` (0 = no limit): such a run is
+        stale and is abandoned instead. Unfinished runs with a different
+        fingerprint can never be resumed and are abandoned as well.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE embeddings_run_checkpoints SET status = 'abandoned', updated_at = CURRENT_TIMESTAMP "
+                "WHERE collection_name = %s AND status = 'running' AND model_fingerprint <> %s",
+                (collection_name, fingerprint),
+            )
+            if run_id:
+                conn.execute(
+                    "UPDATE embeddings_run_checkpoints SET status = 'abandoned', updated_at = CURRENT_TIMESTAMP "
+                    "WHERE collection_name = %s AND status = 'running' AND run_id <> %s",
+                    (collection_name, run_id),
+                )
+                row = conn.execute(
+                    "SELECT run_id, last_session_id, sessions_committed FROM embeddings_run_checkpoints "
+                    "WHERE run_id = %s AND collection_name = %s AND model_fingerprint = %s AND status = 'running'",
+                    (run_id, collection_name, fingerprint),
+                ).fetchone()
+            else:
+                if self.max_age_hours > 0:
+                    cutoff = datetime.now(timezone.utc) - timedelta(hours=self.max_age_hours)
+                    stale = conn.execute(
+                        "UPDATE embeddings_run_checkpoints SET status = 'abandoned', updated_at = CURRENT_TIMESTAMP "
+                        "WHERE collection_name = %s AND status = 'running' AND updated_at < %s",
+                        (collection_name, cutoff),
+                    ).rowcount
+                    if stale:
+                        self.logger.info(
+                            f"Abandoned {stale} run(s) idle for more than {self.max_age_hours:g}h"
+                        )
+                row = conn.execute(
+                    "SELECT run_id, last_session_id, sessions_committed FROM embeddings_run_checkpoints "
+                    "WHERE collection_name = %s AND model_fingerprint = %s AND status = 'running' "
+                    "ORDER BY updated_at DESC LIMIT 1",
+                    (collection_name, fingerprint),
+                ).fetchone()
+
+            if row:
+                checkpoint = Checkpoint(
+                    run_id=row[0],
+                    collection_name=collection_name,
+                    model_fingerprint=fingerprint,
+                    last_session_id=row[1],
+                    sessions_committed=row[2] or 0,
+                    resumed=True,
+                    skipped_sessions=row[2] or 0,
+                )
+                self.logger.info(
+                    f"Resuming run {checkpoint.run_id} after session {checkpoint.last_session_id} "
+                    f"({checkpoint.sessions_committed} sessions already committed)"
+                )
+                return checkpoint
+
+            checkpoint = Checkpoint(
+                run_id=run_id or uuid.uuid4().hex[:12],
+                collection_name=collection_name,
+                model_fingerprint=fingerprint,
+            )
+            conn.execute(
+                "INSERT INTO embeddings_run_checkpoints (run_id, collection_name, model_fingerprint) "
+                "VALUES (%s, %s, %s) "
+                "ON CONFLICT (run_id) DO UPDATE SET status = 'running', last_session_id = NULL, "
+                "sessions_committed = 0, started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP",
+                (checkpoint.run_id, collection_name, fingerprint),
+            )
+            self.logger.info(f"Starting run {checkpoint.run_id}")
+            return checkpoint
+
+    def commit(self, checkpoint: Checkpoint, last_session_id: int, count: int):
+        """
+        Record a batch as durably written
+        """
+        checkpoint.last_session_id = last_session_id
+        checkpoint.sessions_committed += count
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE embeddings_run_checkpoints "
+                "SET last_session_id = %s, sessions_committed = %s, updated_at = CURRENT_TIMESTAMP "
+                "WHERE run_id = %s",
+                (last_session_id, checkpoint.sessions_committed, checkpoint.run_id),
+            )
+
+    def complete(self, checkpoint: Checkpoint, processed: int, elapsed_seconds: float,
+                 extra: Optional[Dict[str, Any]] = None, write_sync_log: bool = True):
+        """
+        Mark the run as completed and (optionally) write its row to ``embeddings_sync_log``
+        """
+        metadata = {
+            "run_id": checkpoint.run_id,
+            "model_fingerprint": checkpoint.model_fingerprint,
+            "resumed": checkpoint.resumed,
+            "skipped_sessions": checkpoint.skipped_sessions,
+        }
+        metadata.update(extra or {})
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE embeddings_run_checkpoints SET status = 'completed', updated_at = CURRENT_TIMESTAMP "
+                "WHERE run_id = %s",
+                (checkpoint.run_id,),
+            )
+            if not write_sync_log:
+                return
+            conn.execute(
+                "INSERT INTO embeddings_sync_log "
+                "(table_name, records_processed, records_inserted, status, execution_time_seconds, metadata) "
+                "VALUES (%s, %s, %s, 'completed', %s, %s::jsonb)",
+                (checkpoint.collection_name, processed + checkpoint.skipped_sessions, processed,
+                 round(elapsed_seconds, 2), safe_json_dumps(metadata)),
+            )
@@ -0,0 +1,176 @@
+"""
+Container-aware CPU thread management
+
+torch and the HF tokenizers size their thread pools from the host's core
+count, which oversubscribes a pod limited by a cgroup CPU quota and gets it
+throttled. This module derives the effective CPU count from the quota (cgroup
+v2 ``cpu.max`` or v1 ``cpu.cfs_quota_us``/``cpu.cfs_period_us``) and the
+affinity mask, splits it across processes and helper threads, applies it to
+torch/tokenizers and reports ``cpu.stat`` throttling at the end of a run.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from .utils import get_logger
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V2_CPU_STAT = "/sys/fs/cgroup/cpu.stat"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+CGROUP_V1_CPU_STAT = "/sys/fs/cgroup/cpu/cpu.stat"
+
+logger = get_logger("cpu")
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """
+    CPU quota in cores from cgroup v2 or v1, or ``None`` when unlimited
+    """
+    raw = _read(CGROUP_V2_CPU_MAX)
+    if raw:
+        quota, _, period = raw.partition(" ")
+        if quota == "max":
+            return None
+        return int(quota) / int(period or 100000)
+
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def affinity_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def effective_cpus() -> int:
+    """
+    Whole CPUs this process can actually use: the affinity mask capped by the quota.
+
+    A fractional quota is rounded down (1.5 cores -> 1 thread) so the plan never exceeds it.
+    """
+    cpus = affinity_cpus()
+    quota = cgroup_cpu_quota()
+    if quota:
+        cpus = min(cpus, math.floor(quota))
+    return max(1, cpus)
+
+
+def read_cpu_stat() -> Dict[str, int]:
+    """
+    ``nr_periods``, ``nr_throttled`` and ``throttled_usec`` from ``cpu.stat`` (empty if unavailable)
+    """
+    raw = _read(CGROUP_V2_CPU_STAT) or _read(CGROUP_V1_CPU_STAT)
+    if not raw:
+        return {}
+    stats = {}
+    for line in raw.splitlines():
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            stats[key] = int(value)
+    # cgroup v1 reports throttled time in nanoseconds
+    if "throttled_time" in stats and "throttled_usec" not in stats:
+        stats["throttled_usec"] = stats["throttled_time"] // 1000
+    return stats
+
+
+@dataclass
+class ThreadPlan:
+    """Thread counts for one encoder process"""
+    cpus: int
+    processes: int
+    reserved: int
+    intra_op: int
+    inter_op: int
+    tokenizers_parallelism: bool
+
+
+def plan_threads(processes: int = 1, reserved: int = 0, requested: Optional[int] = None,
+                 cpus: Optional[int] = None) -> ThreadPlan:
+    """
+    Share the effective CPUs among ``processes`` encoder processes.
+
+    ``reserved`` CPUs are kept for the helper threads of each process that do not
+    run torch (``pipeline.HELPER_CPUS``, ``query_service.HELPER_CPUS``); ``requested`` (e.g. an autotune profile or ``ENCODER_THREADS``)
+    is honoured only up to the fair share.
+    """
+    cpus = cpus or effective_cpus()
+    processes = max(1, processes)
+    share = max(1, cpus // processes - reserved)
+    intra_op = min(share, requested) if requested else share
+    return ThreadPlan(
+        cpus=cpus,
+        processes=processes,
+        reserved=reserved,
+        intra_op=intra_op,
+        inter_op=1,
+        # Tokenizer threads compete with torch's; only allow them with a multi-core share
+        tokenizers_parallelism=intra_op > 1,
+    )
+
+
+def apply_thread_plan(plan: ThreadPlan):
+    """
+    Configure torch and tokenizers for ``plan`` (call before the model is loaded)
+    """
+    import torch
+
+    os.environ["TOKENIZERS_PARALLELISM"] = "true" if plan.tokenizers_parallelism else "false"
+    # Read when the tokenizers pool first starts; OMP/MKL_NUM_THREADS would be too late here
+    # (read when torch is imported), torch.set_num_threads sizes those pools instead
+    os.environ["RAYON_NUM_THREADS"] = str(plan.intra_op)
+    torch.set_num_threads(plan.intra_op)
+    try:
+        torch.set_interop_threads(plan.inter_op)
+    except RuntimeError:
+        # Only settable before the first inter-op parallel work in the process
+        pass
+    logger.info(
+        f"{plan.cpus} effective CPUs / {plan.processes} process(es), {plan.reserved} reserved for helper "
+        f"threads: torch intra-op={plan.intra_op}, "
+        f"inter-op={torch.get_num_interop_threads()}, tokenizers parallelism={plan.tokenizers_parallelism}"
+    )
+
+
+class CpuThrottleMonitor:
+    """
+    Report cgroup CPU throttling accumulated between ``start`` and ``report``
+    """
+
+    def __init__(self):
+        self.baseline: Dict[str, int] = {}
+
+    def start(self):
+        self.baseline = read_cpu_stat()
+
+    def delta(self) -> Dict[str, int]:
+        current = read_cpu_stat()
+        return {k: v - self.baseline.get(k, 0) for k, v in current.items()}
+
+    def report(self):
+        delta = self.delta()
+        if not delta:
+            logger.info("cpu.stat not available; throttling not measured")
+            return
+        periods = delta.get("nr_periods", 0)
+        throttled = delta.get("nr_throttled", 0)
+        ratio = throttled / periods if periods else 0.0
+        log = logger.warning if ratio > 0.1 else logger.info
+        log(
+            f"CPU throttling: {throttled}/{periods} periods ({ratio:.1%}), "
+            f"{delta.get('throttled_usec', 0) / 1e6:.1f}s throttled, quota {cgroup_cpu_quota() or 'none'}"
+        )
@@ -0,0 +1,318 @@
+"""
+Event-level attributes stored once instead of on every document
+
+Event constants (name, location, venue, language, price, registration,
+modality, community, source tag) used to be repeated in each document's
+JSONB metadata and as fixed sentences in each document's text. They now live
+in ``agenda_events`` (one row per event and collection) and documents only
+carry ``event_id``. The ``agenda_documents`` view merges them back at query
+time for consumers that expect the full metadata.
+
+``python -m src.events report`` measures what the normalization saves on the
+stored collection: metadata bytes per row, GIN index size and tokens per
+document, legacy vs normalized.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import psycopg
+
+from .utils import PostgresStore, dest_conninfo, format_bytes, get_logger, safe_json_dumps
+
+EVENTS_DDL = """
+CREATE TABLE IF NOT EXISTS agenda_events (
+    collection_name VARCHAR(255) NOT NULL,
+    event_id INTEGER NOT NULL,
+    event_name VARCHAR(255),
+    location VARCHAR(255),
+    venue_name VARCHAR(255),
+    venue_address TEXT,
+    attributes JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (collection_name, event_id)
+);
+"""
+
+# A document's cmetadata with its agenda_events row ``ev`` merged back (legacy metadata shape)
+MERGED_METADATA_SQL = """e.cmetadata
+        || jsonb_build_object(
+            'event_name', ev.event_name,
+            'location', ev.location,
+            'venue_name', ev.venue_name
+        )
+        || COALESCE(ev.attributes, '{}'::jsonb)"""
+
+# Documents with their event attributes merged back
+DOCUMENTS_VIEW_DDL = f"""
+CREATE OR REPLACE VIEW agenda_documents AS
+SELECT
+    e.id,
+    c.name AS collection_name,
+    e.document,
+    e.embedding,
+    {MERGED_METADATA_SQL} AS cmetadata
+FROM langchain_pg_embedding e
+JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+LEFT JOIN agenda_events ev
+    ON ev.collection_name = c.name AND ev.event_id = (e.cmetadata->>'event_id')::int;
+"""
+
+logger = get_logger("events")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() == "true"
+
+
+def event_source(event_name: Optional[str]) -> Optional[str]:
+    """
+    Default source tag of an event: its name as a slug (``KCD Antigua 2025`` -> ``kcd_antigua_2025_agenda``)
+    """
+    slug = re.sub(r"\W+", "_", (event_name or "").lower()).strip("_")
+    return f"{slug}_agenda" if slug else None
+
+
+@dataclass
+class EventHeader:
+    """Attributes shared by every session of an event"""
+    # None: derived from each event's name (source) or left out (community)
+    source: Optional[str] = None
+    language: str = "Español"
+    is_free: bool = True
+    requires_registration: bool = True
+    is_online: bool = False
+    community: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "EventHeader":
+        return cls(
+            source=os.getenv("EVENT_SOURCE") or None,
+            language=os.getenv("EVENT_LANGUAGE", cls.language),
+            is_free=_env_bool("EVENT_IS_FREE", cls.is_free),
+            requires_registration=_env_bool("EVENT_REQUIRES_REGISTRATION", cls.requires_registration),
+            is_online=_env_bool("EVENT_IS_ONLINE", cls.is_online),
+            community=os.getenv("EVENT_COMMUNITY") or None,
+        )
+
+    def attributes(self, event: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Metadata keys as they appeared on every legacy document, for one event's row
+        """
+        attributes = {
+            "source": self.source or event_source((event or {}).get("event_name")),
+            "language": self.language,
+            "is_free": self.is_free,
+            "requires_registration": self.requires_registration,
+            "is_online": self.is_online,
+        }
+        if self.community:
+            attributes["community"] = self.community
+        return attributes
+
+    def sentences(self) -> List[str]:
+        """
+        Event header sentences (the fixed text formerly appended to every document)
+        """
+        if self.is_free:
+            registration = "Gratuito con inscripción previa" if self.requires_registration else "Gratuito"
+        else:
+            registration = "Con inscripción previa" if self.requires_registration else "De pago"
+        return [
+            "DISPONIBLE PARA AGENDA PERSONALIZADA: Sí",
+            "SIN CONFLICTOS TEMPORALES: Verificar con otras sesiones seleccionadas",
+            f"IDIOMA: {self.language}",
+            f"MODALIDAD: {'En línea' if self.is_online else 'Presencial'}",
+            f"REGISTRO: {registration}",
+        ] + ([f"COMUNIDAD: {self.community}"] if self.community else [])
+
+
+def event_record(session: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Event columns of a session row (as mapped by the generator)
+    """
+    return {
+        "event_id": session.get("event_id"),
+        "event_name": session.get("event_name"),
+        "location": session.get("location"),
+        "venue_name": session.get("venue_name"),
+        "venue_address": session.get("venue_address"),
+    }
+
+
+def merge_event_metadata(metadata: Dict[str, Any], events: Dict[int, Dict[str, Any]],
+                         header: EventHeader) -> Dict[str, Any]:
+    """
+    Rebuild the legacy per-document metadata from a normalized document (in Python)
+    """
+    event = events.get(metadata.get("event_id"), {})
+    merged = dict(metadata)
+    merged.update({k: event.get(k) for k in ("event_name", "location", "venue_name")})
+    merged.update(header.attributes(event))
+    return merged
+
+
+class EventStore(PostgresStore):
+    """
+    Persist event-level attributes next to the collection in the vector database
+    """
+    DDL = EVENTS_DDL
+
+    def _create_schema(self, conn: psycopg.Connection):
+        super()._create_schema(conn)
+        # The view reads the PGVector tables, which partitioned storage never creates
+        if self._table_exists(conn, "langchain_pg_embedding"):
+            conn.execute(DOCUMENTS_VIEW_DDL)
+
+    def upsert(self, collection_name: str, events: Iterable[Dict[str, Any]], header: EventHeader) -> int:
+        rows = [
+            (collection_name, e["event_id"], e["event_name"], e["location"], e["venue_name"],
+             e["venue_address"], safe_json_dumps(header.attributes(e)))
+            for e in events if e.get("event_id") is not None
+        ]
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "INSERT INTO agenda_events (collection_name, event_id, event_name, location, venue_name, "
+                    "venue_address, attributes) VALUES (%s, %s, %s, %s, %s, %s, %s::jsonb) "
+                    "ON CONFLICT (collection_name, event_id) DO UPDATE SET event_name = EXCLUDED.event_name, "
+                    "location = EXCLUDED.location, venue_name = EXCLUDED.venue_name, "
+                    "venue_address = EXCLUDED.venue_address, attributes = EXCLUDED.attributes, "
+                    "updated_at = CURRENT_TIMESTAMP",
+                    rows,
+                )
+        self.logger.info(f"Stored {len(rows)} event header(s) for collection '{collection_name}'")
+        return len(rows)
+
+    def load(self, collection_name: str) -> Dict[int, Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT event_id, event_name, location, venue_name, venue_address, attributes "
+                "FROM agenda_events WHERE collection_name = %s",
+                (collection_name,),
+            ).fetchall()
+        return {
+            r[0]: {"event_id": r[0], "event_name": r[1], "location": r[2], "venue_name": r[3],
+                   "venue_address": r[4], **(r[5] or {})}
+            for r in rows
+        }
+
+
+@dataclass
+class Footprint:
+    """Average per-document cost of one metadata/text layout"""
+    metadata_bytes: float
+    text_chars: float
+    tokens: float
+
+
+def measure_footprint(texts: List[str], metadatas: List[Dict[str, Any]],
+                      count_tokens: Optional[Callable[[str], int]] = None) -> Footprint:
+    """
+    Mean JSON metadata bytes, text characters and tokens per document
+    """
+    if not texts:
+        return Footprint(0.0, 0.0, 0.0)
+    count_tokens = count_tokens or (lambda text: len(text.split()))
+    n = len(texts)
+    return Footprint(
+        metadata_bytes=sum(len(json.dumps(m, ensure_ascii=False).encode("utf-8")) for m in metadatas) / n,
+        text_chars=sum(len(t) for t in texts) / n,
+        tokens=sum(count_tokens(t) for t in texts) / n,
+    )
+
+
+def legacy_text(text: str, header: EventHeader) -> str:
+    """
+    Document text with the fixed event sentences re-inserted before the duration category
+    """
+    marker = ". DURACIÓN CATEGÓRICA:"
+    boilerplate = ". ".join(header.sentences())
+    if boilerplate in text:
+        return text
+    head, sep, tail = text.partition(marker)
+    return f"{head}. {boilerplate}{sep}{tail}" if sep else f"{text}. {boilerplate}"
+
+
+def log_footprint(legacy: Footprint, normalized: Footprint, log=logger.info):
+    def pct(old: float, new: float) -> str:
+        return f"{(1 - new / old):.1%}" if old else "n/a"
+
+    log(f"metadata bytes/doc: {legacy.metadata_bytes:.0f} -> {normalized.metadata_bytes:.0f} "
+        f"(-{pct(legacy.metadata_bytes, normalized.metadata_bytes)})")
+    log(f"text chars/doc:     {legacy.text_chars:.0f} -> {normalized.text_chars:.0f} "
+        f"(-{pct(legacy.text_chars, normalized.text_chars)})")
+    log(f"tokens/doc:         {legacy.tokens:.1f} -> {normalized.tokens:.1f} "
+        f"(-{pct(legacy.tokens, normalized.tokens)})")
+
+
+def gin_index_sizes(conn: psycopg.Connection, legacy: List[Dict[str, Any]],
+                    normalized: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Index both layouts in temp tables with a default GIN (as LangChain does on
+    ``cmetadata``) and return the index sizes in bytes
+    """
+    sizes = {}
+    for name, metadatas in (("legacy", legacy), ("normalized", normalized)):
+        table = f"footprint_{name}"
+        conn.execute(f"CREATE TEMP TABLE {table} (cmetadata JSONB) ON COMMIT DROP")
+        with conn.cursor() as cur:
+            with cur.copy(f"COPY {table} (cmetadata) FROM STDIN") as copy:
+                for metadata in metadatas:
+                    copy.write_row((safe_json_dumps(metadata),))
+        conn.execute(f"CREATE INDEX {table}_gin ON {table} USING gin (cmetadata)")
+        sizes[name] = conn.execute(
+            f"SELECT pg_relation_size('{table}_gin')"
+        ).fetchone()[0]
+    return sizes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Event-level metadata normalization")
+    sub = parser.add_subparsers(dest="command", required=True)
+    report = sub.add_parser("report", help="Legacy vs normalized row size, GIN index size and tokens per document")
+    report.add_argument("--collection", default=os.getenv("PGVECTOR_COLLECTION_NAME", "agenda_sessions"))
+    args = parser.parse_args(argv)
+
+    from .vector_db import load_collection_vectors
+
+    header = EventHeader.from_env()
+    conninfo = dest_conninfo()
+    with psycopg.connect(**conninfo) as conn:
+        _, _, metadatas, documents = load_collection_vectors(conn, args.collection)
+    if not metadatas:
+        logger.error(f"Collection '{args.collection}' is empty")
+        return 1
+
+    events = EventStore(conninfo).load(args.collection)
+    legacy_metadatas = [merge_event_metadata(m, events, header) for m in metadatas]
+    legacy_documents = [legacy_text(d, header) for d in documents]
+
+    count_tokens = None
+    try:
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(
+            os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/multi-qa-mpnet-base-dot-v1")
+        )
+        count_tokens = lambda text: len(tokenizer(text, truncation=False)["input_ids"])  # noqa: E731
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, counting whitespace tokens: {e}")
+
+    log_footprint(measure_footprint(legacy_documents, legacy_metadatas, count_tokens),
+                  measure_footprint(documents, metadatas, count_tokens))
+
+    with psycopg.connect(**conninfo) as conn:
+        sizes = gin_index_sizes(conn, legacy_metadatas, metadatas)
+    logger.info(f"GIN index on cmetadata: {format_bytes(sizes['legacy'])} -> {format_bytes(sizes['normalized'])} "
+                f"for {len(metadatas)} documents")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,78 +6,258 @@ Versión corregida sin errores SQL
 
 import os
 import sys
+import time as time_module
 from datetime import datetime, timezone, time
 from typing import Dict, List, Optional
 import logging
 import json
 
-from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_postgres import PGVector
+import numpy as np
 import psycopg
 
+from src.autotune import load_profile
+from src.centroids import TRACK, CentroidStore, Cluster, compute_centroids
+from src.checkpoint import Checkpoint, CheckpointStore, model_fingerprint
+from src.cpu import CpuThrottleMonitor, apply_thread_plan, plan_threads
+from src.events import EventHeader, EventStore, event_record, legacy_text, log_footprint, measure_footprint, merge_event_metadata
+from src.index_manager import INDEX_MODES, HnswIndexManager
+from src.memory import MemoryGovernor
+from src.neighbors import NeighborStore, compute_neighbors
+from src.partitions import PartitionedVectorStore
+from src.pipeline import HELPER_CPUS as PIPELINE_HELPER_CPUS, AsyncAgendaPipeline
+from src.query_router import Lexicon, LexiconStore
+from src.shard_spec import ShardSpec
+from src.sharding import RUN_MARKER_KEY, ShardRegistry
+from src.snapshot import export_snapshot
+from src.storage import InMemoryVectorStore, PGVectorWriter, PostgresSourceReader, SourceReader, VectorWriter
+from src.utils import env_conninfo, format_bytes
+from src.vector_db import load_collection_vectors
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Consultas de humo tras cada ejecución (también usadas por el benchmark ANN)
+AGENDA_TEST_QUERIES = [
+    "agenda kubernetes",
+    "charlas mañana",
+    "sesiones seguridad",
+    "agenda devops",
+    "horarios disponibles"
+]
+
+MESES = ['enero', 'febrero', 'marzo', 'abril', 'mayo', 'junio', 'julio',
+         'agosto', 'septiembre', 'octubre', 'noviembre', 'diciembre']
+
+
+def format_date_es(value) -> str:
+    """Fecha de la sesión en español ("14 de junio de 2025")."""
+    return f"{value.day} de {MESES[value.month - 1]} de {value.year}"
+
+
 class SimpleAgendaEmbeddingsGenerator:
     """
     Generador simplificado que funciona con la estructura actual de datos.
     """
     
-    def __init__(self):
-        self.source_db: Optional[psycopg.Connection] = None
+    def __init__(self, source: Optional[SourceReader] = None, writer: Optional[VectorWriter] = None,
+                 embeddings_model=None):
+        """
+        Por defecto lee de Postgres y escribe en PGVector; `source`, `writer` y
+        `embeddings_model` permiten sustituirlos (SQLite/memoria en pruebas y benchmarks).
+        """
         self.vector_store: Optional[PGVector] = None
+        self.embeddings_model = embeddings_model
+        self.source = source or PostgresSourceReader(self.source_conninfo())
+        self.writer = writer
+        self.embedding_model_name = os.getenv('EMBEDDING_MODEL_NAME', 'sentence-transformers/multi-qa-mpnet-base-dot-v1')
+        self.snapshot_dir = os.getenv('SNAPSHOT_DIR', '')
+        self.snapshot_keep = int(os.getenv('SNAPSHOT_KEEP', '3'))
+        self.pipeline_mode = os.getenv('PIPELINE_MODE', 'sync').lower()
+        self.pipeline_chunk_size = int(os.getenv('PIPELINE_CHUNK_SIZE', '64'))
+        self.pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', '2'))
+        self.collection_name = os.getenv('PGVECTOR_COLLECTION_NAME', 'agenda_sessions')
+        # 'collection' (colección PGVector única) o 'partitioned' (tabla particionada por event_id)
+        self.vector_storage = os.getenv('VECTOR_STORAGE', 'collection').lower()
+        # Eventos a (re)construir; vacío = todos. Los demás eventos no se leen ni se tocan
+        self.event_ids = tuple(int(e) for e in os.getenv('EVENT_IDS', '').split(',') if e.strip()) or None
+        self.source.event_ids = self.event_ids
+        self.shard = ShardSpec.from_env()
+        self.validate_storage()
+        self.shard_registry: Optional[ShardRegistry] = None
+        self.index_mode = os.getenv('HNSW_INDEX_MODE', 'auto').lower()
+        self.index_bulk_threshold = int(os.getenv('HNSW_BULK_THRESHOLD', '1000'))
+        self.index_manager: Optional[HnswIndexManager] = None
+        self.index_dropped = False
+        self.checkpoint_enabled = os.getenv('CHECKPOINT_ENABLED', 'true').lower() == 'true'
+        self.checkpoint_batch_size = int(os.getenv('CHECKPOINT_BATCH_SIZE', '128'))
+        self.checkpoint_store: Optional[CheckpointStore] = None
+        self.checkpoint: Optional[Checkpoint] = None
+        # Atributos del evento: una fila en agenda_events en lugar de repetirlos en cada documento
+        self.event_header = EventHeader.from_env()
+        self.event_header_in_text = os.getenv('EVENT_HEADER_IN_TEXT', 'false').lower() == 'true'
+        self.run_events: Dict[int, Dict] = {}
+        # Léxico de filtros (period_of_day, session_type, tags...) para la ruta rápida de consultas
+        self.query_lexicon: Optional[Lexicon] = None
+        # Centroides por track y tag para búsqueda en dos etapas y "tracks relacionados"
+        self.centroids: List[Cluster] = []
+        # Vecinos precalculados (session_neighbors); NEIGHBORS_K=0 lo desactiva
+        self.neighbors_k = int(os.getenv('NEIGHBORS_K', '10'))
+        self.neighbors_block_size = max(1, int(os.getenv('NEIGHBORS_BLOCK_SIZE', '1024')))
+        self.neighbors: List[tuple] = []
+        self.footprint_sample: List[tuple] = []
+        self.encode_batch_size = max(1, int(os.getenv('BATCH_SIZE', '32')))
+        self.encode_threads: Optional[int] = None
+        self.autotune_mode = os.getenv('AUTOTUNE', 'auto').lower()
+        self.apply_autotune_profile()
+        # Hilos según la cuota de CPU del contenedor, repartidos entre procesos locales y
+        # (en modo async) reservando una CPU para las etapas de lectura y escritura
+        requested_threads = int(os.getenv('ENCODER_THREADS', '0')) or self.encode_threads
+        self.thread_plan = plan_threads(
+            processes=int(os.getenv('CPU_SHARE_PROCESSES', '1')),
+            reserved=PIPELINE_HELPER_CPUS if self.pipeline_mode == 'async' else 0,
+            requested=requested_threads,
+        )
+        self.cpu_monitor = CpuThrottleMonitor()
+        self.current_encode_batch = self.encode_batch_size
+        self.memory = MemoryGovernor.from_env()
         
-    def get_source_db_connection(self):
-        """Conectar a la base de datos fuente."""
-        host = os.getenv('DB_SOURCE_HOST', 'postgres-source')
-        port = os.getenv('DB_SOURCE_PORT', '5432')
-        database = os.getenv('DB_SOURCE_NAME', 'events_db')
-        user = os.getenv('DB_SOURCE_USER', 'events_user')
-        password = os.getenv('DB_SOURCE_PASSWORD', 'events_pass')
-        
-        logger.info(f"🔗 Conectando a DB fuente: {host}:{port}/{database}")
+    def apply_autotune_profile(self):
+        """Usar el lote y los hilos calibrados por `autotune` para este modelo y esta CPU."""
+        if self.autotune_mode == 'off':
+            return
+        profile = load_profile(os.getenv('CACHE_DIR', '/cache/.cache'), self.embedding_model_name)
+        if not profile:
+            return
+        self.encode_batch_size = profile.batch_size
+        self.encode_threads = profile.threads
+        logger.info(
+            f"🎛️ Perfil autotune: batch={profile.batch_size}, hilos={profile.threads} "
+            f"({profile.texts_per_sec:.1f} textos/s medidos)"
+        )
+
+    def source_conninfo(self) -> Dict:
+        """Parámetros de conexión a la base de datos fuente."""
+        return env_conninfo("DB_SOURCE")
+
+    def dest_conninfo(self) -> Dict:
+        """Parámetros de conexión a la base de datos de vectores."""
+        return env_conninfo("DB_DEST")
+
+    def begin_checkpoint(self):
+        """Reanudar la ejecución pendiente (mismo modelo y colección) o registrar una nueva."""
+        if not self.checkpoint_enabled:
+            return
         
+        fingerprint = model_fingerprint(
+            self.embedding_model_name, int(os.getenv('EMBEDDING_DIM', '768')), True
+        )
         try:
-            return psycopg.connect(
-                host=host, port=port, dbname=database, 
-                user=user, password=password,
-                connect_timeout=10
+            self.checkpoint_store = CheckpointStore(
+                self.dest_conninfo(), max_age_hours=float(os.getenv('CHECKPOINT_MAX_AGE_HOURS', '24'))
             )
+            self.checkpoint_store.ensure_schema()
+            if self.shard.enabled:
+                # Cada shard tiene su propio checkpoint dentro de la ejecución distribuida; solo se
+                # reanuda el de este SHARD_RUN_ID (los de ejecuciones anteriores se abandonan)
+                self.checkpoint = self.checkpoint_store.begin(
+                    f"{self.checkpoint_scope}:shard-{self.shard.index}-of-{self.shard.count}",
+                    fingerprint, run_id=f"{self.shard.run_id}-{self.shard.index}"
+                )
+            else:
+                self.checkpoint = self.checkpoint_store.begin(
+                    self.checkpoint_scope, fingerprint, run_id=os.getenv('RUN_ID') or None
+                )
         except Exception as e:
-            logger.error(f"❌ Error conectando a DB fuente: {e}")
-            raise e
+            # Sin tabla de checkpoints la ejecución sigue siendo válida, solo no reanudable
+            logger.warning(f"⚠️ Checkpoints deshabilitados: {e}")
+            self.checkpoint_store = None
+            self.checkpoint = None
         
-    def initialize_vector_store(self) -> bool:
-        """Inicializar PGVector para agendas."""
+        if self.checkpoint and self.checkpoint.resumed:
+            logger.info(
+                f"♻️ Reanudando ejecución {self.checkpoint.run_id} desde la sesión "
+                f"{self.checkpoint.last_session_id} ({self.checkpoint.skipped_sessions} sesiones ya confirmadas)"
+            )
+
+    def validate_storage(self):
+        """Rechazar combinaciones que el almacenamiento no puede respetar (antes de tocar el destino)."""
+        if self.vector_storage not in ('collection', 'partitioned'):
+            raise ValueError(f"VECTOR_STORAGE desconocido '{self.vector_storage}' (collection o partitioned)")
+        if self.event_ids and self.vector_storage != 'partitioned':
+            # Una carga de la colección la vacía entera: se perderían los eventos no incluidos
+            raise ValueError("EVENT_IDS requiere VECTOR_STORAGE=partitioned")
+        if self.shard.enabled and self.vector_storage == 'partitioned':
+            # El coordinador limpia y reindexa la colección PGVector, no las particiones
+            raise ValueError("VECTOR_STORAGE=partitioned no admite ejecuciones con SHARD_COUNT > 1")
+
+    @property
+    def checkpoint_scope(self) -> str:
+        """Clave del checkpoint: la colección, acotada a los eventos de EVENT_IDS si se indicaron."""
+        if not self.event_ids:
+            return self.collection_name
+        return f"{self.collection_name}:events-{','.join(str(e) for e in sorted(self.event_ids))}"
+
+    @property
+    def shard_skipped(self) -> int:
+        """Sesiones ya confirmadas antes de reanudar."""
+        return self.checkpoint.skipped_sessions if self.checkpoint else 0
+
+    @property
+    def resume_after_id(self) -> int:
+        """Último session_id confirmado por la ejecución reanudada (0 si es nueva)."""
+        if self.checkpoint and self.checkpoint.resumed and self.checkpoint.last_session_id:
+            return self.checkpoint.last_session_id
+        return 0
+
+    def initialize_vector_store(self, pre_delete_collection: bool = True) -> bool:
+        """Inicializar PGVector para agendas (salvo que se haya inyectado otro destino)."""
+        if self.writer is not None and self.embeddings_model is not None:
+            return True
         try:
-            dest_host = os.getenv('DB_DEST_HOST', 'postgres-vector')
-            dest_port = os.getenv('DB_DEST_PORT', '5432')
-            dest_database = os.getenv('DB_DEST_NAME', 'vector_db')
-            dest_user = os.getenv('DB_DEST_USER', 'vector_user')
-            dest_password = os.getenv('DB_DEST_PASSWORD', 'vector_pass')
+            dest = self.dest_conninfo()
+            connection_string = f"postgresql+psycopg://{dest['user']}:{dest['password']}@{dest['host']}:{dest['port']}/{dest['dbname']}"
             
-            connection_string = f"postgresql+psycopg://{dest_user}:{dest_password}@{dest_host}:{dest_port}/{dest_database}"
+            logger.info(f"🔗 Conectando PGVector: {dest['host']}:{dest['port']}/{dest['dbname']}")
             
-            logger.info(f"🔗 Conectando PGVector: {dest_host}:{dest_port}/{dest_database}")
+            # batch_size llega a sentence-transformers (por defecto usaría 32); embed_texts lo ajusta
+            encode_kwargs = {'normalize_embeddings': True, 'batch_size': self.current_encode_batch}
             
-            embedding_model = os.getenv('EMBEDDING_MODEL_NAME', 'sentence-transformers/multi-qa-mpnet-base-dot-v1')
-            encode_kwargs = {'normalize_embeddings': True}
+            apply_thread_plan(self.thread_plan)
             
-            embeddings_model = HuggingFaceEmbeddings(
-                model_name=embedding_model,
-                encode_kwargs=encode_kwargs
-            )
+            if self.embeddings_model is None:
+                self.embeddings_model = HuggingFaceEmbeddings(
+                    model_name=self.embedding_model_name,
+                    encode_kwargs=encode_kwargs
+                )
+            
+            if self.writer is not None:
+                return True
+            
+            if self.vector_storage == 'partitioned':
+                self.writer = PartitionedVectorStore(
+                    dest, int(os.getenv('EMBEDDING_DIM', '768')), embed_query=self.embeddings_model.embed_query,
+                    index_mode=self.index_mode
+                )
+                self.writer.ensure_schema()
+                # Carga completa: se vacía solo la partición de cada evento escrito (nunca en shards)
+                self.writer.reset_on_write = pre_delete_collection
+                logger.info(f"✅ Almacenamiento particionado por evento ({len(self.writer.events())} particiones)")
+                return True
             
-            collection_name = 'agenda_sessions'
+            collection_name = self.collection_name
 
+            # Dimensión fija: el índice HNSW requiere una columna vector(N)
             self.vector_store = PGVector(
-                embeddings=embeddings_model,
+                embeddings=self.embeddings_model,
                 collection_name=collection_name,
                 connection=connection_string,
+                embedding_length=int(os.getenv('EMBEDDING_DIM', '768')),
                 use_jsonb=True,
-                pre_delete_collection=True
+                pre_delete_collection=pre_delete_collection
             )
+            self.writer = PGVectorWriter(self.vector_store)
             
             logger.info(f"✅ PGVector inicializado. Colección '{collection_name}' para agendas.")
             return True
@@ -86,92 +266,50 @@ class SimpleAgendaEmbeddingsGenerator:
             logger.error(f"❌ Error inicializando PGVector: {e}")
             return False
 
-    def fetch_simple_sessions(self) -> List[Dict]:
+    def fetch_simple_sessions(self) -> Optional[List[Dict]]:
         """
         Obtener sesiones con consulta SQL simplificada que funciona.
-        """
-        logger.info("🔍 Obteniendo sesiones con consulta simplificada...")
         
-        # Consulta SQL simplificada sin ORDER BY problemáticos
-        query = """
-        SELECT 
-            s.id,
-            s.session_name,
-            s.session_type,
-            s.session_date,
-            s.start_time,
-            s.end_time,
-            EXTRACT(EPOCH FROM (s.end_time - s.start_time))/60 as duration_minutes,
-            EXTRACT(HOUR FROM s.start_time) as start_hour,
-            EXTRACT(MINUTE FROM s.start_time) as start_minute,
-            
-            -- Información del evento
-            e.event_name,
-            e.location,
-            e.venue_name,
-            e.venue_address,
-            
-            -- Track
-            t.track_name,
-            t.track_description,
-            
-            -- Ubicación
-            r.room_code,
-            r.room_name,
-            v.venue_name as sala_venue,
-            v.capacity,
-            
-            -- URLs
-            s.slides_url,
-            s.repository_url
-            
-        FROM schedules s
-        LEFT JOIN events e ON s.event_id = e.id
-        LEFT JOIN rooms r ON s.room_id = r.id
-        LEFT JOIN venues v ON r.venue_id = v.id
-        LEFT JOIN tracks t ON s.track_id = t.id
-        ORDER BY s.session_date, s.start_time, s.id;
+        Devuelve None si la lectura falla (distinto de una fuente vacía).
         """
+        logger.info("🔍 Obteniendo sesiones con consulta simplificada...")
         
         try:
-            with self.get_source_db_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(query)
-                    results = cur.fetchall()
-                    
-                    sessions = []
-                    for row in results:
-                        session = {
-                            'id': row[0],
-                            'session_name': row[1] or f'Sesión {row[0]}',
-                            'session_type': row[2] or 'charla',
-                            'session_date': row[3],
-                            'start_time': row[4],
-                            'end_time': row[5],
-                            'duration_minutes': row[6] or 60,
-                            'start_hour': int(row[7]) if row[7] else 9,
-                            'start_minute': int(row[8]) if row[8] else 0,
-                            'event_name': row[9] or 'KCD Antigua Guatemala 2025',
-                            'location': row[10] or 'Antigua Guatemala',
-                            'venue_name': row[11] or 'Centro de Convenciones Antigua',
-                            'venue_address': row[12] or 'Antigua Guatemala, Guatemala',
-                            'track_name': row[13] or 'General',
-                            'track_description': row[14] or 'Track general',
-                            'room_code': row[15] or 'ROOM-1',
-                            'room_name': row[16] or 'Sala Principal',
-                            'sala_venue': row[17] or 'Auditorium',
-                            'capacity': row[18] or 200,
-                            'slides_url': row[19],
-                            'repository_url': row[20]
-                        }
-                        sessions.append(session)
-                    
-                    logger.info(f"✅ Obtenidas {len(sessions)} sesiones básicas")
-                    return sessions
-                    
+            sessions = [self.row_to_session(row) for row in self.source.fetch_sessions(self.shard)]
+            logger.info(f"✅ Obtenidas {len(sessions)} sesiones básicas")
+            return sessions
+            
         except Exception as e:
             logger.error(f"❌ Error obteniendo sesiones: {e}")
-            return []
+            return None
+
+    def row_to_session(self, row) -> Dict:
+        """Convertir una fila de SESSIONS_QUERY en el diccionario de sesión."""
+        return {
+            'id': row[0],
+            'session_name': row[1] or f'Sesión {row[0]}',
+            'session_type': row[2] or 'charla',
+            'session_date': row[3],
+            'start_time': row[4],
+            'end_time': row[5],
+            'duration_minutes': row[6] or 60,
+            'start_hour': int(row[7]) if row[7] else 9,
+            'start_minute': int(row[8]) if row[8] else 0,
+            # Datos del evento tal como vienen de la fuente (sin valores de un evento concreto)
+            'event_name': row[9],
+            'location': row[10],
+            'venue_name': row[11],
+            'venue_address': row[12],
+            'track_name': row[13] or 'General',
+            'track_description': row[14] or 'Track general',
+            'room_code': row[15] or 'ROOM-1',
+            'room_name': row[16] or 'Sala Principal',
+            'sala_venue': row[17] or 'Auditorium',
+            'capacity': row[18] or 200,
+            'slides_url': row[19],
+            'repository_url': row[20],
+            'event_id': row[21]
+        }
 
     def fetch_speakers_for_sessions(self, sessions: List[Dict]) -> List[Dict]:
         """
@@ -183,70 +321,53 @@ class SimpleAgendaEmbeddingsGenerator:
             return sessions
         
         session_ids = [s['id'] for s in sessions]
-        placeholders = ','.join(['%s'] * len(session_ids))
-        
-        speaker_query = f"""
-        SELECT 
-            ss.session_id,
-            sp.name,
-            sp.company
-        FROM session_speakers ss
-        JOIN speakers sp ON ss.speaker_id = sp.id
-        WHERE ss.session_id IN ({placeholders})
-        ORDER BY ss.session_id, ss.speaker_order;
-        """
         
         try:
-            with self.get_source_db_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(speaker_query, session_ids)
-                    speaker_results = cur.fetchall()
-                    
-                    # Organizar speakers por session_id
-                    speakers_by_session = {}
-                    for row in speaker_results:
-                        session_id = row[0]
-                        speaker_name = row[1]
-                        company = row[2]
-                        
-                        if session_id not in speakers_by_session:
-                            speakers_by_session[session_id] = []
-                        
-                        speaker_info = speaker_name
-                        if company:
-                            speaker_info += f" ({company})"
-                        
-                        speakers_by_session[session_id].append({
-                            'name': speaker_name,
-                            'company': company,
-                            'full_info': speaker_info
-                        })
-                    
-                    # Agregar información de speakers a las sesiones
-                    for session in sessions:
-                        session_id = session['id']
-                        session_speakers = speakers_by_session.get(session_id, [])
-                        
-                        if session_speakers:
-                            session['speakers_info'] = ', '.join([s['full_info'] for s in session_speakers])
-                            session['speaker_names_only'] = ', '.join([s['name'] for s in session_speakers])
-                            session['speaker_companies'] = ', '.join([s['company'] for s in session_speakers if s['company']])
-                        else:
-                            session['speakers_info'] = 'Speaker por determinar'
-                            session['speaker_names_only'] = ''
-                            session['speaker_companies'] = ''
-                    
-                    logger.info(f"✅ Información de speakers agregada a {len(sessions)} sesiones")
-                    return sessions
-                    
+            self.attach_speakers(sessions, self.source.fetch_speakers(session_ids))
+            logger.info(f"✅ Información de speakers agregada a {len(sessions)} sesiones")
+            return sessions
+            
         except Exception as e:
             logger.error(f"❌ Error obteniendo speakers: {e}")
             # Devolver sesiones con información por defecto
-            for session in sessions:
+            return self.attach_speakers(sessions, [])
+
+    def attach_speakers(self, sessions: List[Dict], speaker_rows) -> List[Dict]:
+        """Agregar a cada sesión los speakers de SPEAKERS_QUERY (o valores por defecto)."""
+        # Organizar speakers por session_id
+        speakers_by_session = {}
+        for row in speaker_rows:
+            session_id = row[0]
+            speaker_name = row[1]
+            company = row[2]
+            
+            if session_id not in speakers_by_session:
+                speakers_by_session[session_id] = []
+            
+            speaker_info = speaker_name
+            if company:
+                speaker_info += f" ({company})"
+            
+            speakers_by_session[session_id].append({
+                'name': speaker_name,
+                'company': company,
+                'full_info': speaker_info
+            })
+        
+        # Agregar información de speakers a las sesiones
+        for session in sessions:
+            session_speakers = speakers_by_session.get(session['id'], [])
+            
+            if session_speakers:
+                session['speakers_info'] = ', '.join([s['full_info'] for s in session_speakers])
+                session['speaker_names_only'] = ', '.join([s['name'] for s in session_speakers])
+                session['speaker_companies'] = ', '.join([s['company'] for s in session_speakers if s['company']])
+            else:
                 session['speakers_info'] = 'Speaker por determinar'
                 session['speaker_names_only'] = ''
                 session['speaker_companies'] = ''
-            return sessions
+        
+        return sessions
 
     def fetch_tags_for_sessions(self, sessions: List[Dict]) -> List[Dict]:
         """
@@ -258,61 +379,45 @@ class SimpleAgendaEmbeddingsGenerator:
             return sessions
         
         session_ids = [s['id'] for s in sessions]
-        placeholders = ','.join(['%s'] * len(session_ids))
-        
-        tags_query = f"""
-        SELECT 
-            st.session_id,
-            tg.tag_name,
-            tg.tag_description
-        FROM session_tags st
-        JOIN tags tg ON st.tag_id = tg.id
-        WHERE st.session_id IN ({placeholders});
-        """
         
         try:
-            with self.get_source_db_connection() as conn:
-                with conn.cursor() as cur:
-                    cur.execute(tags_query, session_ids)
-                    tag_results = cur.fetchall()
-                    
-                    # Organizar tags por session_id
-                    tags_by_session = {}
-                    for row in tag_results:
-                        session_id = row[0]
-                        tag_name = row[1]
-                        tag_description = row[2]
-                        
-                        if session_id not in tags_by_session:
-                            tags_by_session[session_id] = []
-                        
-                        tags_by_session[session_id].append({
-                            'name': tag_name,
-                            'description': tag_description
-                        })
-                    
-                    # Agregar información de tags a las sesiones
-                    for session in sessions:
-                        session_id = session['id']
-                        session_tags = tags_by_session.get(session_id, [])
-                        
-                        if session_tags:
-                            session['session_tags'] = ', '.join([t['name'] for t in session_tags])
-                            session['tag_descriptions'] = '; '.join([t['description'] for t in session_tags if t['description']])
-                        else:
-                            session['session_tags'] = 'General'
-                            session['tag_descriptions'] = ''
-                    
-                    logger.info(f"✅ Tags agregados a {len(sessions)} sesiones")
-                    return sessions
-                    
+            self.attach_tags(sessions, self.source.fetch_tags(session_ids))
+            logger.info(f"✅ Tags agregados a {len(sessions)} sesiones")
+            return sessions
+            
         except Exception as e:
             logger.error(f"❌ Error obteniendo tags: {e}")
             # Devolver sesiones con información por defecto
-            for session in sessions:
+            return self.attach_tags(sessions, [])
+
+    def attach_tags(self, sessions: List[Dict], tag_rows) -> List[Dict]:
+        """Agregar a cada sesión los tags de TAGS_QUERY (o valores por defecto)."""
+        # Organizar tags por session_id
+        tags_by_session = {}
+        for row in tag_rows:
+            session_id = row[0]
+            
+            if session_id not in tags_by_session:
+                tags_by_session[session_id] = []
+            
+            tags_by_session[session_id].append({
+                'name': row[1],
+                'description': row[2]
+            })
+        
+        # Agregar información de tags a las sesiones
+        for session in sessions:
+            session_tags = tags_by_session.get(session['id'], [])
+            
+            session['tag_list'] = [t['name'] for t in session_tags]
+            if session_tags:
+                session['session_tags'] = ', '.join([t['name'] for t in session_tags])
+                session['tag_descriptions'] = '; '.join([t['description'] for t in session_tags if t['description']])
+            else:
                 session['session_tags'] = 'General'
                 session['tag_descriptions'] = ''
-            return sessions
+        
+        return sessions
 
     def generate_agenda_content(self, session: Dict) -> str:
         """
@@ -321,8 +426,11 @@ class SimpleAgendaEmbeddingsGenerator:
         content_parts = []
         
         # 1. Información básica del evento
-        content_parts.append(f"EVENTO: {session.get('event_name', 'KCD Antigua Guatemala 2025')}")
-        content_parts.append(f"UBICACIÓN DEL EVENTO: {session.get('venue_name', 'Centro de Convenciones Antigua')}, {session.get('venue_address', 'Antigua Guatemala')}")
+        if session.get('event_name'):
+            content_parts.append(f"EVENTO: {session['event_name']}")
+        venue = ', '.join(v for v in (session.get('venue_name'), session.get('venue_address') or session.get('location')) if v)
+        if venue:
+            content_parts.append(f"UBICACIÓN DEL EVENTO: {venue}")
         
         # 2. Información de la sesión
         content_parts.append(f"SESIÓN: {session['session_name']}")
@@ -344,12 +452,11 @@ class SimpleAgendaEmbeddingsGenerator:
         
         # 4. Información temporal CRÍTICA para agendas
         if session['start_time'] and session['end_time']:
-            # El evento es el 14 de junio de 2025
-            date_str = "14 de junio de 2025"
             start_time_str = session['start_time'].strftime('%H:%M') if session['start_time'] else 'Hora por definir'
             end_time_str = session['end_time'].strftime('%H:%M') if session['end_time'] else 'Fin por definir'
             
-            content_parts.append(f"FECHA: {date_str}")
+            if session.get('session_date'):
+                content_parts.append(f"FECHA: {format_date_es(session['session_date'])}")
             content_parts.append(f"HORARIO: de {start_time_str} a {end_time_str}")
             content_parts.append(f"DURACIÓN: {int(session.get('duration_minutes', 60))} minutos")
             
@@ -392,13 +499,9 @@ class SimpleAgendaEmbeddingsGenerator:
         if resources:
             content_parts.append(f"RECURSOS DISPONIBLES: {', '.join(resources)}")
         
-        # 9. Información para agendas personalizadas
-        content_parts.append("DISPONIBLE PARA AGENDA PERSONALIZADA: Sí")
-        content_parts.append("SIN CONFLICTOS TEMPORALES: Verificar con otras sesiones seleccionadas")
-        content_parts.append("IDIOMA: Español")
-        content_parts.append("MODALIDAD: Presencial")
-        content_parts.append("REGISTRO: Gratuito con inscripción previa")
-        content_parts.append("COMUNIDAD: CNCF (Cloud Native Computing Foundation)")
+        # 9. Cabecera del evento: igual en todas las sesiones, solo si se pide explícitamente
+        if self.event_header_in_text:
+            content_parts.extend(self.event_header.sentences())
         
         # 10. Categorización para filtros
         duration = session.get('duration_minutes', 60)
@@ -455,71 +558,131 @@ class SimpleAgendaEmbeddingsGenerator:
         logger.info(f"✅ Limpiados {len(cleaned_sessions)} sesiones")
         return cleaned_sessions
 
-    def process_sessions_for_agenda(self, sessions: List[Dict]):
+    def prepare_index_for_load(self, full_load: bool, expected_rows: Optional[int] = None):
+        """
+        Decidir el ciclo de vida del índice HNSW para esta carga.
+        
+        Cargas completas o grandes eliminan el índice y lo construyen una sola vez al
+        final; los deltas pequeños lo conservan (mantenimiento incremental).
+        """
+        if self.index_mode not in INDEX_MODES:
+            logger.warning(f"⚠️ HNSW_INDEX_MODE desconocido '{self.index_mode}', usando 'auto'")
+            self.index_mode = 'auto'
+        if self.index_mode == 'off':
+            return
+        if isinstance(self.writer, PartitionedVectorStore):
+            # Cada partición gestiona su índice según HNSW_INDEX_MODE al escribir su evento
+            return
+        
+        try:
+            # Índice parcial de esta colección: las demás colecciones de la tabla conservan el suyo
+            self.index_manager = HnswIndexManager.for_collection(self.dest_conninfo(), self.collection_name)
+            if not self.index_manager.ensure_typed_column(int(os.getenv('EMBEDDING_DIM', '768'))):
+                logger.warning("⚠️ Columna de embeddings sin dimensión fija: gestión del índice HNSW omitida")
+                self.index_manager = None
+                return
+            
+            bulk = full_load or (expected_rows is not None and expected_rows >= self.index_bulk_threshold)
+            if self.index_mode == 'rebuild' or (self.index_mode == 'auto' and bulk):
+                logger.info(f"🗂️ Carga masiva ({expected_rows if expected_rows is not None else 'completa'}): índice HNSW se construirá al final")
+                self.index_manager.drop()
+                self.index_dropped = True
+            else:
+                logger.info("🗂️ Delta incremental: se conserva el índice HNSW existente")
+        except Exception as e:
+            logger.warning(f"⚠️ Gestión del índice HNSW deshabilitada: {e}")
+            self.index_manager = None
+
+    def finalize_index(self):
+        """Construir el índice HNSW (si se eliminó o no existe) y fijar ef_search por defecto."""
+        if isinstance(self.writer, PartitionedVectorStore):
+            try:
+                # Particiones del alcance sin índice, incluidas las completadas antes de una reanudación;
+                # las que ya tienen índice lo conservan
+                events = self.partition_events()
+                self.writer.finalize_indexes(events)
+                if self.writer.build_indexes and events:
+                    self.writer.index_manager(events[0]).set_default_ef_search()
+            except Exception as e:
+                logger.error(f"❌ Error construyendo los índices HNSW por evento: {e}")
+            return
+        if not self.index_manager:
+            return
+        try:
+            # Una reanudación puede encontrar el índice eliminado por el intento interrumpido
+            if self.index_dropped or not self.index_manager.exists():
+                self.index_manager.build()
+            else:
+                logger.info(f"🗂️ Índice HNSW conservado ({format_bytes(self.index_manager.index_size())})")
+            self.index_manager.set_default_ef_search()
+        except Exception as e:
+            logger.error(f"❌ Error construyendo el índice HNSW: {e}")
+
+    def process_sessions_for_agenda(self, sessions: List[Dict]) -> int:
         """Procesar sesiones para agendas personalizadas."""
         if not sessions:
             logger.warning("⚠️ No hay sesiones para procesar")
-            return
-        
-        docs_to_add = []
-        doc_ids = []
+            return 0
         
         logger.info(f"🔄 Procesando {len(sessions)} sesiones para agendas personalizadas...")
         
+        # Orden por id y lotes confirmados uno a uno: el checkpoint es "último id escrito"
+        sessions = sorted(sessions, key=lambda s: s['id'])
+        max_batch = max(1, self.checkpoint_batch_size)
+        batch_size = max_batch
+        processed = 0
+        start = 0
+        
+        while start < len(sessions):
+            # El gobernador de memoria reduce el lote cerca del presupuesto y lo recupera con holgura
+            batch_size = self.memory.adjust('write', batch_size, ceiling=max_batch)
+            batch = sessions[start:start + batch_size]
+            start += len(batch)
+            texts, metadatas, doc_ids = self.prepare_agenda_documents(batch)
+            
+            # Codificar una sola vez: los mismos vectores van a PGVector y al snapshot
+            logger.info(f"🧠 Generando embeddings para {len(texts)} documentos...")
+            embeddings = self.embed_texts(texts)
+            
+            logger.info(f"⬆️ Agregando {len(texts)} documentos para agendas...")
+            self.write_agenda_batch(texts, embeddings, metadatas, doc_ids)
+            processed += len(texts)
+        
+        logger.info("✅ Embeddings para agendas creados exitosamente")
+        return processed
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Codificar en sub-lotes cuyo tamaño ajusta el gobernador de memoria."""
+        embeddings: List[List[float]] = []
+        start = 0
+        while start < len(texts):
+            self.current_encode_batch = self.memory.adjust(
+                'encode', self.current_encode_batch, ceiling=self.encode_batch_size
+            )
+            batch = texts[start:start + self.current_encode_batch]
+            encode_kwargs = getattr(self.embeddings_model, 'encode_kwargs', None)
+            if isinstance(encode_kwargs, dict):
+                # Sin batch_size, embed_documents codifica en pasadas de 32 sea cual sea el lote calibrado
+                encode_kwargs['batch_size'] = self.current_encode_batch
+            embeddings.extend(self.embeddings_model.embed_documents(batch))
+            start += len(batch)
+        return embeddings
+
+    def prepare_agenda_documents(self, sessions: List[Dict]):
+        """Construir textos, metadata e ids de documento para un grupo de sesiones."""
+        texts = []
+        metadatas = []
+        doc_ids = []
+        
         for session in sessions:
             # Generar contenido optimizado
-            agenda_content = self.generate_agenda_content(session)
-            
-            # Metadata para agendas (con conversión de tipos)
-            metadata = {
-                'source': 'kcd_antigua_2025_agenda',
-                'session_id': int(session['id']),
-                'session_name': str(session['session_name']),
-                'session_type': str(session['session_type']),
-                'track_name': str(session.get('track_name', '')),
-                'speakers_info': str(session.get('speakers_info', '')),
-                'speaker_names_only': str(session.get('speaker_names_only', '')),
-                'speaker_companies': str(session.get('speaker_companies', '')),
-                
-                # Temporal info (convertir a tipos JSON serializables)
-                'session_date': session['session_date'].isoformat() if session['session_date'] else '2025-06-14',
-                'start_time': session['start_time'].isoformat() if session['start_time'] else None,
-                'end_time': session['end_time'].isoformat() if session['end_time'] else None,
-                'start_hour': int(session.get('start_hour', 9)),
-                'start_minute': int(session.get('start_minute', 0)),
-                'duration_minutes': float(session.get('duration_minutes', 60.0)),
-                
-                # Location
-                'room_name': str(session.get('room_name', '')),
-                'room_code': str(session.get('room_code', '')),
-                'capacity': int(session.get('capacity', 200)),
-                
-                # Categorization
-                'session_tags': str(session.get('session_tags', '')),
-                'period_of_day': str(self._get_period_of_day(session.get('start_hour', 9))),
-                'duration_category': str(self._categorize_duration(float(session.get('duration_minutes', 60.0)))),
-                'suggested_level': str(self._suggest_level(session['session_name'])),
-                
-                # Event info
-                'event_name': str(session.get('event_name', 'KCD Antigua Guatemala 2025')),
-                'location': str(session.get('location', 'Antigua Guatemala')),
-                'venue_name': str(session.get('venue_name', 'Centro de Convenciones Antigua')),
-                'language': 'Español',
-                'is_free': True,
-                'requires_registration': True,
-                'is_online': False,
-                
-                # Resources
-                'has_slides': bool(session.get('slides_url')),
-                'has_repository': bool(session.get('repository_url')),
-                'slides_url': str(session.get('slides_url', '') if session.get('slides_url') else ''),
-                'repository_url': str(session.get('repository_url', '') if session.get('repository_url') else '')
-            }
-            
-            # Crear documento
-            doc = Document(page_content=agenda_content, metadata=metadata)
-            docs_to_add.append(doc)
+            texts.append(self.generate_agenda_content(session))
+            metadatas.append(self.build_agenda_metadata(session))
             doc_ids.append(f"agenda_session_{session['id']}")
+            if session.get('event_id') is not None:
+                self.run_events.setdefault(session['event_id'], event_record(session))
+            if len(self.footprint_sample) < 256:
+                self.footprint_sample.append((texts[-1], metadatas[-1]))
             
             # Log de ejemplo
             if session['id'] <= 3:
@@ -527,12 +690,78 @@ class SimpleAgendaEmbeddingsGenerator:
                 logger.info(f"   Nombre: {session['session_name']}")
                 logger.info(f"   Speakers: {session.get('speakers_info', 'N/A')}")
                 logger.info(f"   Tags: {session.get('session_tags', 'N/A')}")
+        
+        return texts, metadatas, doc_ids
 
-        # Agregar a PGVector
-        if docs_to_add:
-            logger.info(f"⬆️ Agregando {len(docs_to_add)} documentos para agendas...")
-            self.vector_store.add_documents(docs_to_add, ids=doc_ids)
-            logger.info("✅ Embeddings para agendas creados exitosamente")
+    def build_agenda_metadata(self, session: Dict) -> Dict:
+        """Metadata para agendas (con conversión de tipos)."""
+        return {
+            'session_id': int(session['id']),
+            # Event info: solo la referencia; nombre, sede, idioma, etc. viven en agenda_events
+            'event_id': session.get('event_id'),
+            'session_name': str(session['session_name']),
+            'session_type': str(session['session_type']),
+            'track_name': str(session.get('track_name', '')),
+            'speakers_info': str(session.get('speakers_info', '')),
+            'speaker_names_only': str(session.get('speaker_names_only', '')),
+            'speaker_companies': str(session.get('speaker_companies', '')),
+            
+            # Temporal info (convertir a tipos JSON serializables)
+            'session_date': session['session_date'].isoformat() if session['session_date'] else None,
+            'start_time': session['start_time'].isoformat() if session['start_time'] else None,
+            'end_time': session['end_time'].isoformat() if session['end_time'] else None,
+            'start_hour': int(session.get('start_hour', 9)),
+            'start_minute': int(session.get('start_minute', 0)),
+            'duration_minutes': float(session.get('duration_minutes', 60.0)),
+            
+            # Location
+            'room_name': str(session.get('room_name', '')),
+            'room_code': str(session.get('room_code', '')),
+            'capacity': int(session.get('capacity', 200)),
+            
+            # Categorization
+            'session_tags': str(session.get('session_tags', '')),
+            # Array para filtros JSONB @> (ruta rápida de consultas estructuradas)
+            'tag_list': list(session.get('tag_list', [])),
+            'period_of_day': str(self._get_period_of_day(session.get('start_hour', 9))),
+            'duration_category': str(self._categorize_duration(float(session.get('duration_minutes', 60.0)))),
+            'suggested_level': str(self._suggest_level(session['session_name'])),
+            
+            # Resources
+            'has_slides': bool(session.get('slides_url')),
+            'has_repository': bool(session.get('repository_url')),
+            'slides_url': str(session.get('slides_url', '') if session.get('slides_url') else ''),
+            'repository_url': str(session.get('repository_url', '') if session.get('repository_url') else '')
+        }
+
+    def write_agenda_batch(self, texts: List[str], embeddings: List[List[float]],
+                           metadatas: List[Dict], doc_ids: List[str]):
+        """Escribir un lote de documentos ya codificados en el destino y confirmar su checkpoint."""
+        if self.shard.enabled:
+            # Marca de ejecución: el coordinador elimina las filas que ningún shard reescribió
+            for metadata in metadatas:
+                metadata[RUN_MARKER_KEY] = self.shard.run_id
+        
+        self.writer.add(texts, embeddings, metadatas, doc_ids)
+        # Si el pod muere entre la escritura y el checkpoint, el lote se reescribe (upsert por id)
+        if self.checkpoint_store and self.checkpoint:
+            self.checkpoint_store.commit(self.checkpoint, metadatas[-1]['session_id'], len(texts))
+
+    def export_agenda_snapshot(self, embeddings: np.ndarray, metadatas: List[Dict]):
+        """Exportar snapshot versionado (matriz .npy + metadata columnar) para búsqueda en proceso."""
+        try:
+            path = export_snapshot(
+                self.snapshot_dir,
+                ids=[m['session_id'] for m in metadatas],
+                embeddings=embeddings,
+                metadatas=metadatas,
+                model_name=self.embedding_model_name,
+                keep=self.snapshot_keep
+            )
+            logger.info(f"📦 Snapshot exportado en {path}")
+        except Exception as e:
+            # El snapshot es opcional: un fallo aquí no invalida los embeddings ya escritos
+            logger.error(f"❌ Error exportando snapshot: {e}")
 
     def _get_period_of_day(self, start_hour: int) -> str:
         """Determinar período del día."""
@@ -568,17 +797,16 @@ class SimpleAgendaEmbeddingsGenerator:
         """Probar búsquedas básicas."""
         logger.info("🧪 Probando búsquedas para agendas...")
         
-        test_queries = [
-            "agenda kubernetes",
-            "charlas mañana",
-            "sesiones seguridad",
-            "agenda devops",
-            "horarios disponibles"
-        ]
+        if self.query_lexicon:
+            plans = [self.query_lexicon.plan(q) for q in AGENDA_TEST_QUERIES]
+            for plan in plans:
+                logger.info(f"🧭 '{plan.query}': ruta {plan.route}, filtros {plan.filters}")
+            fast = sum(plan.pure for plan in plans)
+            logger.info(f"⚡ Ruta rápida (sin modelo): {fast}/{len(plans)} consultas de prueba")
         
-        for query in test_queries:
+        for query in AGENDA_TEST_QUERIES:
             try:
-                results = self.vector_store.similarity_search(query, k=3)
+                results = self.writer.similarity_search(query, k=3)
                 logger.info(f"🔍 '{query}': {len(results)} resultados")
                 
                 for i, doc in enumerate(results):
@@ -590,33 +818,298 @@ class SimpleAgendaEmbeddingsGenerator:
             except Exception as e:
                 logger.error(f"❌ Error probando '{query}': {e}")
 
+    def run_async_pipeline(self) -> Optional[int]:
+        """Ejecutar lectura → codificación → escritura como pipeline asyncio con colas acotadas."""
+        logger.info(
+            f"⚡ Modo pipeline asíncrono (chunk={self.pipeline_chunk_size}, cola={self.pipeline_queue_size})"
+        )
+        pipeline = AsyncAgendaPipeline(
+            self, chunk_size=self.pipeline_chunk_size, queue_size=self.pipeline_queue_size,
+            start_after_id=self.resume_after_id
+        )
+        try:
+            stats = pipeline.run()
+        except Exception as e:
+            logger.error(f"❌ Error en el pipeline asíncrono: {e}")
+            return None
+        
+        return stats['write'].items
+
+    def store_event_headers(self):
+        """Guardar los atributos de evento una vez por evento e informar del ahorro por documento."""
+        if self.footprint_sample:
+            texts, metadatas = (list(x) for x in zip(*self.footprint_sample))
+            client = getattr(self.embeddings_model, '_client', None)
+            tokenizer = getattr(client, 'tokenizer', None)
+            count_tokens = (lambda text: len(tokenizer(text)['input_ids'])) if tokenizer else None
+            logger.info("📉 Normalización de atributos del evento (antes -> ahora, por documento):")
+            log_footprint(
+                measure_footprint(
+                    [legacy_text(t, self.event_header) for t in texts],
+                    [merge_event_metadata(m, self.run_events, self.event_header) for m in metadatas],
+                    count_tokens,
+                ),
+                measure_footprint(texts, metadatas, count_tokens),
+                log=logger.info,
+            )
+        
+        if not isinstance(self.writer, (PGVectorWriter, PartitionedVectorStore)):
+            return
+        try:
+            events = self.scope_events()
+            if not events:
+                return
+            store = EventStore(self.dest_conninfo())
+            store.ensure_schema()
+            store.upsert(self.collection_name, events.values(), self.event_header)
+        except Exception as e:
+            logger.error(f"❌ Error guardando los atributos del evento: {e}")
+
+    def scope_events(self) -> Dict[int, Dict]:
+        """
+        Eventos del alcance (EVENT_IDS o todos) leídos de la fuente, no solo los vistos en este proceso:
+        tras una reanudación, los eventos confirmados antes del reinicio también necesitan su fila.
+        """
+        events = dict(self.run_events)
+        for event_id, event_name, location, venue_name, venue_address in self.source.fetch_events():
+            events.setdefault(event_id, event_record({
+                'event_id': event_id, 'event_name': event_name, 'location': location,
+                'venue_name': venue_name, 'venue_address': venue_address,
+            }))
+        return events
+
+    def refresh_query_lexicon(self, metadatas: Optional[List[Dict]] = None, collection_name: Optional[str] = None):
+        """Reconstruir el léxico de consultas estructuradas con los valores distintos del destino."""
+        collection_name = collection_name or self.collection_name
+        try:
+            if metadatas is None and isinstance(self.writer, InMemoryVectorStore):
+                metadatas = [m for _, m, _ in self.writer.documents.values()]
+            if isinstance(self.writer, PGVectorWriter):
+                self.query_lexicon = LexiconStore(self.dest_conninfo()).refresh(collection_name)
+            elif metadatas is not None:
+                self.query_lexicon = Lexicon.from_metadatas(metadatas)
+                if isinstance(self.writer, PartitionedVectorStore):
+                    LexiconStore(self.dest_conninfo()).save(collection_name, self.query_lexicon)
+            if self.query_lexicon:
+                logger.info(f"🧭 Léxico de consultas ({collection_name}): {len(self.query_lexicon.terms)} términos")
+        except Exception as e:
+            # Sin léxico todas las consultas van por búsqueda vectorial
+            logger.warning(f"⚠️ No se pudo actualizar el léxico de consultas: {e}")
+
+    def collection_matrix(self):
+        """(ids, vectores, metadatas) de la colección completa para los artefactos de fin de ejecución."""
+        if isinstance(self.writer, PGVectorWriter):
+            # Desde el destino: incluye los lotes escritos antes de una reanudación
+            with psycopg.connect(**self.dest_conninfo()) as conn:
+                ids, vectors, metadatas, _ = load_collection_vectors(conn, self.collection_name)
+            return ids, vectors, metadatas
+        if isinstance(self.writer, PartitionedVectorStore):
+            # Todos los eventos, no solo los de EVENT_IDS: el snapshot reemplaza el catálogo completo
+            events = sorted(set(self.writer.events()) | self.writer.touched_events)
+            parts = [self.writer.load_vectors(e) for e in events]
+            parts = [p for p in parts if len(p[0])]
+            if not parts:
+                return [], [], []
+            return (np.concatenate([p[0] for p in parts]), np.vstack([p[1] for p in parts]),
+                    [m for p in parts for m in p[2]])
+        if isinstance(self.writer, InMemoryVectorStore):
+            _, vectors = self.writer.matrix()
+            metadatas = [m for _, m, _ in self.writer.documents.values()]
+            return [m['session_id'] for m in metadatas], vectors, metadatas
+        return [], [], []
+
+    def store_centroids(self, ids, vectors, metadatas: List[Dict], collection_name: Optional[str] = None):
+        """Calcular y guardar los centroides de cada track y tag con sus sesiones miembro."""
+        try:
+            self.centroids = compute_centroids(ids, vectors, metadatas)
+            if isinstance(self.writer, (PGVectorWriter, PartitionedVectorStore)):
+                CentroidStore(self.dest_conninfo()).save(collection_name or self.collection_name, self.centroids)
+            tracks = sum(c.kind == TRACK for c in self.centroids)
+            logger.info(f"🎯 Centroides: {tracks} tracks, {len(self.centroids) - tracks} tags")
+        except Exception as e:
+            # Sin centroides la búsqueda sigue siendo plana
+            logger.warning(f"⚠️ No se pudieron calcular los centroides: {e}")
+
+    def store_neighbors(self, ids, vectors, metadatas: List[Dict], collection_name: Optional[str] = None):
+        """Precalcular las sesiones similares de cada sesión (X @ X.T por bloques) y guardarlas."""
+        if self.neighbors_k <= 0:
+            return
+        try:
+            started = time_module.time()
+            self.neighbors = compute_neighbors(
+                ids, vectors, k=self.neighbors_k, block_size=self.neighbors_block_size,
+                metadatas=metadatas
+            )
+            if isinstance(self.writer, (PGVectorWriter, PartitionedVectorStore)):
+                NeighborStore(self.dest_conninfo()).save(collection_name or self.collection_name, self.neighbors)
+            logger.info(
+                f"🤝 Sesiones similares: {len(self.neighbors)} filas (k={self.neighbors_k}) "
+                f"en {time_module.time() - started:.2f}s"
+            )
+        except Exception as e:
+            # Las recomendaciones pueden seguir usando búsqueda vectorial
+            logger.warning(f"⚠️ No se pudieron calcular las sesiones similares: {e}")
+
+    def partition_events(self) -> List[int]:
+        """Eventos de esta ejecución en almacenamiento particionado (incluye los escritos antes de reanudar)."""
+        if self.event_ids:
+            return sorted(self.event_ids)
+        return sorted(set(self.writer.events()) | self.writer.touched_events)
+
+    def event_collection_name(self, event_id: int) -> str:
+        """Clave de léxico, centroides y vecinos de un evento en almacenamiento particionado."""
+        return f"{self.collection_name}:event-{event_id}"
+
+    def store_collection_artifacts(self):
+        """
+        Léxico, centroides y vecinos a partir de la colección completa (una sola lectura de la matriz).
+        
+        Devuelve la matriz leída (ids, vectores, metadatas) para reutilizarla en el snapshot.
+        """
+        if isinstance(self.writer, PartitionedVectorStore):
+            # Por evento: reconstruir un evento no recalcula (ni mezcla) los artefactos de los demás
+            for event_id in self.partition_events():
+                try:
+                    ids, vectors, metadatas, _ = self.writer.load_vectors(event_id)
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo leer el evento {event_id}: {e}")
+                    continue
+                if not len(ids):
+                    continue
+                name = self.event_collection_name(event_id)
+                self.refresh_query_lexicon(metadatas, name)
+                self.store_centroids(ids, vectors, metadatas, name)
+                self.store_neighbors(ids, vectors, metadatas, name)
+            return
+
+        self.refresh_query_lexicon()
+        try:
+            ids, vectors, metadatas = self.collection_matrix()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo leer la colección para centroides y vecinos: {e}")
+            return None
+        if len(ids):
+            self.store_centroids(ids, vectors, metadatas)
+            self.store_neighbors(ids, vectors, metadatas)
+        return ids, vectors, metadatas
+
+    def finish_run(self, processed: int, elapsed_seconds: float):
+        """Exportar artefactos de fin de ejecución y cerrar el checkpoint con el resumen."""
+        self.store_event_headers()
+        matrix = None
+        if not self.shard.enabled:
+            matrix = self.store_collection_artifacts()
+        
+        if self.shard.enabled:
+            # Snapshot y registro de la ejecución completa los hace el coordinador
+            if self.shard_registry:
+                self.shard_registry.mark_done(self.shard, processed + self.shard_skipped)
+        elif self.snapshot_dir:
+            # Desde el destino y no desde memoria: incluye los lotes confirmados antes de una
+            # reanudación y no retiene los vectores de la ejecución fuera del presupuesto de memoria
+            try:
+                _, vectors, metadatas = matrix or self.collection_matrix()
+                self.export_agenda_snapshot(vectors, metadatas)
+            except Exception as e:
+                logger.error(f"❌ Error leyendo vectores para el snapshot: {e}")
+        
+        skipped = self.shard_skipped
+        logger.info(
+            f"📊 Resumen: {processed} sesiones procesadas, {skipped} omitidas por reanudación "
+            f"en {elapsed_seconds:.1f}s"
+        )
+        if self.checkpoint_store and self.checkpoint:
+            try:
+                self.checkpoint_store.complete(
+                    self.checkpoint, processed, elapsed_seconds, write_sync_log=not self.shard.enabled
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo cerrar el checkpoint {self.checkpoint.run_id}: {e}")
+
     def run(self):
         """Ejecutar el proceso completo."""
         logger.info("🚀 INICIANDO GENERACIÓN DE EMBEDDINGS SIMPLIFICADOS PARA AGENDAS")
         logger.info("=" * 70)
+        started = time_module.time()
+        logger.info(f"🧮 Memoria: {self.memory.describe()}")
+        self.cpu_monitor.start()
+        
+        # 0. Checkpoint: una ejecución reanudada no debe vaciar la colección
+        self.begin_checkpoint()
+        resumed = bool(self.checkpoint and self.checkpoint.resumed)
         
-        # 1. Inicializar vector store
-        if not self.initialize_vector_store():
+        if self.shard.enabled:
+            logger.info(f"🧩 Modo shard: {self.shard.label}, ejecución {self.shard.run_id}")
+            self.shard_registry = ShardRegistry(self.dest_conninfo())
+            self.shard_registry.ensure_schema()
+            self.shard_registry.mark_started(self.shard)
+        
+        # 1. Inicializar vector store (los shards nunca vacían la colección compartida)
+        if not self.initialize_vector_store(pre_delete_collection=not resumed and not self.shard.enabled):
             logger.error("❌ Falló la inicialización del vector store")
             return False
         
-        # 2. Obtener sesiones básicas
-        sessions = self.fetch_simple_sessions()
-        if not sessions:
+        # Una carga completa (o un shard de una) reemplaza la colección: el índice se
+        # construye una vez al final. Una reanudación decide por el tamaño del resto.
+        full_load = self.shard.enabled or not resumed
+        
+        if self.pipeline_mode == 'async':
+            # Modo asíncrono: lectura, codificación y escritura solapadas por chunks
+            self.prepare_index_for_load(full_load)
+            with self.memory.stage('pipeline'):
+                processed = self.run_async_pipeline()
+            if processed is None:
+                return False
+        else:
+            # 2. Obtener sesiones básicas
+            with self.memory.stage('fetch'):
+                sessions = self.fetch_simple_sessions()
+            if sessions is None:
+                # Un shard sin su lectura no se marca como completado: el Job lo reintenta y el
+                # coordinador no finaliza (finalize_run borraría las filas de esta parte)
+                return False
+            if not sessions and not self.shard.enabled:
+                logger.error("❌ No se pudieron obtener las sesiones")
+                return False
+            
+            if self.resume_after_id:
+                sessions = [s for s in sessions if s['id'] > self.resume_after_id]
+            
+            self.prepare_index_for_load(full_load, expected_rows=len(sessions))
+            
+            with self.memory.stage('enrich'):
+                # 3. Limpiar datos para evitar errores de serialización
+                sessions = self.clean_session_data(sessions)
+                
+                # 4. Agregar información de speakers
+                sessions = self.fetch_speakers_for_sessions(sessions)
+                
+                # 5. Agregar información de tags
+                sessions = self.fetch_tags_for_sessions(sessions)
+            
+            # 6. Procesar para agendas
+            with self.memory.stage('embed'):
+                processed = self.process_sessions_for_agenda(sessions)
+        
+        if processed == 0 and not resumed and not self.shard.enabled:
             logger.error("❌ No se pudieron obtener las sesiones")
             return False
         
-        # 3. Limpiar datos para evitar errores de serialización
-        sessions = self.clean_session_data(sessions)
+        # Los shards no construyen el índice: lo hace el coordinador cuando todos terminan
+        if not self.shard.enabled:
+            with self.memory.stage('index'):
+                self.finalize_index()
         
-        # 4. Agregar información de speakers
-        sessions = self.fetch_speakers_for_sessions(sessions)
+        with self.memory.stage('finish'):
+            self.finish_run(processed, time_module.time() - started)
         
-        # 5. Agregar información de tags
-        sessions = self.fetch_tags_for_sessions(sessions)
+        # Picos de RSS por etapa y ajustes de lote: base para dimensionar limits en k8s/job.yaml
+        self.memory.report()
+        self.cpu_monitor.report()
         
-        # 6. Procesar para agendas
-        self.process_sessions_for_agenda(sessions)
+        if self.shard.enabled:
+            logger.info(f"✅ {self.shard.label} completado")
+            return True
         
         # 7. Probar búsquedas
         self.test_agenda_search()
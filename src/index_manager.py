@@ -0,0 +1,236 @@
+"""
+HNSW index lifecycle around bulk loads
+
+Maintaining an HNSW graph row by row makes bulk inserts slow. For full or
+large loads the generator drops the index, loads, and builds it once with a
+generous ``maintenance_work_mem`` and parallel maintenance workers; small
+incremental deltas keep the existing index.
+
+``langchain_pg_embedding`` is shared by every LangChain collection in the
+database, so the generator manages a partial index per collection
+(``WHERE collection_id = '<uuid>'``): reloading one collection never drops
+the index other collections are searched with. Queries use it when they
+compare ``collection_id`` with a constant or bound parameter.
+"""
+
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import psycopg
+from psycopg import sql
+
+from .utils import DatabaseConnection, PostgresStore, format_bytes
+
+INDEX_MODES = ("auto", "rebuild", "keep", "off")
+
+DEFAULT_INDEX_NAME = "idx_langchain_embedding_hnsw"
+
+
+@dataclass
+class HnswParams:
+    """HNSW build and search parameters"""
+    m: int = 16
+    ef_construction: int = 64
+    ef_search: int = 40
+
+    @classmethod
+    def from_env(cls) -> "HnswParams":
+        return cls(
+            m=int(os.getenv("HNSW_M", "16")),
+            ef_construction=int(os.getenv("HNSW_EF_CONSTRUCTION", "64")),
+            ef_search=int(os.getenv("HNSW_EF_SEARCH", "40")),
+        )
+
+
+class HnswIndexManager(PostgresStore):
+    """
+    Drop, build and tune an HNSW index on a vector column.
+
+    Defaults target the LangChain PGVector embedding table written by the
+    generator; with ``collection_id`` the index is partial to that collection.
+    """
+
+    def __init__(
+        self,
+        conninfo: Dict[str, Any],
+        params: Optional[HnswParams] = None,
+        table: str = "langchain_pg_embedding",
+        column: str = "embedding",
+        index_name: str = DEFAULT_INDEX_NAME,
+        opclass: str = "vector_cosine_ops",
+        maintenance_work_mem: str = "1GB",
+        parallel_workers: int = 2,
+        collection_id: Optional[str] = None,
+        alter_column: bool = False,
+    ):
+        super().__init__(conninfo)
+        self.params = params or HnswParams()
+        self.table = table
+        self.column = column
+        self.index_name = index_name
+        self.opclass = opclass
+        self.maintenance_work_mem = maintenance_work_mem
+        self.parallel_workers = parallel_workers
+        self.collection_id = collection_id
+        self.alter_column = alter_column
+
+    @classmethod
+    def from_env(cls, conninfo: Dict[str, Any], **kwargs) -> "HnswIndexManager":
+        return cls(
+            conninfo,
+            params=HnswParams.from_env(),
+            maintenance_work_mem=os.getenv("HNSW_MAINTENANCE_WORK_MEM", "1GB"),
+            parallel_workers=int(os.getenv("HNSW_PARALLEL_WORKERS", "2")),
+            alter_column=os.getenv("HNSW_ALTER_COLUMN", "false").lower() == "true",
+            **kwargs,
+        )
+
+    @classmethod
+    def for_collection(cls, conninfo: Dict[str, Any], collection_name: str, **kwargs) -> "HnswIndexManager":
+        """
+        Partial index over one LangChain collection of ``langchain_pg_embedding``
+        """
+        with DatabaseConnection(conninfo).open() as conn:
+            row = conn.execute(
+                "SELECT uuid::text FROM langchain_pg_collection WHERE name = %s", (collection_name,)
+            ).fetchone()
+        if not row:
+            raise ValueError(f"Collection '{collection_name}' does not exist")
+        suffix = re.sub(r"\W+", "_", collection_name.lower())
+        return cls.from_env(
+            conninfo, index_name=f"{DEFAULT_INDEX_NAME}_{suffix}"[:63], collection_id=row[0], **kwargs
+        )
+
+    def exists(self) -> bool:
+        """
+        The index exists (and, for a partial index, covers the current collection id)
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT pg_get_indexdef(to_regclass(%s))", (self.index_name,)
+            ).fetchone()
+        if row[0] is None:
+            return False
+        # A reloaded collection gets a new uuid: the old partial index covers nothing
+        return self.collection_id is None or self.collection_id in row[0]
+
+    def index_size(self) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COALESCE(pg_relation_size(to_regclass(%s)), 0)", (self.index_name,)
+            ).fetchone()
+            return int(row[0])
+
+    def ensure_typed_column(self, dimension: int) -> bool:
+        """
+        HNSW needs a fixed dimension; type an untyped ``vector`` column if possible.
+
+        The column type is table-wide: it is only changed when every row of the
+        table (all collections) already has ``dimension`` components, and only with
+        ``alter_column`` (``HNSW_ALTER_COLUMN=true``). ``ALTER COLUMN ... TYPE`` takes
+        an ACCESS EXCLUSIVE lock and rewrites the whole shared table, blocking every
+        collection's reads and writes until it finishes.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a "
+                "WHERE a.attrelid = to_regclass(%s) AND a.attname = %s",
+                (self.table, self.column),
+            ).fetchone()
+            if not row:
+                return False
+            if row[0] != "vector":
+                return True
+            mismatched = conn.execute(
+                sql.SQL("SELECT count(*) FROM {} WHERE vector_dims({}) <> %s").format(
+                    sql.Identifier(self.table), sql.Identifier(self.column)
+                ),
+                (dimension,),
+            ).fetchone()[0]
+            if mismatched:
+                self.logger.warning(
+                    f"{self.table}.{self.column} holds {mismatched} row(s) of other dimensions "
+                    f"(other collections); leaving it untyped"
+                )
+                return False
+            if not self.alter_column:
+                self.logger.warning(
+                    f"{self.table}.{self.column} is untyped; set HNSW_ALTER_COLUMN=true to type it as "
+                    f"vector({dimension}) (rewrites the table under an ACCESS EXCLUSIVE lock)"
+                )
+                return False
+            try:
+                conn.execute(
+                    sql.SQL("ALTER TABLE {} ALTER COLUMN {} TYPE vector({})").format(
+                        sql.Identifier(self.table), sql.Identifier(self.column), sql.Literal(dimension)
+                    )
+                )
+                self.logger.info(f"Column {self.table}.{self.column} typed as vector({dimension})")
+                return True
+            except psycopg.Error as e:
+                self.logger.warning(f"Cannot type {self.table}.{self.column} as vector({dimension}): {e}")
+                return False
+
+    def drop(self):
+        with self._connect() as conn:
+            conn.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(self.index_name)))
+        self.logger.info(f"Dropped index {self.index_name} before bulk load")
+
+    def build(self) -> Tuple[float, int]:
+        """
+        Build the index once with tuned maintenance settings.
+
+        Returns ``(build_seconds, index_size_bytes)``; a no-op if the index exists.
+        """
+        statement = sql.SQL(
+            "CREATE INDEX IF NOT EXISTS {} ON {} USING hnsw ({} {}) "
+            "WITH (m = {}, ef_construction = {}){}"
+        ).format(
+            sql.Identifier(self.index_name),
+            sql.Identifier(self.table),
+            sql.Identifier(self.column),
+            sql.SQL(self.opclass),
+            sql.Literal(self.params.m),
+            sql.Literal(self.params.ef_construction),
+            sql.SQL(" WHERE collection_id = {}::uuid").format(sql.Literal(self.collection_id))
+            if self.collection_id else sql.SQL(""),
+        )
+        if self.collection_id and not self.exists():
+            # Stale partial index of a previous collection id
+            self.drop()
+        started = time.perf_counter()
+        with self._connect() as conn:
+            conn.execute(
+                "SELECT set_config('maintenance_work_mem', %s, false), "
+                "set_config('max_parallel_maintenance_workers', %s, false)",
+                (self.maintenance_work_mem, str(self.parallel_workers)),
+            )
+            conn.execute(statement)
+        elapsed = time.perf_counter() - started
+        size = self.index_size()
+        self.logger.info(
+            f"Built {self.index_name} (m={self.params.m}, ef_construction={self.params.ef_construction}, "
+            f"maintenance_work_mem={self.maintenance_work_mem}, workers={self.parallel_workers}) "
+            f"in {elapsed:.2f}s, size {format_bytes(size)}"
+        )
+        return elapsed, size
+
+    def set_default_ef_search(self) -> bool:
+        """
+        Persist ``hnsw.ef_search`` as the database default for new sessions
+        """
+        with self._connect() as conn:
+            try:
+                conn.execute(
+                    sql.SQL("ALTER DATABASE {} SET hnsw.ef_search = {}").format(
+                        sql.Identifier(self.conninfo["dbname"]), sql.Literal(self.params.ef_search)
+                    )
+                )
+            except psycopg.Error as e:
+                self.logger.warning(f"Cannot set default hnsw.ef_search: {e}")
+                return False
+        self.logger.info(f"Default hnsw.ef_search set to {self.params.ef_search}")
+        return True
@@ -0,0 +1,216 @@
+"""
+Memory budget governor with peak-RSS tracking and adaptive batch sizing
+
+Tracks resident memory per pipeline stage (optionally with ``tracemalloc``
+snapshots) and shrinks encode/write batch sizes when usage approaches
+``MEMORY_BUDGET_MB`` (capped by the cgroup memory limit), growing them back
+when there is headroom. Every decision is logged so pod limits can be
+right-sized from real runs.
+"""
+
+import os
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .utils import get_logger
+
+CGROUP_V2_LIMIT = "/sys/fs/cgroup/memory.max"
+CGROUP_V1_LIMIT = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+
+# cgroup v1 reports "unlimited" as a huge page-aligned number
+_UNLIMITED_BYTES = 1 << 60
+
+
+def _read_status_kb(field_name: str) -> Optional[float]:
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(field_name + ":"):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb() -> float:
+    """
+    Current resident set size of this process in MB
+    """
+    kb = _read_status_kb("VmRSS")
+    if kb is not None:
+        return kb / 1024
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size (since start or the last ``reset_peak_rss``) in MB
+    """
+    kb = _read_status_kb("VmHWM")
+    if kb is not None:
+        return kb / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the kernel's peak-RSS counter (Linux >= 4.0) so peaks can be measured per stage
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def cgroup_memory_limit_mb() -> Optional[float]:
+    """
+    Container memory limit from cgroup v2 or v1, or ``None`` when unlimited
+    """
+    for path in (CGROUP_V2_LIMIT, CGROUP_V1_LIMIT):
+        try:
+            with open(path, encoding="utf-8") as f:
+                raw = f.read().strip()
+        except OSError:
+            continue
+        if raw == "max":
+            return None
+        value = int(raw)
+        return None if value >= _UNLIMITED_BYTES else value / (1024 * 1024)
+    return None
+
+
+@dataclass
+class StageMemory:
+    """Memory observed during one stage"""
+    name: str
+    rss_start_mb: float = 0.0
+    rss_end_mb: float = 0.0
+    peak_rss_mb: float = 0.0
+    traced_peak_mb: Optional[float] = None
+    seconds: float = 0.0
+
+
+@dataclass
+class BatchDecision:
+    """A logged batch-size change"""
+    kind: str
+    old_size: int
+    new_size: int
+    rss_mb: float
+    budget_mb: float
+
+
+@dataclass
+class MemoryGovernor:
+    """
+    Adapt batch sizes to a memory budget and record per-stage memory.
+
+    ``budget_mb`` of 0 means "use 90% of the cgroup limit"; with neither a budget
+    nor a limit the governor only observes and never resizes batches.
+    """
+    budget_mb: float = 0.0
+    high_watermark: float = 0.85
+    low_watermark: float = 0.60
+    tracemalloc_enabled: bool = False
+    stages: List[StageMemory] = field(default_factory=list)
+    decisions: List[BatchDecision] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.logger = get_logger(self.__class__.__name__)
+        self.cgroup_limit_mb = cgroup_memory_limit_mb()
+        limits = [b for b in (self.budget_mb or None,
+                              self.cgroup_limit_mb * 0.9 if self.cgroup_limit_mb else None) if b]
+        self.effective_budget_mb: Optional[float] = min(limits) if limits else None
+        self._ceilings: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "MemoryGovernor":
+        return cls(
+            budget_mb=float(os.getenv("MEMORY_BUDGET_MB", "0")),
+            high_watermark=float(os.getenv("MEMORY_HIGH_WATERMARK", "0.85")),
+            low_watermark=float(os.getenv("MEMORY_LOW_WATERMARK", "0.60")),
+            tracemalloc_enabled=os.getenv("MEMORY_TRACEMALLOC", "false").lower() == "true",
+        )
+
+    def describe(self) -> str:
+        limit = f"{self.cgroup_limit_mb:.0f} MB" if self.cgroup_limit_mb else "none"
+        budget = f"{self.effective_budget_mb:.0f} MB" if self.effective_budget_mb else "observe only"
+        return f"memory budget {budget} (cgroup limit {limit}, requested {self.budget_mb:.0f} MB)"
+
+    def adjust(self, kind: str, batch_size: int, ceiling: Optional[int] = None) -> int:
+        """
+        Return the batch size to use next for ``kind`` ("encode", "write", ...).
+
+        Halves the size above the high watermark and doubles it (up to the
+        configured ``ceiling``) below the low watermark.
+        """
+        if ceiling:
+            self._ceilings.setdefault(kind, ceiling)
+        if not self.effective_budget_mb:
+            return batch_size
+
+        rss = current_rss_mb()
+        usage = rss / self.effective_budget_mb
+        new_size = batch_size
+        if usage >= self.high_watermark and batch_size > 1:
+            new_size = max(1, batch_size // 2)
+        elif usage <= self.low_watermark:
+            new_size = min(self._ceilings.get(kind, batch_size), batch_size * 2)
+
+        if new_size != batch_size:
+            self.decisions.append(BatchDecision(kind, batch_size, new_size, rss, self.effective_budget_mb))
+            self.logger.info(
+                f"{kind} batch {batch_size} -> {new_size} "
+                f"(RSS {rss:.0f} MB = {usage:.0%} of {self.effective_budget_mb:.0f} MB budget)"
+            )
+        return new_size
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Record RSS at start/end, the peak during the stage and optionally tracemalloc stats
+        """
+        record = StageMemory(name=name, rss_start_mb=current_rss_mb())
+        per_stage_peak = reset_peak_rss()
+        if self.tracemalloc_enabled:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - started
+            record.rss_end_mb = current_rss_mb()
+            record.peak_rss_mb = peak_rss_mb() if per_stage_peak else max(record.rss_start_mb, record.rss_end_mb)
+            if self.tracemalloc_enabled and tracemalloc.is_tracing():
+                record.traced_peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+                self._log_top_allocations(name)
+            self.stages.append(record)
+
+    def _log_top_allocations(self, stage_name: str, limit: int = 5):
+        snapshot = tracemalloc.take_snapshot()
+        for stat in snapshot.statistics("lineno")[:limit]:
+            self.logger.info(f"[{stage_name}] {stat}")
+
+    def report(self):
+        """
+        Log per-stage memory and the batch-size decisions of the run
+        """
+        self.logger.info(self.describe())
+        for s in self.stages:
+            traced = f" traced_peak={s.traced_peak_mb:.0f}MB" if s.traced_peak_mb is not None else ""
+            self.logger.info(
+                f"  {s.name:<10} rss {s.rss_start_mb:7.0f} -> {s.rss_end_mb:7.0f} MB, "
+                f"peak {s.peak_rss_mb:7.0f} MB, {s.seconds:7.2f}s{traced}"
+            )
+        overall = max([s.peak_rss_mb for s in self.stages] + [current_rss_mb()])
+        self.logger.info(
+            f"Peak RSS {overall:.0f} MB, {len(self.decisions)} batch-size adjustments"
+        )
@@ -0,0 +1,175 @@
+"""
+Precomputed "similar sessions" neighbor table
+
+At the end of each run the generator computes the top-k most similar
+sessions of every session with one blocked matrix multiply over the
+normalized embedding matrix (``X[block] @ X.T`` then ``argpartition``), so
+memory stays at ``block_size x n`` scores instead of ``n x n``. Each row is
+flagged when the neighbor overlaps the session in time, and the top-k
+non-overlapping neighbors are stored too, so readers pick either ranking at
+query time (skipping conflicts is useful for filling an agenda). The result
+is bulk-copied into ``session_neighbors``; "Sessions like this one" becomes a
+primary-key read::
+
+    SELECT neighbor_id, score FROM session_neighbors
+    WHERE collection_name = 'agenda_sessions' AND session_id = 5 ORDER BY rank LIMIT 10;
+
+    -- only sessions that can be attended as well
+    SELECT neighbor_id, score FROM session_neighbors
+    WHERE collection_name = 'agenda_sessions' AND session_id = 5 AND NOT conflict ORDER BY rank LIMIT 10;
+"""
+
+from datetime import date, time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import psycopg
+
+from .snapshot import normalize_rows
+from .utils import PostgresStore, get_logger, top_k
+
+NEIGHBORS_DDL = """
+CREATE TABLE IF NOT EXISTS session_neighbors (
+    collection_name VARCHAR(255) NOT NULL,
+    session_id INTEGER NOT NULL,
+    rank SMALLINT NOT NULL,
+    neighbor_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    conflict BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (collection_name, session_id, rank)
+);
+ALTER TABLE session_neighbors ADD COLUMN IF NOT EXISTS conflict BOOLEAN NOT NULL DEFAULT FALSE;
+"""
+
+# (session_id, neighbor_id, rank, score, conflict); rank starts at 1
+NeighborRow = Tuple[int, int, int, float, bool]
+
+logger = get_logger("neighbors")
+
+
+def _minutes(value: Any) -> float:
+    if not value:
+        return np.nan
+    parsed = value if isinstance(value, time) else time.fromisoformat(str(value))
+    return parsed.hour * 60 + parsed.minute
+
+
+def _day(value: Any) -> float:
+    if not value:
+        return np.nan
+    parsed = value if isinstance(value, date) else date.fromisoformat(str(value))
+    return float(parsed.toordinal())
+
+
+def time_slots(metadatas: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """
+    ``(day, start_minute, end_minute)`` per session; NaN where unknown
+    """
+    return np.asarray(
+        [(_day(m.get("session_date")), _minutes(m.get("start_time")), _minutes(m.get("end_time")))
+         for m in metadatas],
+        dtype=np.float64,
+    ).reshape(-1, 3)
+
+
+def conflicts(block: np.ndarray, slots: np.ndarray) -> np.ndarray:
+    """
+    Boolean ``len(block) x n`` mask of sessions overlapping in time (NaN never conflicts)
+    """
+    day, start, end = (slots[:, i][None, :] for i in range(3))
+    b_day, b_start, b_end = (block[:, i][:, None] for i in range(3))
+    return (b_day == day) & (b_start < end) & (start < b_end)
+
+
+def compute_neighbors(ids: Sequence[int], vectors: np.ndarray, k: int = 10, block_size: int = 1024,
+                      metadatas: Optional[Sequence[Dict[str, Any]]] = None) -> List[NeighborRow]:
+    """
+    All-pairs top-k by cosine, ``block_size`` query rows at a time
+
+    With ``metadatas`` each row carries a time-conflict flag and the top-k
+    non-conflicting neighbors are added after the plain top-k, ranked by score
+    in one sequence: the first k ranks are the plain ranking and the first k
+    rows with ``conflict = false`` are the conflict-free one.
+    """
+    n = len(ids)
+    k = min(k, n - 1)
+    if k <= 0:
+        return []
+    ids = np.asarray(ids, dtype=np.int64)
+    matrix = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    slots = time_slots(metadatas) if metadatas is not None else None
+
+    rows: List[NeighborRow] = []
+    for start in range(0, n, max(1, block_size)):
+        stop = min(start + block_size, n)
+        scores = matrix[start:stop] @ matrix.T
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        nearest = top_k(scores, k)
+        if slots is None:
+            overlaps = np.zeros_like(scores, dtype=bool)
+            candidates = nearest
+        else:
+            overlaps = conflicts(slots[start:stop], slots)
+            free = top_k(np.where(overlaps, -np.inf, scores), k)
+            candidates = np.concatenate([nearest, free], axis=1)
+        for offset, columns in enumerate(candidates):
+            session_id = int(ids[start + offset])
+            # Conflicting columns only count from the plain ranking; the rest of them pad a short free one
+            columns = [c for c in dict.fromkeys(columns.tolist())
+                       if (not overlaps[offset, c] or c in nearest[offset]) and not np.isneginf(scores[offset, c])]
+            columns.sort(key=lambda c: -scores[offset, c])
+            for rank, column in enumerate(columns, start=1):
+                rows.append((session_id, int(ids[column]), rank, float(scores[offset, column]),
+                             bool(overlaps[offset, column])))
+    return rows
+
+
+class NeighborStore(PostgresStore):
+    """
+    Bulk-write and read the neighbor table of a collection
+    """
+    DDL = NEIGHBORS_DDL
+
+    def save(self, collection_name: str, rows: Sequence[NeighborRow]) -> int:
+        self.ensure_schema()
+        with self._connect() as conn:
+            # Replace in one transaction: readers see the old or the new table, never a mix
+            conn.execute("DELETE FROM session_neighbors WHERE collection_name = %s", (collection_name,))
+            with conn.cursor() as cur:
+                with cur.copy(
+                    "COPY session_neighbors (collection_name, session_id, neighbor_id, rank, score, conflict) "
+                    "FROM STDIN"
+                ) as copy:
+                    for session_id, neighbor_id, rank, score, conflict in rows:
+                        copy.write_row((collection_name, session_id, neighbor_id, rank, score, conflict))
+        self.logger.info(f"Stored {len(rows)} neighbor row(s) for collection '{collection_name}'")
+        return len(rows)
+
+    def neighbors(self, collection_name: str, session_id: int, limit: int = 10,
+                  exclude_conflicts: bool = False) -> List[Tuple[int, float]]:
+        """
+        ``(neighbor_id, score)`` by rank: a primary-key range read
+
+        ``exclude_conflicts`` skips sessions that overlap this one in time.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT neighbor_id, score FROM session_neighbors "
+                "WHERE collection_name = %s AND session_id = %s "
+                + ("AND NOT conflict " if exclude_conflicts else "")
+                + "ORDER BY rank LIMIT %s",
+                (collection_name, session_id, limit),
+            ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
+    def refresh(self, conn: psycopg.Connection, collection_name: str, k: int = 10,
+                block_size: int = 1024) -> List[NeighborRow]:
+        """
+        Recompute the neighbors from the stored collection and save them
+        """
+        from .vector_db import load_collection_vectors
+
+        ids, vectors, metadatas, _ = load_collection_vectors(conn, collection_name)
+        rows = compute_neighbors(ids, vectors, k, block_size, metadatas)
+        self.save(collection_name, rows)
+        return rows
@@ -0,0 +1,270 @@
+"""
+Per-event partitioned vector storage
+
+With ``VECTOR_STORAGE=partitioned`` the generator writes sessions into
+``agenda_session_vectors``, a table partitioned by ``LIST (event_id)`` with
+one partition (``agenda_session_vectors_e<event_id>``) and one HNSW index per
+event. Each event is rebuilt on its own: a full load truncates only the
+partitions of the events it writes and rebuilds only their indexes, so adding
+a conference neither grows the indexes of the existing ones nor slows their
+rebuilds. Searches that name an event are pruned to its partition::
+
+    SELECT document, cmetadata, embedding <=> %s AS distance
+    FROM agenda_session_vectors WHERE event_id = 2
+    ORDER BY embedding <=> %s LIMIT 5;
+
+``python -m src.partitions list`` shows the partitions; ``drop <event_id>``
+removes one event without touching the rest.
+"""
+
+import argparse
+import os
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import psycopg
+from psycopg import sql
+
+from .index_manager import INDEX_MODES, HnswIndexManager
+from .storage import SearchHit, VectorWriter
+from .utils import PostgresStore, dest_conninfo, format_bytes, get_logger, safe_json_dumps, vector_literal
+
+PARENT_TABLE = "agenda_session_vectors"
+
+PARENT_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    event_id INTEGER NOT NULL,
+    id VARCHAR(255) NOT NULL,
+    session_id INTEGER NOT NULL,
+    document TEXT NOT NULL,
+    cmetadata JSONB NOT NULL,
+    embedding vector({dimension}) NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (event_id, id)
+) PARTITION BY LIST (event_id);
+
+-- Propagated to every partition: JSONB filters (the query router's fast path)
+CREATE INDEX IF NOT EXISTS {table}_cmetadata_gin ON {table} USING gin (cmetadata);
+"""
+
+logger = get_logger("partitions")
+
+
+def partition_name(event_id: int, table: str = PARENT_TABLE) -> str:
+    return f"{table}_e{int(event_id)}"
+
+
+class PartitionedVectorStore(PostgresStore, VectorWriter):
+    """
+    Vector writer over a table partitioned by ``event_id`` with per-partition HNSW indexes
+    """
+
+    def __init__(self, conninfo: Dict[str, Any], dimension: int,
+                 embed_query: Optional[Callable[[str], List[float]]] = None,
+                 table: str = PARENT_TABLE, index_mode: str = "auto"):
+        super().__init__(conninfo)
+        self.dimension = dimension
+        self.embed_query = embed_query
+        self.table = table
+        # HNSW_INDEX_MODE per partition: auto drops on a full reload, rebuild on any write, keep never
+        self.index_mode = index_mode if index_mode in INDEX_MODES else "auto"
+        # Events written by this run; with reset_on_write their partitions are emptied on first write
+        self.touched_events: Set[int] = set()
+        self.reset_on_write = False
+        self._partitions: Set[int] = set()
+
+    @property
+    def build_indexes(self) -> bool:
+        return self.index_mode != "off"
+
+    def index_manager(self, event_id: int) -> HnswIndexManager:
+        partition = partition_name(event_id, self.table)
+        return HnswIndexManager.from_env(self.conninfo, table=partition, index_name=f"{partition}_hnsw")
+
+    def _create_schema(self, conn: psycopg.Connection):
+        conn.execute(PARENT_DDL.format(table=self.table, dimension=int(self.dimension)))
+        self.check_dimension(conn)
+        self._partitions = set(self.events(conn))
+
+    def check_dimension(self, conn: psycopg.Connection):
+        """
+        Refuse a table created with another dimension (``IF NOT EXISTS`` keeps the old column type)
+        """
+        row = conn.execute(
+            "SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a "
+            "WHERE a.attrelid = to_regclass(%s) AND a.attname = 'embedding'",
+            (self.table,),
+        ).fetchone()
+        expected = f"vector({int(self.dimension)})"
+        if row and row[0] != expected:
+            raise ValueError(
+                f"{self.table}.embedding is {row[0]} but EMBEDDING_DIM is {self.dimension}; "
+                f"drop the table (or its partitions) to rebuild with {expected}"
+            )
+
+    def events(self, conn: Optional[psycopg.Connection] = None) -> List[int]:
+        """
+        Event ids that have a partition
+        """
+        query = (
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)"
+        )
+        if conn is None:
+            with self._connect() as own:
+                rows = own.execute(query, (self.table,)).fetchall()
+        else:
+            rows = conn.execute(query, (self.table,)).fetchall()
+        prefix = f"{self.table}_e"
+        return sorted(int(r[0][len(prefix):]) for r in rows if r[0].startswith(prefix))
+
+    def ensure_partition(self, conn: psycopg.Connection, event_id: int):
+        if event_id in self._partitions:
+            return
+        conn.execute(
+            sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({})").format(
+                sql.Identifier(partition_name(event_id, self.table)), sql.Identifier(self.table),
+                sql.Literal(int(event_id)),
+            )
+        )
+        self._partitions.add(event_id)
+        self.logger.info(f"Partition for event {event_id} ready")
+
+    def drop_index(self, conn: psycopg.Connection, event_id: int):
+        partition = partition_name(event_id, self.table)
+        conn.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(f"{partition}_hnsw")))
+
+    def reset_event(self, conn: psycopg.Connection, event_id: int):
+        """
+        Empty one event's partition before a full reload (and drop its index unless mode is keep/off)
+        """
+        self.ensure_partition(conn, event_id)
+        conn.execute(sql.SQL("TRUNCATE {}").format(sql.Identifier(partition_name(event_id, self.table))))
+        if self.index_mode in ("auto", "rebuild"):
+            self.drop_index(conn, event_id)
+        self.logger.info(f"Event {event_id}: partition truncated for rebuild")
+
+    def drop_event(self, event_id: int):
+        with self._connect() as conn:
+            conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(
+                sql.Identifier(partition_name(event_id, self.table))))
+        self._partitions.discard(event_id)
+        self.logger.info(f"Event {event_id}: partition dropped")
+
+    def add(self, texts, embeddings, metadatas, ids):
+        rows = []
+        for doc_id, text, embedding, metadata in zip(ids, texts, embeddings, metadatas):
+            event_id = metadata.get("event_id")
+            if event_id is None:
+                raise ValueError(f"Document {doc_id} has no event_id: it cannot be stored in a partitioned table")
+            rows.append((int(event_id), doc_id, int(metadata["session_id"]), text,
+                         safe_json_dumps(metadata), vector_literal(embedding)))
+        with self._connect() as conn:
+            for event_id in sorted({r[0] for r in rows} - self.touched_events):
+                if self.reset_on_write:
+                    self.reset_event(conn, event_id)
+                else:
+                    self.ensure_partition(conn, event_id)
+                    if self.index_mode == "rebuild":
+                        self.drop_index(conn, event_id)
+                self.touched_events.add(event_id)
+            with conn.cursor() as cur:
+                cur.executemany(
+                    sql.SQL(
+                        "INSERT INTO {} (event_id, id, session_id, document, cmetadata, embedding) "
+                        "VALUES (%s, %s, %s, %s, %s::jsonb, %s::vector) "
+                        "ON CONFLICT (event_id, id) DO UPDATE SET session_id = EXCLUDED.session_id, "
+                        "document = EXCLUDED.document, cmetadata = EXCLUDED.cmetadata, "
+                        "embedding = EXCLUDED.embedding, updated_at = CURRENT_TIMESTAMP"
+                    ).format(sql.Identifier(self.table)),
+                    rows,
+                )
+
+    def finalize_indexes(self, event_ids: Optional[Iterable[int]] = None):
+        """
+        Build the HNSW index of each partition (default: all of them) that lacks one
+
+        Not limited to ``touched_events``: a run that crashed after dropping an
+        event's index and committing all its rows never writes that event again
+        when resumed, yet its partition still needs the index.
+        """
+        if not self.build_indexes:
+            return
+        if event_ids is None:
+            event_ids = set(self.events()) | self.touched_events
+        for event_id in sorted(event_ids):
+            manager = self.index_manager(event_id)
+            if not manager.exists():
+                manager.build()
+
+    def search_by_vector(self, embedding: Sequence[float], k: int = 4, event_id: Optional[int] = None,
+                         filter: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        """
+        Cosine top-k; ``event_id`` prunes the scan to that event's partition and index
+        """
+        if filter and "event_id" in filter and event_id is None:
+            # An event filter becomes the partition key so the planner can prune
+            filter = dict(filter)
+            event_id = filter.pop("event_id")
+        where, params = [], []
+        if event_id is not None:
+            where.append("event_id = %s")
+            params.append(int(event_id))
+        if filter:
+            where.append("cmetadata @> %s::jsonb")
+            params.append(safe_json_dumps(filter))
+        query = sql.SQL(
+            "SELECT document, cmetadata, embedding <=> %s::vector AS distance FROM {} {} "
+            "ORDER BY embedding <=> %s::vector LIMIT %s"
+        ).format(sql.Identifier(self.table), sql.SQL("WHERE " + " AND ".join(where) if where else ""))
+        literal = vector_literal(embedding)
+        with self._connect() as conn:
+            rows = conn.execute(query, (literal, *params, literal, k)).fetchall()
+        return [SearchHit(r[0], r[1], 1.0 - float(r[2])) for r in rows]
+
+    def similarity_search(self, query: str, k: int = 4, event_id: Optional[int] = None) -> List[SearchHit]:
+        if self.embed_query is None:
+            raise ValueError("PartitionedVectorStore needs embed_query for text queries")
+        return self.search_by_vector(self.embed_query(query), k, event_id)
+
+    def load_vectors(self, event_id: int) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]], List[str]]:
+        """
+        ``(ids, vectors, metadatas, documents)`` of one event, ordered by session id
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                sql.SQL("SELECT session_id, embedding::real[], cmetadata, document FROM {} "
+                        "WHERE event_id = %s ORDER BY session_id").format(sql.Identifier(self.table)),
+                (int(event_id),),
+            ).fetchall()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), [], []
+        return (np.asarray([r[0] for r in rows], dtype=np.int64), np.asarray([r[1] for r in rows], dtype=np.float32),
+                [r[2] for r in rows], [r[3] for r in rows])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Per-event partitioned vector storage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Partitions with row counts and index sizes")
+    drop = sub.add_parser("drop", help="Drop one event's partition")
+    drop.add_argument("event_id", type=int)
+    args = parser.parse_args(argv)
+
+    store = PartitionedVectorStore(dest_conninfo(), int(os.getenv("EMBEDDING_DIM", "768")))
+    if args.command == "drop":
+        store.drop_event(args.event_id)
+        return 0
+    with store._connect() as conn:
+        for event_id in store.events(conn):
+            partition = partition_name(event_id)
+            rows = conn.execute(sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(partition))).fetchone()[0]
+            index = conn.execute("SELECT COALESCE(pg_relation_size(to_regclass(%s)), 0)",
+                                 (f"{partition}_hnsw",)).fetchone()[0]
+            print(f"event {event_id}: {rows} sessions, HNSW {format_bytes(index) if index else 'missing'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
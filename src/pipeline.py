@@ -0,0 +1,195 @@
+"""
+Asyncio pipeline overlapping source reads, encoding and vector writes
+
+Three stages connected by bounded queues:
+
+- read: keyset-paginated chunks from the generator's ``SourceReader``
+  (``psycopg.AsyncConnection`` for Postgres), enriched with speakers/tags and
+  turned into texts + metadata
+- encode: ``embed_documents`` in a dedicated executor thread
+- write: vector store writes in another executor thread
+
+While chunk N is encoded, chunk N+1 is fetched and chunk N-1 is written, so
+wall-clock time approaches the slowest stage instead of the sum of all three.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .utils import get_logger
+
+# CPUs the thread plan keeps for the threads that do not run torch: the event loop
+# (source reads and row conversion) and the write executor. The encode executor is the
+# thread torch runs on and is covered by the intra-op count.
+HELPER_CPUS = 1
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Busy/idle accounting for one pipeline stage"""
+    name: str
+    busy_seconds: float = 0.0
+    idle_seconds: float = 0.0
+    chunks: int = 0
+    items: int = 0
+
+    @property
+    def utilization(self) -> float:
+        total = self.busy_seconds + self.idle_seconds
+        return self.busy_seconds / total if total > 0 else 0.0
+
+
+@dataclass
+class EncodedChunk:
+    """A chunk of prepared documents moving through the pipeline"""
+    texts: List[str]
+    metadatas: List[Dict[str, Any]]
+    doc_ids: List[str]
+    embeddings: Optional[List[List[float]]] = None
+
+
+class AsyncAgendaPipeline:
+    """
+    Run the agenda generation as an overlapped read -> encode -> write pipeline.
+
+    ``generator`` is a ``SimpleAgendaEmbeddingsGenerator`` with its vector store
+    already initialized; its row mapping, enrichment, content and write helpers
+    are reused so both modes produce identical documents. Chunks are read in
+    session id order starting after ``start_after_id`` (a resumed checkpoint).
+    """
+
+    def __init__(self, generator, chunk_size: int = 64, queue_size: int = 2, start_after_id: int = 0):
+        self.generator = generator
+        self.start_after_id = start_after_id
+        self.chunk_size = max(1, chunk_size)
+        self.queue_size = max(1, queue_size)
+        self.stats = {name: StageStats(name) for name in ("read", "encode", "write")}
+        self.logger = get_logger(self.__class__.__name__)
+
+    def run(self) -> Dict[str, StageStats]:
+        """
+        Blocking entry point
+        """
+        return asyncio.run(self.run_async())
+
+    async def run_async(self) -> Dict[str, StageStats]:
+        encoded_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        write_q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        # One worker each: encode and write overlap with each other and with reads
+        encode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write")
+
+        start = time.perf_counter()
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self._read_stage(encoded_q))
+                group.create_task(self._encode_stage(encoded_q, write_q, encode_executor))
+                group.create_task(self._write_stage(write_q, write_executor))
+        finally:
+            encode_executor.shutdown(wait=True)
+            write_executor.shutdown(wait=True)
+
+        self.wall_seconds = time.perf_counter() - start
+        self.log_report()
+        return self.stats
+
+    async def _put(self, queue: asyncio.Queue, item: Any, stats: StageStats):
+        waited = time.perf_counter()
+        await queue.put(item)
+        stats.idle_seconds += time.perf_counter() - waited
+
+    async def _get(self, queue: asyncio.Queue, stats: StageStats) -> Any:
+        waited = time.perf_counter()
+        item = await queue.get()
+        stats.idle_seconds += time.perf_counter() - waited
+        return item
+
+    async def _read_stage(self, out_q: asyncio.Queue):
+        stats = self.stats["read"]
+        last_id = self.start_after_id
+        chunk_size = self.chunk_size
+
+        source = self.generator.source
+        try:
+            while True:
+                busy = time.perf_counter()
+                # Chunks en vuelo = memoria en vuelo: el gobernador los reduce cerca del presupuesto
+                chunk_size = self.generator.memory.adjust("write", chunk_size, ceiling=self.chunk_size)
+                rows, speaker_rows, tag_rows = await source.read_chunk_async(
+                    self.generator.shard, last_id, chunk_size
+                )
+                if not rows:
+                    stats.busy_seconds += time.perf_counter() - busy
+                    break
+
+                sessions = [self.generator.row_to_session(row) for row in rows]
+                sessions = self.generator.clean_session_data(sessions)
+                self.generator.attach_speakers(sessions, speaker_rows)
+                self.generator.attach_tags(sessions, tag_rows)
+                texts, metadatas, doc_ids = self.generator.prepare_agenda_documents(sessions)
+                last_id = sessions[-1]['id']
+
+                stats.busy_seconds += time.perf_counter() - busy
+                stats.chunks += 1
+                stats.items += len(texts)
+                await self._put(out_q, EncodedChunk(texts, metadatas, doc_ids), stats)
+        finally:
+            await source.aclose()
+
+        await self._put(out_q, _DONE, stats)
+
+    async def _encode_stage(self, in_q: asyncio.Queue, out_q: asyncio.Queue, executor):
+        stats = self.stats["encode"]
+        loop = asyncio.get_running_loop()
+        embed = self.generator.embed_texts
+
+        while True:
+            chunk = await self._get(in_q, stats)
+            if chunk is _DONE:
+                break
+            busy = time.perf_counter()
+            chunk.embeddings = await loop.run_in_executor(executor, embed, chunk.texts)
+            stats.busy_seconds += time.perf_counter() - busy
+            stats.chunks += 1
+            stats.items += len(chunk.texts)
+            await self._put(out_q, chunk, stats)
+
+        await self._put(out_q, _DONE, stats)
+
+    async def _write_stage(self, in_q: asyncio.Queue, executor):
+        stats = self.stats["write"]
+        loop = asyncio.get_running_loop()
+
+        while True:
+            chunk = await self._get(in_q, stats)
+            if chunk is _DONE:
+                break
+            busy = time.perf_counter()
+            await loop.run_in_executor(
+                executor, self.generator.write_agenda_batch,
+                chunk.texts, chunk.embeddings, chunk.metadatas, chunk.doc_ids
+            )
+            stats.busy_seconds += time.perf_counter() - busy
+            stats.chunks += 1
+            stats.items += len(chunk.texts)
+
+    def log_report(self):
+        """
+        Log per-stage busy/idle time next to total wall-clock time
+        """
+        busy_sum = sum(s.busy_seconds for s in self.stats.values())
+        self.logger.info(
+            f"Pipeline finished in {self.wall_seconds:.2f}s "
+            f"(sum of stage busy time: {busy_sum:.2f}s)"
+        )
+        for stats in self.stats.values():
+            self.logger.info(
+                f"  {stats.name:<6} busy={stats.busy_seconds:7.2f}s idle={stats.idle_seconds:7.2f}s "
+                f"util={stats.utilization:6.1%} chunks={stats.chunks} items={stats.items}"
+            )
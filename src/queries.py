@@ -0,0 +1,74 @@
+"""
+SQL queries against the source (events) database
+"""
+
+# Base session query without ORDER BY/WHERE, shared by the sync generator and the async pipeline
+SESSIONS_QUERY = """
+SELECT 
+    s.id,
+    s.session_name,
+    s.session_type,
+    s.session_date,
+    s.start_time,
+    s.end_time,
+    EXTRACT(EPOCH FROM (s.end_time - s.start_time))/60 as duration_minutes,
+    EXTRACT(HOUR FROM s.start_time) as start_hour,
+    EXTRACT(MINUTE FROM s.start_time) as start_minute,
+
+    -- Información del evento
+    e.event_name,
+    e.location,
+    e.venue_name,
+    e.venue_address,
+
+    -- Track
+    t.track_name,
+    t.track_description,
+
+    -- Ubicación
+    r.room_code,
+    r.room_name,
+    v.venue_name as sala_venue,
+    v.capacity,
+
+    -- URLs
+    s.slides_url,
+    s.repository_url,
+
+    -- Evento (atributos a nivel de evento en agenda_events)
+    s.event_id
+
+FROM schedules s
+LEFT JOIN events e ON s.event_id = e.id
+LEFT JOIN rooms r ON s.room_id = r.id
+LEFT JOIN venues v ON r.venue_id = v.id
+LEFT JOIN tracks t ON s.track_id = t.id
+"""
+
+SPEAKERS_QUERY = """
+SELECT 
+    ss.session_id,
+    sp.name,
+    sp.company
+FROM session_speakers ss
+JOIN speakers sp ON ss.speaker_id = sp.id
+WHERE ss.session_id = ANY(%s)
+ORDER BY ss.session_id, ss.speaker_order;
+"""
+
+TAGS_QUERY = """
+SELECT 
+    st.session_id,
+    tg.tag_name,
+    tg.tag_description
+FROM session_tags st
+JOIN tags tg ON st.tag_id = tg.id
+WHERE st.session_id = ANY(%s);
+"""
+
+# Events that have sessions; the readers add ``AND e.id = ANY(%s)`` for EVENT_IDS
+EVENTS_QUERY = """
+SELECT e.id, e.event_name, e.location, e.venue_name, e.venue_address
+FROM events e
+WHERE EXISTS (SELECT 1 FROM schedules s WHERE s.event_id = e.id)
+"""
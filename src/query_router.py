@@ -0,0 +1,359 @@
+"""
+Structured-query fast path
+
+Many agenda questions are filters in disguise ("charlas mañana", "workshops
+de la tarde", "sesiones de kubernetes"). They map onto metadata the generator
+already computes (``period_of_day``, ``session_type``, ``duration_category``,
+``suggested_level`` and the ``tag_list`` array), so the router compiles a
+lexicon from the distinct values stored in the collection and plans each query
+before touching the model:
+
+- pure filter (every word is a lexicon term or filler): answered by a JSONB
+  ``@>`` lookup on ``cmetadata`` (LangChain's GIN index), no encode;
+- mixed: the extracted filters are passed to the vector search;
+- no match: plain vector search.
+
+The lexicon is rebuilt at the end of every generation run and stored in
+``agenda_query_lexicon``. ``python -m src.query_router bench`` reports the
+fast-path hit rate and the latency it saves against vector search.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+import psycopg
+
+from .query_service import HELPER_CPUS, Histogram, QueryBatcher
+from .storage import SearchHit
+from .utils import PostgresStore, dest_conninfo, get_logger, safe_json_dumps
+
+FILTER_FIELDS = ("period_of_day", "session_type", "duration_category", "suggested_level")
+TAG_FIELD = "tag_list"
+
+LEXICON_DDL = """
+CREATE TABLE IF NOT EXISTS agenda_query_lexicon (
+    collection_name VARCHAR(255) PRIMARY KEY,
+    lexicon JSONB NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Distinct scalar values and array elements of the filterable metadata keys
+DISTINCT_VALUES_QUERY = """
+SELECT DISTINCT kv.key, COALESCE(t.value, kv.value #>> '{}') AS value
+FROM langchain_pg_embedding e
+JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+CROSS JOIN LATERAL jsonb_each(e.cmetadata) AS kv
+LEFT JOIN LATERAL jsonb_array_elements_text(
+    CASE WHEN jsonb_typeof(kv.value) = 'array' THEN kv.value END
+) AS t(value) ON true
+WHERE c.name = %s AND kv.key = ANY(%s) AND jsonb_typeof(kv.value) <> 'null'
+  AND kv.value <> '[]'::jsonb;
+"""
+
+# Spanish phrasings of stored values; an alias is only compiled when its value exists in the store
+ALIASES: Dict[str, Tuple[str, str]] = {
+    "medio dia": ("period_of_day", "mediodía"),
+    "workshop": ("session_type", "workshop"),
+    "workshops": ("session_type", "workshop"),
+    "taller": ("session_type", "workshop"),
+    "talleres": ("session_type", "workshop"),
+    "keynotes": ("session_type", "keynote"),
+    "magistral": ("session_type", "keynote"),
+    "magistrales": ("session_type", "keynote"),
+    "patrocinada": ("session_type", "sponsored"),
+    "patrocinadas": ("session_type", "sponsored"),
+    "cortas": ("duration_category", "Corta"),
+    "largas": ("duration_category", "Larga"),
+    "principiantes": ("suggested_level", "Principiante"),
+    "basico": ("suggested_level", "Principiante"),
+    "basicas": ("suggested_level", "Principiante"),
+    "avanzadas": ("suggested_level", "Avanzado"),
+    "k8s": (TAG_FIELD, "kubernetes"),
+    "seguridad": (TAG_FIELD, "security"),
+    "automatizacion": (TAG_FIELD, "automation"),
+    "observabilidad": (TAG_FIELD, "observability"),
+    "inteligencia artificial": (TAG_FIELD, "ia"),
+    "ai": (TAG_FIELD, "ia"),
+    "argo cd": (TAG_FIELD, "argocd"),
+    "ci/cd": (TAG_FIELD, "cicd"),
+    "edge": (TAG_FIELD, "edge-computing"),
+}
+
+# Words that carry no filter: attendees call every session a "charla"
+FILLER_WORDS = frozenset("""
+agenda charla charlas sesion sesiones horario horarios disponible disponibles evento
+de del la las el los en por para y o a al sobre con que hay cual cuales todas todos
+mi me ver quiero busco dame muestra lista
+""".split())
+
+logger = get_logger("query_router")
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase, strip accents and collapse whitespace (``Mañana`` -> ``manana``)
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.replace("-", " ").split())
+
+
+@dataclass
+class QueryPlan:
+    """How one query will be answered"""
+    query: str
+    filters: Dict[str, Any]
+    residual: List[str]
+
+    @property
+    def pure(self) -> bool:
+        """
+        Every word resolved to a filter or filler: no embedding needed.
+
+        A query of filler words only ("quiero ver") has nothing to filter on and
+        goes to the vector search instead of returning arbitrary rows.
+        """
+        return bool(self.filters) and not self.residual
+
+    @property
+    def route(self) -> str:
+        if self.pure:
+            return "filter"
+        return "filtered-vector" if self.filters else "vector"
+
+
+@dataclass
+class Lexicon:
+    """
+    Normalized term -> ``(metadata field, stored value)``
+    """
+    terms: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    _pattern: Optional[Pattern] = field(default=None, init=False, repr=False, compare=False)
+
+    @classmethod
+    def from_values(cls, values: Iterable[Tuple[str, Any]]) -> "Lexicon":
+        terms: Dict[str, Tuple[str, str]] = {}
+        stored = set()
+        for key, value in values:
+            if value in (None, ""):
+                continue
+            stored.add((key, str(value)))
+            term = normalize(str(value))
+            if term and term not in FILLER_WORDS:
+                terms.setdefault(term, (key, str(value)))
+        for alias, target in ALIASES.items():
+            if target in stored:
+                terms.setdefault(normalize(alias), target)
+        return cls(terms)
+
+    @classmethod
+    def from_metadatas(cls, metadatas: Iterable[Dict[str, Any]]) -> "Lexicon":
+        values = []
+        for metadata in metadatas:
+            values.extend((key, metadata.get(key)) for key in FILTER_FIELDS)
+            values.extend((TAG_FIELD, tag) for tag in metadata.get(TAG_FIELD) or [])
+        return cls.from_values(values)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Lexicon":
+        return cls({term: tuple(target) for term, target in data.get("terms", {}).items()})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"terms": {term: list(target) for term, target in sorted(self.terms.items())}}
+
+    @property
+    def pattern(self) -> Pattern:
+        if self._pattern is None:
+            # Longest terms first so "inteligencia artificial" wins over shorter overlaps
+            alternatives = "|".join(re.escape(t) for t in sorted(self.terms, key=len, reverse=True))
+            self._pattern = re.compile(rf"(?<![\w/])(?:{alternatives or '(?!)'})(?![\w/])")
+        return self._pattern
+
+    def plan(self, query: str) -> QueryPlan:
+        text = normalize(query)
+        scalars: Dict[str, set] = {}
+        tags: List[str] = []
+        for match in self.pattern.finditer(text):
+            key, value = self.terms[match.group(0)]
+            if key == TAG_FIELD:
+                if value not in tags:
+                    tags.append(value)
+            else:
+                scalars.setdefault(key, set()).add(value)
+        residual = [w for w in self.pattern.sub(" ", text).split() if w not in FILLER_WORDS]
+
+        filters: Dict[str, Any] = {}
+        for key, values in scalars.items():
+            if len(values) == 1:
+                filters[key] = next(iter(values))
+            else:
+                # "mañana o tarde" cannot be expressed with @>: leave it to the vector search
+                residual.append(key)
+        if tags:
+            filters[TAG_FIELD] = tags
+        return QueryPlan(query, filters, residual)
+
+
+class LexiconStore(PostgresStore):
+    """
+    Build the lexicon from the stored collection and persist it next to it
+    """
+    DDL = LEXICON_DDL
+
+    def refresh(self, collection_name: str) -> Lexicon:
+        """
+        Build the lexicon from a LangChain PGVector collection and save it
+        """
+        with self._connect() as conn:
+            rows = conn.execute(DISTINCT_VALUES_QUERY, (collection_name, list(FILTER_FIELDS) + [TAG_FIELD])).fetchall()
+        lexicon = Lexicon.from_values(rows)
+        self.save(collection_name, lexicon)
+        return lexicon
+
+    def save(self, collection_name: str, lexicon: Lexicon):
+        self.ensure_schema()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO agenda_query_lexicon (collection_name, lexicon) VALUES (%s, %s::jsonb) "
+                "ON CONFLICT (collection_name) DO UPDATE SET lexicon = EXCLUDED.lexicon, "
+                "updated_at = CURRENT_TIMESTAMP",
+                (collection_name, safe_json_dumps(lexicon.to_dict())),
+            )
+        self.logger.info(f"Query lexicon for '{collection_name}': {len(lexicon.terms)} terms")
+
+    def load(self, collection_name: str) -> Optional[Lexicon]:
+        with self._connect() as conn:
+            if not self._table_exists(conn, "agenda_query_lexicon"):
+                return None
+            row = conn.execute(
+                "SELECT lexicon FROM agenda_query_lexicon WHERE collection_name = %s", (collection_name,)
+            ).fetchone()
+        return Lexicon.from_dict(row[0]) if row else None
+
+
+class QueryRouter:
+    """
+    Plan each query with the lexicon and answer it through the cheapest path
+    """
+
+    def __init__(self, lexicon: Lexicon, batcher: QueryBatcher):
+        self.lexicon = lexicon
+        self.batcher = batcher
+        self.routes = {"filter": 0, "filtered-vector": 0, "vector": 0}
+        self.filter_ms = Histogram([0.5, 1, 2, 5, 10, 20, 50, 100])
+        self.vector_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+        self.logger = get_logger(self.__class__.__name__)
+
+    async def search(self, query: str, k: int = 4, event_id: Optional[int] = None) -> List[SearchHit]:
+        plan = self.lexicon.plan(query)
+        self.routes[plan.route] += 1
+        started = time.perf_counter()
+        if plan.pure:
+            hits = await self.batcher.lookup(plan.filters, k, event_id)
+            self.filter_ms.observe((time.perf_counter() - started) * 1000)
+        else:
+            hits = await self.batcher.search(query, k, plan.filters, event_id)
+            self.vector_ms.observe((time.perf_counter() - started) * 1000)
+        return hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = sum(self.routes.values())
+        return self.routes["filter"] / total if total else 0.0
+
+    def saved_ms(self, vector_ms: Optional[float] = None) -> Optional[float]:
+        """
+        Latency saved by the fast path, against ``vector_ms`` (default: the mean observed vector latency)
+        """
+        if vector_ms is None:
+            if not self.vector_ms.count:
+                return None
+            vector_ms = self.vector_ms.mean
+        return self.filter_ms.count * vector_ms - self.filter_ms.total
+
+    def log_stats(self, vector_ms: Optional[float] = None):
+        total = sum(self.routes.values())
+        self.logger.info(f"fast-path hit rate: {self.hit_rate:.1%} of {total} queries | routes: {self.routes}")
+        self.logger.info(self.filter_ms.format("filter ms"))
+        self.logger.info(self.vector_ms.format("vector ms"))
+        saved = self.saved_ms(vector_ms)
+        if saved is not None:
+            self.logger.info(f"latency saved: {saved:.1f} ms total "
+                             f"({saved / max(1, self.routes['filter']):.2f} ms per fast-path query)")
+
+
+async def bench(encoder, conninfo: Dict[str, Any], collection_name: str, lexicon: Lexicon,
+                queries: List[str], k: int):
+    """
+    Serve every query through vector search, then through the router, one at a time
+    """
+    async with QueryBatcher(encoder, conninfo, collection_name, window_ms=0, max_batch=1) as batcher:
+        await batcher.search(queries[0], k=k)  # warm-up
+        baseline = Histogram(batcher.latency_ms.bounds)
+        for query in queries:
+            started = time.perf_counter()
+            await batcher.search(query, k=k)
+            baseline.observe((time.perf_counter() - started) * 1000)
+        logger.info(baseline.format("vector-only ms"))
+
+        router = QueryRouter(lexicon, batcher)
+        for query in queries:
+            await router.search(query, k=k)
+        router.log_stats(vector_ms=baseline.mean)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Structured-query fast path")
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh = sub.add_parser("refresh", help="Rebuild the lexicon from the stored collection")
+    plan = sub.add_parser("plan", help="Show how queries would be routed")
+    plan.add_argument("queries", nargs="+")
+    bench_parser = sub.add_parser("bench", help="Fast-path hit rate and latency saved vs vector search")
+    bench_parser.add_argument("--synthetic", type=int, default=200)
+    bench_parser.add_argument("--k", type=int, default=5)
+    for sub_parser in (refresh, plan, bench_parser):
+        sub_parser.add_argument("--collection", default=os.getenv("PGVECTOR_COLLECTION_NAME", "agenda_sessions"))
+    args = parser.parse_args(argv)
+
+    conninfo = dest_conninfo()
+    store = LexiconStore(conninfo)
+    lexicon = store.refresh(args.collection) if args.command == "refresh" else store.load(args.collection)
+    if lexicon is None:
+        lexicon = store.refresh(args.collection)
+
+    if args.command == "plan":
+        for query in args.queries:
+            p = lexicon.plan(query)
+            print(json.dumps({"query": query, "route": p.route, "filters": p.filters, "residual": p.residual},
+                             ensure_ascii=False))
+    elif args.command == "bench":
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        from .benchmark_ann import synthetic_queries
+        from .cpu import apply_thread_plan, plan_threads
+        from .generate_embeddings import AGENDA_TEST_QUERIES
+        from .vector_db import load_collection_vectors
+
+        with psycopg.connect(**conninfo) as conn:
+            _, _, metadatas, documents = load_collection_vectors(conn, args.collection)
+        queries = list(AGENDA_TEST_QUERIES) + synthetic_queries(metadatas, documents, args.synthetic)
+        apply_thread_plan(plan_threads(reserved=HELPER_CPUS))
+        encoder = HuggingFaceEmbeddings(
+            model_name=os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/multi-qa-mpnet-base-dot-v1"),
+            encode_kwargs={"normalize_embeddings": True},
+        )
+        asyncio.run(bench(encoder, conninfo, args.collection, lexicon, queries, args.k))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""
+Micro-batching query-embedding service
+
+Concurrent chatbot searches are collected for a short window (``window_ms``)
+or until ``max_batch`` queries are waiting, encoded as one batch by a single
+warm model and answered with one SQL round-trip: every query vector is
+``unnest``-ed and a ``LATERAL`` subquery runs the per-query nearest-neighbour
+search (one HNSW scan each) inside the same statement.
+
+Queue depth, batch size and latency histograms are kept for tuning::
+
+    async with QueryBatcher(model, conninfo, "agenda_sessions") as batcher:
+        hits = await batcher.search("charlas de kubernetes por la mañana", k=5)
+        batcher.log_stats()
+
+Hits carry the full metadata: the event attributes kept once in
+``agenda_events`` are merged back into the k rows of each query. With
+``partitioned=True`` (``VECTOR_STORAGE=partitioned``) every query names its
+event and is pruned to that event's partition of ``agenda_session_vectors``.
+
+Passing ``store=`` (an :class:`~src.storage.InMemoryVectorStore`) instead of
+``conninfo`` answers the window in process, which is what the tests use.
+
+``python -m src.query_service bench`` compares batched and batch-of-1 serving
+under concurrent load.
+"""
+
+import argparse
+import asyncio
+import bisect
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import psycopg
+
+from .events import MERGED_METADATA_SQL
+from .partitions import PARENT_TABLE
+from .storage import InMemoryVectorStore, SearchHit
+from .utils import dest_conninfo, get_logger, safe_json_dumps, vector_literal
+
+# CPUs the thread plan keeps for the event loop (window collection and SQL); the
+# single "query-encode" executor thread is the one torch runs on
+HELPER_CPUS = 1
+
+# One statement for the whole window: q.ord keeps results grouped per query. The top-k runs
+# on the raw rows (HNSW scan per query); event attributes are merged into the k hits only
+BATCH_SEARCH_QUERY = f"""
+SELECT q.ord, e.document, {MERGED_METADATA_SQL} AS cmetadata, e.distance
+FROM unnest(%s::text[], %s::int[], %s::jsonb[]) WITH ORDINALITY AS q(embedding, k, filter, ord)
+CROSS JOIN LATERAL (
+    SELECT v.document, v.cmetadata, v.embedding <=> q.embedding::vector AS distance
+    FROM langchain_pg_embedding v
+    WHERE v.collection_id = %s::uuid
+      AND v.cmetadata @> q.filter
+    ORDER BY v.embedding <=> q.embedding::vector
+    LIMIT q.k
+) e
+LEFT JOIN agenda_events ev
+    ON ev.collection_name = %s AND ev.event_id = (e.cmetadata->>'event_id')::int
+ORDER BY q.ord, e.distance;
+"""
+
+# Same over the per-event partitions: q.event_id is a parameter of the nested loop, so
+# each query is pruned at run time to its event's partition and HNSW index
+PARTITIONED_BATCH_SEARCH_QUERY = f"""
+SELECT q.ord, e.document, {MERGED_METADATA_SQL} AS cmetadata, e.distance
+FROM unnest(%s::text[], %s::int[], %s::jsonb[], %s::int[])
+    WITH ORDINALITY AS q(embedding, k, filter, event_id, ord)
+CROSS JOIN LATERAL (
+    SELECT v.event_id, v.document, v.cmetadata, v.embedding <=> q.embedding::vector AS distance
+    FROM {PARENT_TABLE} v
+    WHERE v.event_id = q.event_id
+      AND v.cmetadata @> q.filter
+    ORDER BY v.embedding <=> q.embedding::vector
+    LIMIT q.k
+) e
+LEFT JOIN agenda_events ev ON ev.collection_name = %s AND ev.event_id = e.event_id
+ORDER BY q.ord, e.distance;
+"""
+
+# Pure metadata filters: served by the GIN index on cmetadata, no query vector
+FILTER_LOOKUP_QUERY = f"""
+SELECT e.document, {MERGED_METADATA_SQL} AS cmetadata
+FROM langchain_pg_embedding e
+LEFT JOIN agenda_events ev
+    ON ev.collection_name = %s AND ev.event_id = (e.cmetadata->>'event_id')::int
+WHERE e.collection_id = %s::uuid
+  AND e.cmetadata @> %s::jsonb
+ORDER BY e.cmetadata->>'session_date', e.cmetadata->>'start_time'
+LIMIT %s;
+"""
+
+PARTITIONED_FILTER_LOOKUP_QUERY = f"""
+SELECT e.document, {MERGED_METADATA_SQL} AS cmetadata
+FROM {PARENT_TABLE} e
+LEFT JOIN agenda_events ev ON ev.collection_name = %s AND ev.event_id = e.event_id
+WHERE e.event_id = %s
+  AND e.cmetadata @> %s::jsonb
+ORDER BY e.cmetadata->>'session_date', e.cmetadata->>'start_time'
+LIMIT %s;
+"""
+
+logger = get_logger("query_service")
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram (``bounds`` are inclusive upper edges, plus an overflow bucket)
+
+    Memory is constant for a long-running service: exact counts, sum and
+    buckets, plus a uniform reservoir of ``reservoir_size`` samples for the
+    percentiles.
+    """
+
+    def __init__(self, bounds: Sequence[float], reservoir_size: int = 4096):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.reservoir_size = reservoir_size
+        self.samples: List[float] = []
+        self._random = random.Random(0)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if len(self.samples) < self.reservoir_size:
+            self.samples.append(value)
+        else:
+            # Reservoir sampling: every observation is kept with probability reservoir_size / count
+            slot = self._random.randrange(self.count)
+            if slot < self.reservoir_size:
+                self.samples[slot] = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self.samples, q)) if self.samples else 0.0
+
+    def snapshot(self) -> Dict[str, int]:
+        labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return dict(zip(labels, self.counts))
+
+    def format(self, name: str) -> str:
+        if not self.count:
+            return f"{name}: no samples"
+        buckets = " ".join(f"{label}:{n}" for label, n in self.snapshot().items() if n)
+        return (f"{name}: n={self.count} mean={self.mean:.2f} p50={self.percentile(50):.2f} "
+                f"p99={self.percentile(99):.2f} | {buckets}")
+
+
+@dataclass
+class _PendingQuery:
+    query: str
+    k: int
+    filter: Dict[str, Any]
+    future: asyncio.Future
+    event_id: Optional[int] = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+_STOP = object()
+
+
+class QueryBatcher:
+    """
+    Own one warm encoder and serve concurrent ``search`` calls in micro-batches
+    """
+
+    def __init__(self, encoder, conninfo: Optional[Dict[str, Any]] = None,
+                 collection_name: str = "agenda_sessions", window_ms: float = 5.0, max_batch: int = 32,
+                 ef_search: Optional[int] = None, store: Optional[InMemoryVectorStore] = None,
+                 partitioned: bool = False):
+        if conninfo is None and store is None:
+            raise ValueError("QueryBatcher needs conninfo or an in-memory store")
+        self.encoder = encoder
+        self.conninfo = conninfo
+        self.store = store
+        self.collection_name = collection_name
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self.ef_search = ef_search
+        # VECTOR_STORAGE=partitioned: search agenda_session_vectors, one event per query
+        self.partitioned = partitioned and store is None
+        self.collection_id: Optional[str] = None
+        self.queue_depth = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128])
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.latency_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+        self.logger = get_logger(self.__class__.__name__)
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-encode")
+
+    @classmethod
+    def from_env(cls, encoder, conninfo: Optional[Dict[str, Any]] = None, **kwargs) -> "QueryBatcher":
+        return cls(
+            encoder, conninfo,
+            collection_name=kwargs.pop("collection_name", os.getenv("PGVECTOR_COLLECTION_NAME", "agenda_sessions")),
+            window_ms=float(os.getenv("QUERY_BATCH_WINDOW_MS", "5")),
+            max_batch=int(os.getenv("QUERY_BATCH_MAX", "32")),
+            ef_search=int(os.getenv("HNSW_EF_SEARCH", "0")) or None,
+            partitioned=kwargs.pop("partitioned", os.getenv("VECTOR_STORAGE", "collection").lower() == "partitioned"),
+            **kwargs,
+        )
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        if self.store is None:
+            self._conn = await psycopg.AsyncConnection.connect(**self.conninfo, autocommit=True)
+        if self._conn:
+            # Read-only path: agenda_events is created by the generator (EventStore.ensure_schema)
+            if not self.partitioned:
+                # A constant collection id lets the planner use the collection's partial HNSW index
+                cur = await self._conn.execute(
+                    "SELECT uuid::text FROM langchain_pg_collection WHERE name = %s", (self.collection_name,)
+                )
+                row = await cur.fetchone()
+                if not row:
+                    raise ValueError(f"Collection '{self.collection_name}' does not exist")
+                self.collection_id = row[0]
+        if self._conn and self.ef_search:
+            await self._conn.execute("SELECT set_config('hnsw.ef_search', %s, false)", (str(self.ef_search),))
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+        if self._conn:
+            await self._conn.close()
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> "QueryBatcher":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _scope(self, filter: Optional[Dict[str, Any]], event_id: Optional[int]):
+        """
+        ``(filter, event_id)``: partitioned storage takes the event out of the filter to prune by it
+        """
+        filter = dict(filter or {})
+        if not self.partitioned:
+            if event_id is not None:
+                filter["event_id"] = event_id
+            return filter, None
+        event_id = filter.pop("event_id", event_id)
+        if event_id is None:
+            raise ValueError("Partitioned storage needs an event_id for every query")
+        return filter, int(event_id)
+
+    async def search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                     event_id: Optional[int] = None) -> List[SearchHit]:
+        """
+        Nearest documents for ``query``; ``filter`` is a JSONB containment filter on the metadata
+        """
+        filter, event_id = self._scope(filter, event_id)
+        future = asyncio.get_running_loop().create_future()
+        self.queue_depth.observe(self._queue.qsize())
+        await self._queue.put(_PendingQuery(query, k, filter, future, event_id))
+        return await future
+
+    async def lookup(self, filter: Dict[str, Any], k: int = 4, event_id: Optional[int] = None) -> List[SearchHit]:
+        """
+        Documents matching ``filter`` in agenda order, without encoding anything
+        """
+        filter, event_id = self._scope(filter, event_id)
+        if self.store is not None:
+            return self.store.lookup(filter, k)
+        if self.partitioned:
+            cur = await self._conn.execute(
+                PARTITIONED_FILTER_LOOKUP_QUERY, (self.collection_name, event_id, safe_json_dumps(filter), k)
+            )
+        else:
+            cur = await self._conn.execute(
+                FILTER_LOOKUP_QUERY, (self.collection_name, self.collection_id, safe_json_dumps(filter), k)
+            )
+        return [SearchHit(document, metadata, 1.0) for document, metadata in await cur.fetchall()]
+
+    async def _collect(self, first: _PendingQuery) -> List[_PendingQuery]:
+        """
+        Gather queries until the window closes or the batch is full
+        """
+        loop = asyncio.get_running_loop()
+        batch = [first]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                item = self._queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                # Serve what is already collected, then stop
+                self._queue.put_nowait(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch = await self._collect(first)
+            self.batch_size.observe(len(batch))
+            try:
+                results = await self._answer(batch)
+                for pending, hits in zip(batch, results):
+                    if not pending.future.done():
+                        pending.future.set_result(hits)
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+            finished = time.perf_counter()
+            for pending in batch:
+                self.latency_ms.observe((finished - pending.enqueued_at) * 1000)
+
+    async def _answer(self, batch: List[_PendingQuery]) -> List[List[SearchHit]]:
+        loop = asyncio.get_running_loop()
+        vectors = await loop.run_in_executor(
+            self._executor, self.encoder.embed_documents, [p.query for p in batch]
+        )
+        if self.store is not None:
+            return [self.store.search_by_vector(v, p.k, p.filter) for v, p in zip(vectors, batch)]
+        literals = [vector_literal(v) for v in vectors]
+        params = [literals, [p.k for p in batch], [safe_json_dumps(p.filter) for p in batch]]
+        if self.partitioned:
+            cur = await self._conn.execute(
+                PARTITIONED_BATCH_SEARCH_QUERY, (*params, [p.event_id for p in batch], self.collection_name)
+            )
+        else:
+            cur = await self._conn.execute(BATCH_SEARCH_QUERY, (*params, self.collection_id, self.collection_name))
+        results: List[List[SearchHit]] = [[] for _ in batch]
+        for ord_, document, metadata, distance in await cur.fetchall():
+            results[ord_ - 1].append(SearchHit(document, metadata, 1.0 - float(distance)))
+        return results
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            "queue_depth": self.queue_depth.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "latency_ms": self.latency_ms.snapshot(),
+        }
+
+    def log_stats(self):
+        self.logger.info(self.queue_depth.format("queue depth"))
+        self.logger.info(self.batch_size.format("batch size"))
+        self.logger.info(self.latency_ms.format("latency ms"))
+
+
+async def _drive(batcher: QueryBatcher, queries: List[str], concurrency: int, k: int) -> float:
+    """
+    Send ``queries`` with ``concurrency`` clients; return the wall-clock seconds
+    """
+    cursor = iter(queries)
+
+    async def client():
+        for query in cursor:
+            await batcher.search(query, k=k)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def bench(encoder, conninfo: Dict[str, Any], collection_name: str, queries: List[str],
+                concurrency: int, k: int, window_ms: float, max_batch: int):
+    for label, window, size in (("batch-of-1", 0.0, 1), ("micro-batched", window_ms, max_batch)):
+        async with QueryBatcher(encoder, conninfo, collection_name, window, size) as batcher:
+            await batcher.search(queries[0], k=k)  # warm-up
+            batcher.latency_ms = Histogram(batcher.latency_ms.bounds)
+            elapsed = await _drive(batcher, queries, concurrency, k)
+            logger.info(f"{label}: {len(queries) / elapsed:.1f} queries/s "
+                        f"(window={window}ms, max_batch={size}, concurrency={concurrency})")
+            batcher.log_stats()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-batching query service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_parser = sub.add_parser("bench", help="Batched vs batch-of-1 serving under concurrent load")
+    bench_parser.add_argument("--collection", default=os.getenv("PGVECTOR_COLLECTION_NAME", "agenda_sessions"))
+    bench_parser.add_argument("--requests", type=int, default=512)
+    bench_parser.add_argument("--concurrency", type=int, default=32)
+    bench_parser.add_argument("--k", type=int, default=5)
+    bench_parser.add_argument("--window-ms", type=float, default=float(os.getenv("QUERY_BATCH_WINDOW_MS", "5")))
+    bench_parser.add_argument("--max-batch", type=int, default=int(os.getenv("QUERY_BATCH_MAX", "32")))
+    args = parser.parse_args(argv)
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    from .benchmark_ann import synthetic_queries
+    from .cpu import apply_thread_plan, plan_threads
+    from .generate_embeddings import AGENDA_TEST_QUERIES
+    from .vector_db import load_collection_vectors
+
+    conninfo = dest_conninfo()
+    with psycopg.connect(**conninfo) as conn:
+        _, _, metadatas, documents = load_collection_vectors(conn, args.collection)
+    queries = list(AGENDA_TEST_QUERIES) + synthetic_queries(metadatas, documents, args.requests)
+    queries = (queries * (args.requests // max(1, len(queries)) + 1))[:args.requests]
+
+    apply_thread_plan(plan_threads(reserved=HELPER_CPUS))
+    encoder = HuggingFaceEmbeddings(
+        model_name=os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/multi-qa-mpnet-base-dot-v1"),
+        encode_kwargs={"normalize_embeddings": True},
+    )
+    asyncio.run(bench(encoder, conninfo, args.collection, queries,
+                      args.concurrency, args.k, args.window_ms, args.max_batch))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Which slice of ``schedules`` a generation process owns
+
+Kept apart from :mod:`src.sharding` (the worker registry and the coordinator)
+so the source readers can filter by shard without importing the coordinator's
+dependencies.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Tuple
+
+import psycopg
+
+STRATEGIES = ("modulo", "range")
+
+
+@dataclass
+class ShardSpec:
+    """Which slice of ``schedules`` this process owns"""
+    index: int = 0
+    count: int = 1
+    strategy: str = "modulo"
+    run_id: str = ""
+
+    @classmethod
+    def from_env(cls) -> "ShardSpec":
+        spec = cls(
+            index=int(os.getenv("JOB_COMPLETION_INDEX", os.getenv("SHARD_INDEX", "0"))),
+            count=int(os.getenv("SHARD_COUNT", "1")),
+            strategy=os.getenv("SHARD_STRATEGY", "modulo").lower(),
+            run_id=os.getenv("SHARD_RUN_ID", ""),
+        )
+        spec.validate()
+        return spec
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 1
+
+    @property
+    def label(self) -> str:
+        return f"shard {self.index + 1}/{self.count} ({self.strategy})"
+
+    def validate(self):
+        if self.count < 1:
+            raise ValueError(f"SHARD_COUNT must be >= 1, got {self.count}")
+        if not 0 <= self.index < self.count:
+            raise ValueError(f"Shard index {self.index} out of range for SHARD_COUNT={self.count}")
+        if self.strategy not in STRATEGIES:
+            raise ValueError(f"Unknown SHARD_STRATEGY '{self.strategy}' (expected one of {STRATEGIES})")
+        if self.enabled and not self.run_id:
+            raise ValueError("SHARD_RUN_ID is required when SHARD_COUNT > 1")
+
+    def sql_filter(self, conn: psycopg.Connection, column: str = "s.id") -> Tuple[str, tuple]:
+        """
+        SQL predicate (without ``WHERE``) selecting this shard's rows, plus its params
+        """
+        if not self.enabled:
+            return "TRUE", ()
+        if self.strategy == "modulo":
+            return f"mod({column}, %s) = %s", (self.count, self.index)
+
+        low, high = conn.execute("SELECT min(id), max(id) FROM schedules").fetchone()
+        if low is None:
+            return "FALSE", ()
+        return (f"{column} >= %s AND {column} < %s", self.id_range(low, high))
+
+    def id_range(self, low: int, high: int) -> Tuple[int, int]:
+        """
+        Half-open ``[start, end)`` id range for this shard within ``[low, high]``
+        """
+        span = high - low + 1
+        size = -(-span // self.count)
+        start = low + self.index * size
+        return start, min(start + size, high + 1)
+
+    def contains(self, session_id: int, low: int, high: int) -> bool:
+        """
+        Python equivalent of ``sql_filter`` for sources without SQL (``[low, high]`` = all ids)
+        """
+        if not self.enabled:
+            return True
+        if self.strategy == "modulo":
+            return session_id % self.count == self.index
+        start, end = self.id_range(low, high)
+        return start <= session_id < end
@@ -0,0 +1,232 @@
+"""
+Sharded generation across Kubernetes Indexed Job completions
+
+Each worker reads ``JOB_COMPLETION_INDEX``/``SHARD_COUNT`` and only encodes its
+slice of ``schedules`` (``id % SHARD_COUNT = index`` or a contiguous id range).
+Workers upsert their documents and record shard completion in
+``embeddings_shards``; a coordinator then finalizes the run once every shard
+is done: stale rows are removed, the HNSW index is built, the snapshot is
+exported and a sync-log row is written.
+
+Locally the same flow runs as N processes::
+
+    python -m src.sharding local --shards 4
+    python -m src.sharding finalize --run-id <id>
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg
+
+from .centroids import CentroidStore
+from .index_manager import HnswIndexManager
+from .neighbors import NeighborStore
+from .query_router import LexiconStore
+from .shard_spec import STRATEGIES, ShardSpec
+from .snapshot import export_snapshot
+from .utils import PostgresStore, dest_conninfo, get_logger, safe_json_dumps
+from .vector_db import load_collection_vectors
+
+SHARDS_DDL = """
+CREATE TABLE IF NOT EXISTS embeddings_shards (
+    run_id VARCHAR(64) NOT NULL,
+    shard_index INTEGER NOT NULL,
+    shard_count INTEGER NOT NULL,
+    strategy VARCHAR(20) NOT NULL,
+    sessions_written INTEGER DEFAULT 0,
+    status VARCHAR(20) DEFAULT 'running',
+    started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (run_id, shard_index)
+);
+"""
+
+# Metadata key stamped on every document written by a sharded run
+RUN_MARKER_KEY = "generation_run"
+
+logger = get_logger("sharding")
+
+
+class ShardRegistry(PostgresStore):
+    """
+    Track shard completion for a sharded run in the vector database
+    """
+    DDL = SHARDS_DDL
+
+    def mark_started(self, spec: ShardSpec):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO embeddings_shards (run_id, shard_index, shard_count, strategy) "
+                "VALUES (%s, %s, %s, %s) "
+                "ON CONFLICT (run_id, shard_index) DO UPDATE SET status = 'running', finished_at = NULL",
+                (spec.run_id, spec.index, spec.count, spec.strategy),
+            )
+
+    def mark_done(self, spec: ShardSpec, sessions_written: int):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE embeddings_shards "
+                "SET status = 'completed', sessions_written = %s, finished_at = CURRENT_TIMESTAMP "
+                "WHERE run_id = %s AND shard_index = %s",
+                (sessions_written, spec.run_id, spec.index),
+            )
+
+    def status(self, run_id: str) -> List[Tuple[int, int, str, int]]:
+        """
+        ``(shard_index, shard_count, status, sessions_written)`` rows for a run
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT shard_index, shard_count, status, sessions_written FROM embeddings_shards "
+                "WHERE run_id = %s ORDER BY shard_index",
+                (run_id,),
+            ).fetchall()
+
+    def wait_for_completion(self, run_id: str, timeout_seconds: int = 0, poll_seconds: int = 10) -> List[Tuple]:
+        """
+        Block until every shard of ``run_id`` is completed (or the timeout expires)
+        """
+        deadline = time.time() + timeout_seconds
+        while True:
+            rows = self.status(run_id)
+            expected = rows[0][1] if rows else None
+            done = [r for r in rows if r[2] == "completed"]
+            if expected and len(done) == expected:
+                return rows
+            if time.time() >= deadline:
+                raise TimeoutError(
+                    f"Run {run_id}: {len(done)}/{expected or '?'} shards completed after {timeout_seconds}s"
+                )
+            self.logger.info(f"Run {run_id}: {len(done)}/{expected or '?'} shards completed, waiting...")
+            time.sleep(poll_seconds)
+
+
+def finalize_run(conninfo: Dict[str, Any], run_id: str, collection_name: str,
+                 wait_seconds: int = 0, snapshot_dir: str = "", snapshot_keep: int = 3,
+                 model_name: str = "", index_manager: Optional[HnswIndexManager] = None) -> int:
+    """
+    Coordinator step: verify all shards, drop stale rows, build the HNSW index,
+    export artifacts and log the run.
+
+    Returns the number of sessions written across shards.
+    """
+    started = time.time()
+    registry = ShardRegistry(conninfo)
+    rows = registry.wait_for_completion(run_id, timeout_seconds=wait_seconds)
+    total = sum(r[3] or 0 for r in rows)
+
+    with psycopg.connect(**conninfo) as conn:
+        deleted = conn.execute(
+            "DELETE FROM langchain_pg_embedding e USING langchain_pg_collection c "
+            "WHERE e.collection_id = c.uuid AND c.name = %s "
+            f"AND e.cmetadata->>'{RUN_MARKER_KEY}' IS DISTINCT FROM %s",
+            (collection_name, run_id),
+        ).rowcount
+        logger.info(f"Run {run_id}: {total} sessions from {len(rows)} shards, {deleted} stale rows removed")
+        conn.commit()
+
+        # Shards drop the collection's index before loading; it is built once here over all shards' rows
+        if index_manager:
+            index_manager.build()
+            index_manager.set_default_ef_search()
+
+        if snapshot_dir:
+            ids, vectors, metadatas, _ = load_collection_vectors(conn, collection_name)
+            export_snapshot(snapshot_dir, ids.tolist(), vectors, metadatas, model_name, keep=snapshot_keep)
+
+        # Shards skip the query lexicon, centroids and neighbors; they need the whole collection
+        try:
+            LexiconStore(conninfo).refresh(collection_name)
+            CentroidStore(conninfo).refresh(conn, collection_name)
+            neighbors_k = int(os.getenv("NEIGHBORS_K", "10"))
+            if neighbors_k > 0:
+                NeighborStore(conninfo).refresh(
+                    conn, collection_name, neighbors_k, int(os.getenv("NEIGHBORS_BLOCK_SIZE", "1024"))
+                )
+        except Exception as e:
+            logger.warning(f"Query lexicon/centroids/neighbors not refreshed: {e}")
+
+        conn.execute(
+            "INSERT INTO embeddings_sync_log "
+            "(table_name, records_processed, records_inserted, status, execution_time_seconds, metadata) "
+            "VALUES (%s, %s, %s, 'completed', %s, %s::jsonb)",
+            (collection_name, total, total, round(time.time() - started, 2),
+             safe_json_dumps({"run_id": run_id, "shards": len(rows), "stale_rows_deleted": deleted})),
+        )
+    return total
+
+
+def run_local(shards: int, strategy: str, run_id: Optional[str] = None) -> str:
+    """
+    Run ``shards`` generator processes locally, exactly as the Indexed Job would
+    """
+    run_id = run_id or f"local-{uuid.uuid4().hex[:8]}"
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(src_dir, "generate_embeddings.py")
+    pythonpath = os.pathsep.join(filter(None, [os.path.dirname(src_dir), os.getenv("PYTHONPATH")]))
+    processes = []
+    for index in range(shards):
+        env = dict(
+            os.environ,
+            JOB_COMPLETION_INDEX=str(index),
+            SHARD_COUNT=str(shards),
+            SHARD_STRATEGY=strategy,
+            SHARD_RUN_ID=run_id,
+            # The shards share this machine's CPUs: each sizes its thread pools to 1/N
+            CPU_SHARE_PROCESSES=str(shards),
+            PYTHONPATH=pythonpath,
+        )
+        processes.append(subprocess.Popen([sys.executable, script], env=env))
+    codes = [p.wait() for p in processes]
+    failed = [i for i, code in enumerate(codes) if code != 0]
+    if failed:
+        raise RuntimeError(f"Run {run_id}: shards {failed} failed")
+    return run_id
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sharded embeddings generation")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    local = sub.add_parser("local", help="Run N shard processes locally, then finalize")
+    local.add_argument("--shards", type=int, default=int(os.getenv("SHARD_COUNT", "2")))
+    local.add_argument("--strategy", choices=STRATEGIES, default=os.getenv("SHARD_STRATEGY", "modulo"))
+    local.add_argument("--run-id", default=os.getenv("SHARD_RUN_ID") or None)
+
+    finalize = sub.add_parser("finalize", help="Coordinator step after all shards completed")
+    finalize.add_argument("--run-id", default=os.getenv("SHARD_RUN_ID"))
+    finalize.add_argument("--wait-seconds", type=int, default=int(os.getenv("SHARD_FINALIZE_WAIT_SECONDS", "0")))
+
+    args = parser.parse_args(argv)
+    collection_name = os.getenv("PGVECTOR_COLLECTION_NAME", "agenda_sessions")
+    if os.getenv("VECTOR_STORAGE", "collection").lower() == "partitioned":
+        # finalize_run cleans and indexes the PGVector collection, not agenda_session_vectors
+        parser.error("VECTOR_STORAGE=partitioned does not support sharded runs")
+
+    if args.command == "local":
+        run_id = run_local(args.shards, args.strategy, args.run_id)
+    else:
+        if not args.run_id:
+            parser.error("--run-id (or SHARD_RUN_ID) is required")
+        run_id = args.run_id
+
+    finalize_run(
+        dest_conninfo(), run_id, collection_name,
+        wait_seconds=getattr(args, "wait_seconds", 0),
+        snapshot_dir=os.getenv("SNAPSHOT_DIR", ""),
+        snapshot_keep=int(os.getenv("SNAPSHOT_KEEP", "3")),
+        model_name=os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/multi-qa-mpnet-base-dot-v1"),
+        index_manager=None if os.getenv("HNSW_INDEX_MODE", "auto").lower() == "off"
+        else HnswIndexManager.for_collection(dest_conninfo(), collection_name),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
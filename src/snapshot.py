@@ -0,0 +1,222 @@
+"""
+Memory-mapped agenda snapshots for in-process search
+
+A snapshot is a versioned directory with:
+
+- ``vectors.npy``: contiguous float32 matrix of L2-normalized embeddings
+- ``ids.npy``: int64 session ids, row-aligned with ``vectors.npy``
+- ``metadata.json``: columnar metadata (one list per field)
+- ``manifest.json``: model, dimension, row count and format version
+
+The snapshot root holds a ``CURRENT`` file naming the active version, so
+readers never observe a half-written export.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .utils import get_logger, top_k
+
+FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "ids.npy"
+METADATA_FILE = "metadata.json"
+MANIFEST_FILE = "manifest.json"
+
+logger = get_logger("snapshot")
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row, leaving all-zero rows untouched
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def to_columns(rows: Sequence[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Convert a list of metadata dicts to a dict of equally long columns
+    """
+    fields: List[str] = []
+    for row in rows:
+        for key in row:
+            if key not in fields:
+                fields.append(key)
+    return {field: [row.get(field) for row in rows] for field in fields}
+
+
+def export_snapshot(
+    directory: str,
+    ids: Sequence[int],
+    embeddings: Sequence[Sequence[float]],
+    metadatas: Sequence[Dict[str, Any]],
+    model_name: str,
+    keep: int = 3,
+) -> str:
+    """
+    Write a new snapshot version under ``directory`` and make it current.
+
+    Returns the path of the written version.
+    """
+    if not (len(ids) == len(embeddings) == len(metadatas)):
+        raise ValueError("ids, embeddings and metadatas must have the same length")
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if not len(ids):
+        # No rows still makes a loadable (2-D) snapshot whose searches return nothing
+        matrix = matrix.reshape(0, 0)
+    vectors = np.ascontiguousarray(normalize_rows(matrix), dtype=np.float32)
+    id_array = np.asarray(ids, dtype=np.int64)
+
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("v%Y%m%dT%H%M%S%fZ")
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=directory)
+    try:
+        np.save(os.path.join(staging, VECTORS_FILE), vectors)
+        np.save(os.path.join(staging, IDS_FILE), id_array)
+        with open(os.path.join(staging, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump({"count": len(ids), "columns": to_columns(metadatas)}, f, ensure_ascii=False)
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "model_name": model_name,
+            "dimension": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "count": len(ids),
+            "normalized": True,
+        }
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        target = os.path.join(directory, version)
+        os.rename(staging, target)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    pointer_tmp = os.path.join(directory, f".{CURRENT_FILE}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(directory, CURRENT_FILE))
+
+    prune_snapshots(directory, keep)
+    logger.info(f"Snapshot {version} exported ({len(ids)} rows) to {directory}")
+    return target
+
+
+def list_versions(directory: str) -> List[str]:
+    """
+    List snapshot versions in ``directory``, oldest first
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name for name in os.listdir(directory)
+        if name.startswith("v") and os.path.isfile(os.path.join(directory, name, MANIFEST_FILE))
+    )
+
+
+def prune_snapshots(directory: str, keep: int):
+    """
+    Remove all but the ``keep`` most recent versions (never the current one)
+    """
+    if keep <= 0:
+        return
+    current = read_current_version(directory)
+    for version in list_versions(directory)[:-keep]:
+        if version != current:
+            shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+def read_current_version(directory: str) -> Optional[str]:
+    """
+    Return the version named by ``CURRENT``, if any
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class AgendaSnapshot:
+    """
+    Read-only, memory-mapped view of an exported snapshot.
+
+    The vector matrix is opened with ``mmap_mode='r'`` so worker processes
+    loading the same version share pages through the OS page cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest: Dict[str, Any] = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format: {self.manifest.get('format_version')}")
+
+        self.vectors: np.ndarray = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        self.ids: np.ndarray = np.load(os.path.join(path, IDS_FILE), mmap_mode="r")
+        with open(os.path.join(path, METADATA_FILE), encoding="utf-8") as f:
+            self.columns: Dict[str, List[Any]] = json.load(f)["columns"]
+        self._row_by_id = {int(session_id): row for row, session_id in enumerate(self.ids)}
+
+    @classmethod
+    def load(cls, directory: str, version: Optional[str] = None) -> "AgendaSnapshot":
+        """
+        Open ``version`` (default: the current one) from a snapshot root
+        """
+        version = version or read_current_version(directory)
+        if not version:
+            raise FileNotFoundError(f"No snapshot found in {directory}")
+        return cls(os.path.join(directory, version))
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        """
+        Rebuild the metadata dict of a single row
+        """
+        return {field: values[row] for field, values in self.columns.items()}
+
+    def get(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Look up a session's metadata by id
+        """
+        row = self._row_by_id.get(int(session_id))
+        return None if row is None else self.metadata(row)
+
+    def search(self, query_embedding: Sequence[float], k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Exact top-k by cosine similarity: one mat-vec plus ``argpartition``
+        """
+        n = len(self)
+        if n == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self.vectors @ query
+        return [
+            {
+                "session_id": int(self.ids[row]),
+                "score": float(scores[row]),
+                "metadata": self.metadata(int(row)),
+            }
+            for row in top_k(scores, k)
+        ]
@@ -0,0 +1,420 @@
+"""
+Pluggable source readers and vector writers
+
+The generator reads sessions through a ``SourceReader`` and writes encoded
+documents through a ``VectorWriter``. Production uses Postgres for both
+(``PostgresSourceReader`` and ``PGVectorWriter``); ``SQLiteSourceReader``
+(seeded from ``sql/02-test-data.sql``) and ``InMemoryVectorStore`` let the
+content-building and encode paths run, be profiled and be tested without any
+database server.
+
+Readers return rows in the column order of ``SESSIONS_QUERY``,
+``SPEAKERS_QUERY`` and ``TAGS_QUERY`` so the generator's row mapping is shared
+by every backend.
+"""
+
+import asyncio
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import psycopg
+
+from .queries import EVENTS_QUERY, SESSIONS_QUERY, SPEAKERS_QUERY, TAGS_QUERY
+from .shard_spec import ShardSpec
+from .snapshot import normalize_rows
+from .utils import get_logger, top_k
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+TEST_DATA_SQL = os.path.join(SQL_DIR, "02-test-data.sql")
+
+# (session rows, speaker rows, tag rows) for one chunk of sessions
+Chunk = Tuple[List[tuple], List[tuple], List[tuple]]
+
+
+class SourceReader(ABC):
+    """
+    Read sessions, speakers and tags from the events database
+
+    ``event_ids`` (when set) restricts every session read to those events, so
+    one event can be rebuilt without reading the others.
+    """
+
+    event_ids: Optional[Tuple[int, ...]] = None
+
+    @abstractmethod
+    def fetch_sessions(self, shard: ShardSpec) -> List[tuple]:
+        """All sessions of ``shard`` ordered by date, start time and id"""
+
+    @abstractmethod
+    def fetch_sessions_after(self, shard: ShardSpec, after_id: int, limit: int) -> List[tuple]:
+        """Up to ``limit`` sessions of ``shard`` with ``id > after_id``, ordered by id"""
+
+    @abstractmethod
+    def fetch_speakers(self, session_ids: Sequence[int]) -> List[tuple]:
+        """``(session_id, name, company)`` rows ordered by session and speaker order"""
+
+    @abstractmethod
+    def fetch_tags(self, session_ids: Sequence[int]) -> List[tuple]:
+        """``(session_id, tag_name, tag_description)`` rows"""
+
+    @abstractmethod
+    def fetch_events(self) -> List[tuple]:
+        """``(event_id, event_name, location, venue_name, venue_address)`` of the events with sessions"""
+
+    def read_chunk(self, shard: ShardSpec, after_id: int, limit: int) -> Chunk:
+        rows = self.fetch_sessions_after(shard, after_id, limit)
+        if not rows:
+            return [], [], []
+        session_ids = [row[0] for row in rows]
+        return rows, self.fetch_speakers(session_ids), self.fetch_tags(session_ids)
+
+    async def read_chunk_async(self, shard: ShardSpec, after_id: int, limit: int) -> Chunk:
+        """
+        Async variant used by the pipeline; defaults to the sync read in a worker thread
+        """
+        return await asyncio.to_thread(self.read_chunk, shard, after_id, limit)
+
+    async def aclose(self):
+        """
+        Release resources opened by ``read_chunk_async``
+        """
+
+
+class PostgresSourceReader(SourceReader):
+    """
+    Production reader over the events Postgres database
+    """
+
+    def __init__(self, conninfo: Dict[str, Any]):
+        self.conninfo = conninfo
+        self.logger = get_logger(self.__class__.__name__)
+        self._async_conn: Optional[psycopg.AsyncConnection] = None
+        self._shard_filters: Dict[tuple, Tuple[str, tuple]] = {}
+
+    def connect(self) -> psycopg.Connection:
+        self.logger.info(f"Connecting to source DB {self.conninfo['host']}:{self.conninfo['port']}/{self.conninfo['dbname']}")
+        return psycopg.connect(**self.conninfo)
+
+    def _filter_key(self, shard: ShardSpec) -> tuple:
+        return (shard.index, shard.count, shard.strategy, self.event_ids)
+
+    def _shard_filter(self, conn: psycopg.Connection, shard: ShardSpec) -> Tuple[str, tuple]:
+        # Range shards need min/max(id): resolve once per reader
+        key = self._filter_key(shard)
+        if key not in self._shard_filters:
+            predicate, params = shard.sql_filter(conn)
+            if self.event_ids:
+                predicate, params = f"({predicate}) AND s.event_id = ANY(%s)", (*params, list(self.event_ids))
+            self._shard_filters[key] = (predicate, params)
+        return self._shard_filters[key]
+
+    def fetch_sessions(self, shard: ShardSpec) -> List[tuple]:
+        with self.connect() as conn:
+            predicate, params = self._shard_filter(conn, shard)
+            query = SESSIONS_QUERY + f"WHERE {predicate} ORDER BY s.session_date, s.start_time, s.id;"
+            return conn.execute(query, params).fetchall()
+
+    def fetch_sessions_after(self, shard: ShardSpec, after_id: int, limit: int) -> List[tuple]:
+        with self.connect() as conn:
+            predicate, params = self._shard_filter(conn, shard)
+            query = SESSIONS_QUERY + f"WHERE s.id > %s AND ({predicate}) ORDER BY s.id LIMIT %s"
+            return conn.execute(query, (after_id, *params, limit)).fetchall()
+
+    def fetch_speakers(self, session_ids: Sequence[int]) -> List[tuple]:
+        with self.connect() as conn:
+            return conn.execute(SPEAKERS_QUERY, (list(session_ids),)).fetchall()
+
+    def fetch_tags(self, session_ids: Sequence[int]) -> List[tuple]:
+        with self.connect() as conn:
+            return conn.execute(TAGS_QUERY, (list(session_ids),)).fetchall()
+
+    def fetch_events(self) -> List[tuple]:
+        with self.connect() as conn:
+            if self.event_ids:
+                return conn.execute(EVENTS_QUERY + "AND e.id = ANY(%s) ORDER BY e.id",
+                                    (list(self.event_ids),)).fetchall()
+            return conn.execute(EVENTS_QUERY + "ORDER BY e.id").fetchall()
+
+    def read_chunk(self, shard: ShardSpec, after_id: int, limit: int) -> Chunk:
+        with self.connect() as conn:
+            predicate, params = self._shard_filter(conn, shard)
+            query = SESSIONS_QUERY + f"WHERE s.id > %s AND ({predicate}) ORDER BY s.id LIMIT %s"
+            rows = conn.execute(query, (after_id, *params, limit)).fetchall()
+            if not rows:
+                return [], [], []
+            session_ids = [row[0] for row in rows]
+            return (rows, conn.execute(SPEAKERS_QUERY, (session_ids,)).fetchall(),
+                    conn.execute(TAGS_QUERY, (session_ids,)).fetchall())
+
+    async def read_chunk_async(self, shard: ShardSpec, after_id: int, limit: int) -> Chunk:
+        """
+        Keyset-paginated read over one ``AsyncConnection`` kept open across chunks
+        """
+        key = self._filter_key(shard)
+        if key not in self._shard_filters:
+            with psycopg.connect(**self.conninfo) as sync_conn:
+                self._shard_filter(sync_conn, shard)
+        predicate, params = self._shard_filters[key]
+        if self._async_conn is None:
+            self._async_conn = await psycopg.AsyncConnection.connect(**self.conninfo)
+
+        query = SESSIONS_QUERY + f"WHERE s.id > %s AND ({predicate}) ORDER BY s.id LIMIT %s"
+        async with self._async_conn.cursor() as cur:
+            await cur.execute(query, (after_id, *params, limit))
+            rows = await cur.fetchall()
+            if not rows:
+                return [], [], []
+            session_ids = [row[0] for row in rows]
+            await cur.execute(SPEAKERS_QUERY, (session_ids,))
+            speaker_rows = await cur.fetchall()
+            await cur.execute(TAGS_QUERY, (session_ids,))
+            tag_rows = await cur.fetchall()
+        return rows, speaker_rows, tag_rows
+
+    async def aclose(self):
+        if self._async_conn is not None:
+            await self._async_conn.close()
+            self._async_conn = None
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE events (id INTEGER PRIMARY KEY, event_name TEXT, event_date TEXT, start_date TEXT,
+    end_date TEXT, description TEXT, location TEXT, venue_name TEXT, venue_address TEXT,
+    max_attendees INTEGER, website_url TEXT);
+CREATE TABLE tracks (id INTEGER PRIMARY KEY, track_name TEXT, track_description TEXT,
+    color_hex TEXT, display_order INTEGER);
+CREATE TABLE tags (id INTEGER PRIMARY KEY, tag_name TEXT, tag_description TEXT);
+CREATE TABLE venues (id INTEGER PRIMARY KEY, venue_name TEXT, venue_type TEXT, capacity INTEGER);
+CREATE TABLE rooms (id INTEGER PRIMARY KEY, venue_id INTEGER, room_code TEXT, room_name TEXT,
+    capacity INTEGER, setup_style TEXT);
+CREATE TABLE speakers (id INTEGER PRIMARY KEY, name TEXT, company TEXT);
+CREATE TABLE schedules (id INTEGER PRIMARY KEY, event_id INTEGER, session_name TEXT,
+    session_type TEXT, track_id INTEGER, session_date TEXT, start_time TEXT, end_time TEXT,
+    room_id INTEGER, slides_url TEXT, repository_url TEXT);
+CREATE TABLE session_speakers (session_id INTEGER, speaker_id INTEGER, is_primary BOOLEAN,
+    speaker_order INTEGER);
+CREATE TABLE session_tags (session_id INTEGER, tag_id INTEGER);
+"""
+
+# SESSIONS_QUERY without the Postgres-only interval arithmetic (derived in Python)
+SQLITE_SESSIONS_QUERY = """
+SELECT s.id, s.session_name, s.session_type, s.session_date, s.start_time, s.end_time,
+       e.event_name, e.location, e.venue_name, e.venue_address,
+       t.track_name, t.track_description,
+       r.room_code, r.room_name, v.venue_name, v.capacity,
+       s.slides_url, s.repository_url, s.event_id
+FROM schedules s
+LEFT JOIN events e ON s.event_id = e.id
+LEFT JOIN rooms r ON s.room_id = r.id
+LEFT JOIN venues v ON r.venue_id = v.id
+LEFT JOIN tracks t ON s.track_id = t.id
+"""
+
+
+def _parse_time(value: Optional[str]) -> Optional[time]:
+    if not value:
+        return None
+    return datetime.strptime(value[:5], "%H:%M").time()
+
+
+class SQLiteSourceReader(SourceReader):
+    """
+    In-memory SQLite source for offline runs, benchmarks and tests
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    @classmethod
+    def from_sql(cls, *scripts: str) -> "SQLiteSourceReader":
+        """
+        Create the schema and run data scripts (``INSERT``s in ``02-test-data.sql`` style)
+        """
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        conn.executescript(SQLITE_SCHEMA)
+        for script in scripts:
+            conn.executescript(script)
+        return cls(conn)
+
+    @classmethod
+    def from_test_data(cls, path: str = TEST_DATA_SQL) -> "SQLiteSourceReader":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_sql(f.read())
+
+    def _to_session_row(self, row: tuple) -> tuple:
+        """
+        Reorder into ``SESSIONS_QUERY`` columns with Postgres-like types
+        """
+        start, end = _parse_time(row[4]), _parse_time(row[5])
+        duration = None
+        if start and end:
+            # EXTRACT(EPOCH ...)/60 is numeric in Postgres
+            duration = Decimal((end.hour * 60 + end.minute) - (start.hour * 60 + start.minute))
+        return (
+            row[0], row[1], row[2], date.fromisoformat(row[3]) if row[3] else None, start, end,
+            duration, start.hour if start else None, start.minute if start else None,
+            *row[6:],
+        )
+
+    def _shard_rows(self, shard: ShardSpec, rows: List[tuple]) -> List[tuple]:
+        if not shard.enabled:
+            return rows
+        low, high = self.conn.execute("SELECT min(id), max(id) FROM schedules").fetchone()
+        if low is None:
+            return []
+        return [row for row in rows if shard.contains(row[0], low, high)]
+
+    def _session_rows(self, shard: ShardSpec, rows: List[tuple]) -> List[tuple]:
+        rows = [self._to_session_row(row) for row in self._shard_rows(shard, rows)]
+        if self.event_ids:
+            rows = [row for row in rows if row[21] in self.event_ids]
+        return rows
+
+    def fetch_sessions(self, shard: ShardSpec) -> List[tuple]:
+        rows = self.conn.execute(SQLITE_SESSIONS_QUERY + " ORDER BY s.session_date, s.start_time, s.id").fetchall()
+        return self._session_rows(shard, rows)
+
+    def fetch_sessions_after(self, shard: ShardSpec, after_id: int, limit: int) -> List[tuple]:
+        rows = self.conn.execute(SQLITE_SESSIONS_QUERY + " WHERE s.id > ? ORDER BY s.id", (after_id,)).fetchall()
+        return self._session_rows(shard, rows)[:limit]
+
+    def _in_clause(self, session_ids: Sequence[int]) -> str:
+        return ",".join("?" * len(session_ids))
+
+    def fetch_speakers(self, session_ids: Sequence[int]) -> List[tuple]:
+        if not session_ids:
+            return []
+        return self.conn.execute(
+            "SELECT ss.session_id, sp.name, sp.company FROM session_speakers ss "
+            "JOIN speakers sp ON ss.speaker_id = sp.id "
+            f"WHERE ss.session_id IN ({self._in_clause(session_ids)}) "
+            "ORDER BY ss.session_id, ss.speaker_order",
+            list(session_ids),
+        ).fetchall()
+
+    def fetch_tags(self, session_ids: Sequence[int]) -> List[tuple]:
+        if not session_ids:
+            return []
+        return self.conn.execute(
+            "SELECT st.session_id, tg.tag_name, tg.tag_description FROM session_tags st "
+            f"JOIN tags tg ON st.tag_id = tg.id WHERE st.session_id IN ({self._in_clause(session_ids)})",
+            list(session_ids),
+        ).fetchall()
+
+    def fetch_events(self) -> List[tuple]:
+        rows = self.conn.execute(EVENTS_QUERY + "ORDER BY e.id").fetchall()
+        return [row for row in rows if not self.event_ids or row[0] in self.event_ids]
+
+
+@dataclass
+class SearchHit:
+    """One similarity-search result (``metadata`` mirrors LangChain's ``Document``)"""
+    document: str
+    metadata: Dict[str, Any]
+    score: float
+
+
+class VectorWriter(ABC):
+    """
+    Destination for encoded documents
+    """
+
+    @abstractmethod
+    def add(self, texts: List[str], embeddings: List[List[float]],
+            metadatas: List[Dict[str, Any]], ids: List[str]):
+        """Upsert documents by id"""
+
+    @abstractmethod
+    def similarity_search(self, query: str, k: int = 4) -> List[SearchHit]:
+        """Most similar documents to a text query"""
+
+
+class PGVectorWriter(VectorWriter):
+    """
+    Production writer over a LangChain ``PGVector`` store
+    """
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+
+    def add(self, texts, embeddings, metadatas, ids):
+        self.vector_store.add_embeddings(texts=texts, embeddings=embeddings, metadatas=metadatas, ids=ids)
+
+    def similarity_search(self, query: str, k: int = 4) -> List[SearchHit]:
+        # LangChain returns the cosine distance; every backend reports a similarity
+        return [
+            SearchHit(doc.page_content, doc.metadata, 1.0 - float(score))
+            for doc, score in self.vector_store.similarity_search_with_score(query, k=k)
+        ]
+
+
+def _contains(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    for key, value in filter.items():
+        stored = metadata.get(key)
+        if isinstance(value, list):
+            if not isinstance(stored, list) or not set(value) <= set(stored):
+                return False
+        elif stored != value:
+            return False
+    return True
+
+
+@dataclass
+class InMemoryVectorStore(VectorWriter):
+    """
+    NumPy vector store with id upserts and exact cosine search
+    """
+    embed_query: Optional[Callable[[str], List[float]]] = None
+    documents: Dict[str, Tuple[str, Dict[str, Any], np.ndarray]] = field(default_factory=dict)
+
+    def add(self, texts, embeddings, metadatas, ids):
+        for doc_id, text, embedding, metadata in zip(ids, texts, embeddings, metadatas):
+            self.documents[doc_id] = (text, dict(metadata), np.asarray(embedding, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def matrix(self) -> Tuple[List[str], np.ndarray]:
+        """
+        ``(ids, vectors)`` in insertion order
+        """
+        ids = list(self.documents)
+        if not ids:
+            return ids, np.empty((0, 0), dtype=np.float32)
+        return ids, np.vstack([self.documents[i][2] for i in ids])
+
+    def search_by_vector(self, embedding: Sequence[float], k: int = 4,
+                         filter: Optional[Dict[str, Any]] = None) -> List[SearchHit]:
+        """
+        Top-``k`` cosine hits; ``filter`` keeps documents whose metadata contains
+        every key/value pair (JSONB ``@>``: lists match as subsets)
+        """
+        ids, vectors = self.matrix()
+        if filter:
+            keep = [n for n, i in enumerate(ids) if _contains(self.documents[i][1], filter)]
+            ids, vectors = [ids[n] for n in keep], vectors[keep]
+        if not ids:
+            return []
+        query = normalize_rows(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        scores = normalize_rows(vectors) @ query
+        return [SearchHit(self.documents[ids[i]][0], self.documents[ids[i]][1], float(scores[i]))
+                for i in top_k(scores, k)]
+
+    def lookup(self, filter: Dict[str, Any], k: int = 4) -> List[SearchHit]:
+        """
+        Documents matching ``filter`` in agenda order, without a query vector (score 1.0)
+        """
+        matches = [(text, metadata) for text, metadata, _ in self.documents.values() if _contains(metadata, filter)]
+        matches.sort(key=lambda m: (m[1].get("session_date") or "", m[1].get("start_time") or ""))
+        return [SearchHit(text, metadata, 1.0) for text, metadata in matches[:k]]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[SearchHit]:
+        if self.embed_query is None:
+            raise ValueError("InMemoryVectorStore needs embed_query for text queries")
+        return self.search_by_vector(self.embed_query(query), k)
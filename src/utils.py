@@ -4,6 +4,7 @@ Utility functions for Event Embeddings Generator
 """
 
 import logging
+import os
 import sys
 import time
 from contextlib import contextmanager
@@ -13,6 +14,7 @@ import numpy as np
 
 import psycopg
 from psycopg.connection import Connection as PostgresConnection
+from psycopg.conninfo import make_conninfo
 
 def get_logger(name: str) -> logging.Logger:
     """
@@ -120,7 +122,8 @@ class DatabaseConnection:
     """
     
     def __init__(self, config: Dict[str, Any], max_retries: int = 3):
-        self.conninfo = " ".join([f"{k}='{v}'" for k, v in config.items()])
+        # make_conninfo quotes and escapes values (passwords with quotes or spaces)
+        self.conninfo = make_conninfo(**config)
         self.max_retries = max_retries
         self.connection: Optional[PostgresConnection] = None
         self.logger = get_logger(self.__class__.__name__)
@@ -129,12 +132,18 @@ class DatabaseConnection:
         """
         Establish database connection with retry logic
         """
+        if not self.connection or self.connection.closed:
+            self.connection = self.open()
+        self.logger.info(f"Connected to database.")
+        return self.connection
+    
+    def open(self) -> PostgresConnection:
+        """
+        Open a new connection with retry logic; the caller owns it (``with db.open() as conn:``)
+        """
         for attempt in range(self.max_retries):
             try:
-                if not self.connection or self.connection.closed:
-                    self.connection = psycopg.connect(self.conninfo)
-                self.logger.info(f"Connected to database.")
-                return self.connection
+                return psycopg.connect(self.conninfo)
             except psycopg.OperationalError as e:
                 self.logger.warning(f"Connection attempt {attempt + 1} failed: {e}")
                 if attempt < self.max_retries - 1:
@@ -176,6 +185,43 @@ class DatabaseConnection:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+class PostgresStore:
+    """
+    Base of the classes that keep their state in the vector database.
+
+    Every operation opens a short-lived connection through ``DatabaseConnection``
+    (same retry policy); ``DDL`` creates the tables the class owns and runs once
+    per instance, on the first ``ensure_schema``.
+    """
+    DDL: Optional[str] = None
+    
+    def __init__(self, conninfo: Dict[str, Any]):
+        self.conninfo = conninfo
+        self.database = DatabaseConnection(conninfo)
+        self.logger = get_logger(self.__class__.__name__)
+        self._schema_ready = False
+    
+    def _connect(self) -> PostgresConnection:
+        return self.database.open()
+    
+    def ensure_schema(self):
+        if self._schema_ready:
+            return
+        with self._connect() as conn:
+            self._create_schema(conn)
+        self._schema_ready = True
+    
+    def _create_schema(self, conn: PostgresConnection):
+        if self.DDL:
+            conn.execute(self.DDL)
+    
+    @staticmethod
+    def _table_exists(conn: PostgresConnection, table: str) -> bool:
+        """
+        Read paths check instead of creating: the query service may run with read-only credentials
+        """
+        return conn.execute("SELECT to_regclass(%s)", (table,)).fetchone()[0] is not None
+
 # --- El resto de las clases y funciones no necesitan cambios ---
 
 class ProgressTracker:
@@ -239,4 +285,70 @@ def format_duration(seconds: float) -> str:
         parts.append(f"{minutes}m")
     if seconds > 0 or not parts:
         parts.append(f"{seconds}s")
-    return " ".join(parts)
\ No newline at end of file
+    return " ".join(parts)
+
+# Connection defaults per environment prefix (``<prefix>_HOST``, ``_PORT``, ``_NAME``, ``_USER``, ``_PASSWORD``)
+CONNINFO_DEFAULTS = {
+    "DB_SOURCE": ("postgres-source", "events_db", "events_user", "events_pass"),
+    "DB_DEST": ("postgres-vector", "vector_db", "vector_user", "vector_pass"),
+}
+
+def env_conninfo(prefix: str, fallback: Optional[str] = None) -> Dict[str, Any]:
+    """
+    psycopg connection params from ``<prefix>_*`` variables, then ``<fallback>_*``, then defaults
+    """
+    host, dbname, user, password = CONNINFO_DEFAULTS.get(fallback or prefix, CONNINFO_DEFAULTS["DB_DEST"])
+
+    def env(name: str, default: str) -> str:
+        value = os.getenv(f"{prefix}_{name}")
+        if value is None and fallback:
+            value = os.getenv(f"{fallback}_{name}")
+        return default if value is None else value
+
+    return {
+        "host": env("HOST", host),
+        "port": env("PORT", "5432"),
+        "dbname": env("NAME", dbname),
+        "user": env("USER", user),
+        "password": env("PASSWORD", password),
+        "connect_timeout": 10,
+    }
+
+def dest_conninfo() -> Dict[str, Any]:
+    """
+    Connection params of the vector database (``DB_DEST_*``)
+    """
+    return env_conninfo("DB_DEST")
+
+def vector_literal(vector) -> str:
+    """
+    pgvector text literal (``'[0.1,0.2]'``) for a vector parameter or a COPY row
+    """
+    return "[" + ",".join(f"{x:.7g}" for x in vector) + "]"
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the ``k`` highest scores, best first (per row for a 2-D array): ``argpartition`` + sort of k
+    """
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(top, order, axis=-1)
+
+def format_bytes(size: float) -> str:
+    """
+    Format a byte count for human-readable output
+    """
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def parse_int_list(value: str) -> List[int]:
+    """
+    Comma-separated CLI value (``"8,16,32"``) as a list of ints; empty items are skipped
+    """
+    return [int(v) for v in value.split(",") if v.strip()]
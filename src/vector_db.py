@@ -0,0 +1,49 @@
+"""
+Read helpers for the PGVector (LangChain) tables in the vector database
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import psycopg
+
+COLLECTION_VECTORS_QUERY = """
+SELECT
+    (e.cmetadata->>'session_id')::int AS session_id,
+    e.embedding::real[] AS embedding,
+    e.cmetadata,
+    e.document
+FROM langchain_pg_embedding e
+JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+WHERE c.name = %s
+ORDER BY session_id;
+"""
+
+
+def load_collection_vectors(
+    conn: psycopg.Connection, collection_name: str, fetch_size: int = 1024
+) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]], List[str]]:
+    """
+    Load ``(ids, vectors, metadatas, documents)`` of a collection, ordered by session id.
+
+    Vectors are returned as a float32 matrix exactly as stored.
+    """
+    ids: List[int] = []
+    blocks: List[np.ndarray] = []
+    metadatas: List[Dict[str, Any]] = []
+    documents: List[str] = []
+    with conn.cursor() as cur:
+        cur.execute(COLLECTION_VECTORS_QUERY, (collection_name,))
+        # Convert per chunk: only ``fetch_size`` vectors are ever held as Python lists
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            ids.extend(row[0] for row in rows)
+            blocks.append(np.asarray([row[1] for row in rows], dtype=np.float32))
+            metadatas.extend(row[2] for row in rows)
+            documents.extend(row[3] for row in rows)
+
+    if not ids:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32), [], []
+    return np.asarray(ids, dtype=np.int64), np.concatenate(blocks), metadatas, documents
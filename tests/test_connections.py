@@ -1 +1,380 @@
 # Pruebas de conexión a servicios
+"""
+Storage backends: the SQLite source seeded from sql/02-test-data.sql and the
+in-memory NumPy vector store, checked against the contracts the generator
+relies on (SESSIONS_QUERY column order, keyset pagination, id upserts), plus
+the statements the partitioned writer issues per event.
+"""
+
+import asyncio
+import sqlite3
+from datetime import date, time
+from types import SimpleNamespace
+
+import numpy as np
+import psycopg
+import pytest
+
+from src.benchmark_ann import bench_conninfo
+from src.checkpoint import CheckpointStore
+from src.events import EventStore
+from src.index_manager import HnswIndexManager, HnswParams
+from src.partitions import PartitionedVectorStore
+from src.queries import SESSIONS_QUERY
+from src.shard_spec import ShardSpec
+from src.storage import InMemoryVectorStore, PGVectorWriter, SQLiteSourceReader
+from src.utils import DatabaseConnection
+
+SESSIONS_QUERY_COLUMNS = 22
+
+
+@pytest.fixture(scope="module")
+def source():
+    return SQLiteSourceReader.from_test_data()
+
+
+def test_sessions_match_sessions_query_columns(source):
+    rows = source.fetch_sessions(ShardSpec())
+    assert len(rows) == 27
+    assert all(len(row) == SESSIONS_QUERY_COLUMNS for row in rows)
+    assert "FROM schedules s" in SESSIONS_QUERY
+
+    first = rows[0]
+    assert first[3] == date(2025, 6, 14)
+    assert first[4] == time(9, 0)
+    assert first[6] == 5          # duration_minutes
+    assert (first[7], first[8]) == (9, 0)
+    assert first[9] == "KCD Antigua Guatemala 2025"
+
+
+def test_event_ids_restrict_the_source():
+    reader = SQLiteSourceReader.from_test_data()
+    reader.event_ids = (1,)
+    assert len(reader.fetch_sessions(ShardSpec())) == 27
+    reader.event_ids = (99,)
+    assert reader.fetch_sessions(ShardSpec()) == []
+    assert reader.read_chunk(ShardSpec(), 0, 10)[0] == []
+
+
+def test_sessions_ordered_by_date_and_start_time(source):
+    starts = [row[4] for row in source.fetch_sessions(ShardSpec())]
+    assert starts == sorted(starts)
+
+
+def test_keyset_pagination_covers_every_session_once(source):
+    seen, last_id = [], 0
+    while True:
+        rows, speakers, tags = source.read_chunk(ShardSpec(), last_id, 10)
+        if not rows:
+            break
+        assert {r[0] for r in speakers} <= {r[0] for r in rows}
+        assert {r[0] for r in tags} <= {r[0] for r in rows}
+        seen.extend(row[0] for row in rows)
+        last_id = rows[-1][0]
+    assert seen == list(range(1, 28))
+
+
+def test_async_chunk_read_matches_sync(source):
+    sync_rows = source.read_chunk(ShardSpec(), 5, 4)
+    async_rows = asyncio.run(source.read_chunk_async(ShardSpec(), 5, 4))
+    assert async_rows == sync_rows
+
+
+def test_speakers_follow_speaker_order(source):
+    rows = source.fetch_speakers([1])
+    assert [r[1] for r in rows] == ["Sergio Méndez", "Alvin Estrada"]
+    assert source.fetch_speakers([]) == []
+
+
+@pytest.mark.parametrize("strategy", ["modulo", "range"])
+def test_shards_partition_the_sessions(source, strategy):
+    owned = []
+    for index in range(3):
+        spec = ShardSpec(index=index, count=3, strategy=strategy, run_id="t")
+        owned.extend(row[0] for row in source.fetch_sessions(spec))
+    assert sorted(owned) == list(range(1, 28))
+
+
+def test_in_memory_store_upserts_by_id():
+    store = InMemoryVectorStore()
+    store.add(["a", "b"], [[1.0, 0.0], [0.0, 1.0]], [{"n": 1}, {"n": 2}], ["1", "2"])
+    store.add(["a2"], [[0.6, 0.8]], [{"n": 3}], ["1"])
+    ids, vectors = store.matrix()
+    assert ids == ["1", "2"]
+    np.testing.assert_allclose(vectors[0], [0.6, 0.8])
+
+
+def test_in_memory_store_cosine_search():
+    store = InMemoryVectorStore(embed_query=lambda text: [1.0, 0.0] if text == "x" else [0.0, 1.0])
+    store.add(["x", "y", "z"], [[2.0, 0.0], [0.0, 3.0], [1.0, 1.0]], [{"i": 0}, {"i": 1}, {"i": 2}], ["0", "1", "2"])
+    hits = store.similarity_search("x", k=2)
+    assert [h.metadata["i"] for h in hits] == [0, 2]
+    assert hits[0].score == pytest.approx(1.0)
+    assert [h.metadata["i"] for h in store.search_by_vector([1.0, 0.0], k=2, filter={"i": 1})] == [1]
+    assert InMemoryVectorStore().search_by_vector([1.0, 0.0]) == []
+
+
+def test_pgvector_scores_are_similarities():
+    document = SimpleNamespace(page_content="doc", metadata={"session_id": 1})
+    store = SimpleNamespace(similarity_search_with_score=lambda query, k: [(document, 0.25)])
+    assert PGVectorWriter(store).similarity_search("q")[0].score == pytest.approx(0.75)
+
+
+class _SQLiteConnection:
+    """psycopg-style ``with connect() as conn: conn.execute(sql, params)`` over SQLite"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.conn.commit()
+
+    def execute(self, query, params=()):
+        if not params:
+            self.conn.executescript(query)
+            return self.conn.cursor()
+        return self.conn.execute(query.replace("%s", "?"), params)
+
+
+def test_store_connections_are_retried(monkeypatch):
+    attempts = []
+
+    def connect(conninfo):
+        attempts.append(conninfo)
+        if len(attempts) < 3:
+            raise psycopg.OperationalError("connection refused")
+        return _RecordingConnection()
+
+    monkeypatch.setattr("src.utils.psycopg.connect", connect)
+    monkeypatch.setattr("src.utils.time.sleep", lambda seconds: None)
+    store = CheckpointStore({"host": "db", "password": "it's secret", "connect_timeout": 10})
+    with store._connect() as conn:
+        conn.execute("SELECT 1")
+    assert len(attempts) == 3 and "password='it\\'s secret'" in attempts[0]
+
+    attempts.clear()
+    with pytest.raises(psycopg.OperationalError):
+        DatabaseConnection({"host": "db"}, max_retries=2).open()
+    assert len(attempts) == 2
+
+
+def test_benchmark_refuses_the_destination_database(monkeypatch):
+    monkeypatch.setenv("DB_DEST_HOST", "vectors.internal")
+    monkeypatch.setenv("DB_DEST_NAME", "agenda")
+    monkeypatch.delenv("BENCH_DB_HOST", raising=False)
+    assert bench_conninfo() is None
+    monkeypatch.setenv("BENCH_DB_HOST", "vectors.internal")
+    monkeypatch.setenv("BENCH_DB_NAME", "agenda")
+    assert bench_conninfo() is None
+    monkeypatch.setenv("BENCH_DB_NAME", "ann_scratch")
+    assert bench_conninfo()["dbname"] == "ann_scratch"
+
+
+def test_new_shard_run_does_not_resume_an_older_run():
+    db = sqlite3.connect(":memory:")
+    store = CheckpointStore({})
+    store._connect = lambda: _SQLiteConnection(db)
+    store.ensure_schema()
+    scope = "agenda_sessions:shard-0-of-2"
+
+    run_a = store.begin(scope, "fp", run_id="rev-1-0")
+    store.commit(run_a, last_session_id=12, count=12)
+    restarted = store.begin(scope, "fp", run_id="rev-1-0")
+    assert restarted.resumed and restarted.last_session_id == 12
+
+    run_b = store.begin(scope, "fp", run_id="rev-2-0")
+    assert not run_b.resumed and run_b.last_session_id is None
+    statuses = dict(db.execute("SELECT run_id, status FROM embeddings_run_checkpoints").fetchall())
+    assert statuses == {"rev-1-0": "abandoned", "rev-2-0": "running"}
+
+
+def test_stale_unfinished_run_is_abandoned_instead_of_resumed():
+    db = sqlite3.connect(":memory:")
+    store = CheckpointStore({}, max_age_hours=24)
+    store._connect = lambda: _SQLiteConnection(db)
+    store.ensure_schema()
+
+    crashed = store.begin("agenda_sessions", "fp")
+    store.commit(crashed, last_session_id=40, count=40)
+    assert store.begin("agenda_sessions", "fp").run_id == crashed.run_id
+
+    db.execute("UPDATE embeddings_run_checkpoints SET updated_at = '2000-01-01 00:00:00'")
+    fresh = store.begin("agenda_sessions", "fp")
+    assert not fresh.resumed and fresh.run_id != crashed.run_id
+    statuses = dict(db.execute("SELECT run_id, status FROM embeddings_run_checkpoints").fetchall())
+    assert statuses == {crashed.run_id: "abandoned", fresh.run_id: "running"}
+
+
+class _RecordingConnection:
+    """psycopg-style connection that keeps every statement as SQL text instead of running it"""
+
+    def __init__(self):
+        self.statements = []
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=()):
+        self.statements.append(query if isinstance(query, str) else query.as_string(None))
+        return SimpleNamespace(fetchone=lambda: None, fetchall=lambda: [])
+
+    def cursor(self):
+        return self
+
+    def executemany(self, query, rows):
+        self.execute(query)
+        self.rows.extend(rows)
+
+
+class _ScriptedConnection(_RecordingConnection):
+    """Recording connection whose ``fetchone`` results are given in order"""
+
+    def __init__(self, *results):
+        super().__init__()
+        self.results = list(results)
+
+    def execute(self, query, params=()):
+        super().execute(query, params)
+        row = self.results.pop(0) if self.results else None
+        return SimpleNamespace(fetchone=lambda: row, fetchall=lambda: [])
+
+
+def _index_manager(conn, **kwargs):
+    manager = HnswIndexManager({"dbname": "vectors"}, HnswParams(m=8, ef_construction=32), **kwargs)
+    manager._connect = lambda: conn
+    return manager
+
+
+def test_collection_index_is_partial_and_named_after_the_collection(monkeypatch):
+    monkeypatch.setattr("src.utils.DatabaseConnection.open", lambda self: _ScriptedConnection(("c-uuid",)))
+    manager = HnswIndexManager.for_collection({}, "Agenda Sessions-2025")
+    assert manager.index_name == "idx_langchain_embedding_hnsw_agenda_sessions_2025"
+    assert manager.collection_id == "c-uuid"
+    assert len(HnswIndexManager.for_collection({}, "x" * 80).index_name) == 63
+
+    # exists() -> stale definition of an older uuid, dropped before the build; then set_config, CREATE, size
+    stale = ("CREATE INDEX ... WHERE (collection_id = 'old-uuid'::uuid)",)
+    conn = _ScriptedConnection(stale, None, None, None, (4096,))
+    manager = _index_manager(conn, index_name="idx_agenda", collection_id="c-uuid")
+    assert manager.build()[1] == 4096
+    assert conn.statements[1] == 'DROP INDEX IF EXISTS "idx_agenda"'
+    assert conn.statements[3] == (
+        'CREATE INDEX IF NOT EXISTS "idx_agenda" ON "langchain_pg_embedding" USING hnsw ("embedding" '
+        "vector_cosine_ops) WITH (m = 8, ef_construction = 32) WHERE collection_id = 'c-uuid'::uuid"
+    )
+
+    conn = _ScriptedConnection(None, None, (0,))
+    _index_manager(conn).build()
+    assert "WHERE" not in conn.statements[1]
+
+
+def test_column_is_typed_only_when_every_row_matches_and_altering_is_allowed():
+    conn = _ScriptedConnection(("vector",), (3,))
+    assert not _index_manager(conn, alter_column=True).ensure_typed_column(768)
+    assert not any(s.startswith("ALTER") for s in conn.statements)
+
+    conn = _ScriptedConnection(("vector",), (0,))
+    assert not _index_manager(conn).ensure_typed_column(768)
+    assert not any(s.startswith("ALTER") for s in conn.statements)
+
+    conn = _ScriptedConnection(("vector",), (0,))
+    assert _index_manager(conn, alter_column=True).ensure_typed_column(768)
+    assert conn.statements[-1] == 'ALTER TABLE "langchain_pg_embedding" ALTER COLUMN "embedding" TYPE vector(768)'
+
+    conn = _ScriptedConnection(("vector(768)",))
+    assert _index_manager(conn).ensure_typed_column(768) and len(conn.statements) == 1
+
+
+def _partitioned_store(index_mode="auto", reset_on_write=False):
+    conn = _RecordingConnection()
+    store = PartitionedVectorStore({}, 2, index_mode=index_mode)
+    store._connect = lambda: conn
+    store.reset_on_write = reset_on_write
+    return store, conn
+
+
+def _write(store, *event_ids):
+    metadatas = [{"event_id": e, "session_id": i} for i, e in enumerate(event_ids)]
+    store.add([f"doc {i}" for i in range(len(event_ids))], [[1.0, 0.0]] * len(event_ids), metadatas,
+              [f"s{i}" for i in range(len(event_ids))])
+
+
+def test_partitioned_full_load_empties_each_written_event_once():
+    store, conn = _partitioned_store(reset_on_write=True)
+    _write(store, 1, 2)
+    _write(store, 1)
+    assert store.touched_events == {1, 2}
+    resets = [s for s in conn.statements if not s.startswith("INSERT")]
+    assert resets == [
+        'CREATE TABLE IF NOT EXISTS "agenda_session_vectors_e1" PARTITION OF "agenda_session_vectors" '
+        'FOR VALUES IN (1)',
+        'TRUNCATE "agenda_session_vectors_e1"',
+        'DROP INDEX IF EXISTS "agenda_session_vectors_e1_hnsw"',
+        'CREATE TABLE IF NOT EXISTS "agenda_session_vectors_e2" PARTITION OF "agenda_session_vectors" '
+        'FOR VALUES IN (2)',
+        'TRUNCATE "agenda_session_vectors_e2"',
+        'DROP INDEX IF EXISTS "agenda_session_vectors_e2_hnsw"',
+    ]
+    assert [r[:3] for r in conn.rows] == [(1, "s0", 0), (2, "s1", 1), (1, "s0", 0)]
+    assert conn.rows[0][5] == "[1,0]"
+
+
+def test_partitioned_incremental_write_keeps_other_rows_and_indexes():
+    store, conn = _partitioned_store(index_mode="keep")
+    _write(store, 3)
+    assert store.touched_events == {3}
+    assert not any(s.startswith(("TRUNCATE", "DROP")) for s in conn.statements)
+
+    store, conn = _partitioned_store(index_mode="rebuild")
+    _write(store, 3)
+    assert 'DROP INDEX IF EXISTS "agenda_session_vectors_e3_hnsw"' in conn.statements
+    assert not any(s.startswith("TRUNCATE") for s in conn.statements)
+
+    with pytest.raises(ValueError, match="event_id"):
+        store.add(["doc"], [[1.0, 0.0]], [{"session_id": 9}], ["s9"])
+
+
+def test_partitioned_store_refuses_another_dimension():
+    store, conn = _partitioned_store()
+    conn.execute = lambda query, params=(): SimpleNamespace(fetchone=lambda: ("vector(768)",))
+    with pytest.raises(ValueError, match="EMBEDDING_DIM"):
+        store.check_dimension(conn)
+    conn.execute = lambda query, params=(): SimpleNamespace(fetchone=lambda: ("vector(2)",))
+    store.check_dimension(conn)
+
+
+def test_event_table_is_created_without_the_pgvector_tables():
+    # Partitioned storage on a fresh database: no langchain_pg_embedding for the view to read
+    conn = _RecordingConnection()
+    for pgvector_table in (None, "langchain_pg_embedding"):
+        def execute(query, params=(), found=pgvector_table):
+            conn.statements.append(query)
+            return SimpleNamespace(fetchone=lambda: (found,))
+
+        conn.statements.clear()
+        conn.execute = execute
+        store = EventStore({})
+        store._connect = lambda: conn
+        store.ensure_schema()
+        store.ensure_schema()  # once per instance
+        assert sum("CREATE TABLE IF NOT EXISTS agenda_events" in s for s in conn.statements) == 1
+        assert any("VIEW agenda_documents" in s for s in conn.statements) == (pgvector_table is not None)
+
+
+def test_partition_indexes_are_rebuilt_for_events_finished_before_a_resume(monkeypatch):
+    # Event 1 was fully committed (index dropped) before the crash; the resumed run only writes event 2
+    store, _ = _partitioned_store()
+    store.touched_events = {2}
+    monkeypatch.setattr(store, "events", lambda conn=None: [1, 2, 3])
+    built = []
+    monkeypatch.setattr(store, "index_manager", lambda event_id: SimpleNamespace(
+        exists=lambda: event_id == 3, build=lambda: built.append(event_id)))
+    store.finalize_indexes()
+    assert built == [1, 2]
@@ -1 +1,590 @@
 # Pruebas para embeddings
+"""
+Content building and encode/write paths of the generator, run against the
+SQLite source and the in-memory vector store with a deterministic fake
+encoder (no model download, no database server).
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src import autotune, cpu, memory
+from src.centroids import CentroidIndex
+from src.checkpoint import CheckpointStore
+from src.events import EventHeader, merge_event_metadata
+from src.generate_embeddings import SimpleAgendaEmbeddingsGenerator
+from src.neighbors import compute_neighbors, time_slots
+from src.query_router import Lexicon, QueryRouter
+from src.query_service import Histogram, QueryBatcher
+from src.shard_spec import ShardSpec
+from src.snapshot import AgendaSnapshot, export_snapshot
+from src.storage import InMemoryVectorStore, PGVectorWriter, SQLiteSourceReader
+from tests.test_connections import _SQLiteConnection
+
+DIM = 32
+
+
+class FakeEncoder:
+    """Bag-of-words hashing encoder with the HuggingFaceEmbeddings interface"""
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.forward_batch_sizes = []
+        self.encode_kwargs = {"normalize_embeddings": True}
+
+    def _embed(self, text: str):
+        vector = np.zeros(DIM, dtype=np.float32)
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.batch_sizes.append(len(texts))
+        self.forward_batch_sizes.append(self.encode_kwargs.get("batch_size"))
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    for name, value in {
+        "CHECKPOINT_ENABLED": "false",
+        "HNSW_INDEX_MODE": "off",
+        "SNAPSHOT_DIR": "",
+        "AUTOTUNE": "off",
+        "SHARD_COUNT": "1",
+        "BATCH_SIZE": "8",
+        "CHECKPOINT_BATCH_SIZE": "10",
+        "PIPELINE_CHUNK_SIZE": "10",
+        "MEMORY_BUDGET_MB": "0",
+    }.items():
+        monkeypatch.setenv(name, value)
+    encoder = FakeEncoder()
+    store = InMemoryVectorStore(embed_query=encoder.embed_query)
+    gen = SimpleAgendaEmbeddingsGenerator(
+        source=SQLiteSourceReader.from_test_data(), writer=store, embeddings_model=encoder
+    )
+    assert gen.initialize_vector_store()
+    return gen
+
+
+def enriched_sessions(gen):
+    sessions = gen.clean_session_data(gen.fetch_simple_sessions())
+    sessions = gen.fetch_speakers_for_sessions(sessions)
+    return gen.fetch_tags_for_sessions(sessions)
+
+
+def test_event_ids_require_partitioned_storage(monkeypatch):
+    # A collection load empties the whole collection, so a per-event run would drop the other events
+    monkeypatch.setenv("AUTOTUNE", "off")
+    monkeypatch.setenv("EVENT_IDS", "1")
+    monkeypatch.setenv("VECTOR_STORAGE", "collection")
+    encoder = FakeEncoder()
+    with pytest.raises(ValueError, match="EVENT_IDS"):
+        SimpleAgendaEmbeddingsGenerator(source=SQLiteSourceReader.from_test_data(),
+                                        writer=InMemoryVectorStore(), embeddings_model=encoder)
+
+
+def test_agenda_content_includes_session_fields(generator):
+    session = next(s for s in enriched_sessions(generator) if s["id"] == 5)
+    content = generator.generate_agenda_content(session)
+    assert "SESIÓN: Domina Kubernetes con HELM" in content
+    assert "HORARIO: de 11:00 a 11:35" in content
+    assert "PONENTE(S): Víctor Castellanos (InfoUtility GT)" in content
+    assert "helm" in content
+    assert "DURACIÓN: 35 minutos" in content
+
+
+def test_event_attributes_are_not_repeated_per_document(generator):
+    session = next(s for s in enriched_sessions(generator) if s["id"] == 5)
+    content = generator.generate_agenda_content(session)
+    metadata = generator.build_agenda_metadata(session)
+    assert "IDIOMA:" not in content and "COMUNIDAD:" not in content
+    assert metadata["event_id"] == 1
+    assert not {"source", "event_name", "language", "is_free"} & set(metadata)
+
+    generator.event_header_in_text = True
+    assert "IDIOMA: Español" in generator.generate_agenda_content(session)
+
+
+def test_event_header_is_taken_from_each_event():
+    header = EventHeader()
+    events = {1: {"event_name": "KCD Antigua Guatemala 2025"}, 2: {"event_name": "DevOpsDays Lima"}}
+    merged = [merge_event_metadata({"event_id": e}, events, header) for e in (1, 2)]
+    assert [m["source"] for m in merged] == ["kcd_antigua_guatemala_2025_agenda", "devopsdays_lima_agenda"]
+    assert "community" not in merged[0] and not any("COMUNIDAD" in s for s in header.sentences())
+
+    header = EventHeader(source="agenda", community="CNCF")
+    assert merge_event_metadata({"event_id": 2}, events, header)["source"] == "agenda"
+    assert "COMUNIDAD: CNCF" in header.sentences()
+
+
+def test_event_headers_cover_events_committed_before_a_resume(generator, monkeypatch):
+    # A resumed run that writes nothing new still stores the header of every event in scope
+    stored = []
+    monkeypatch.setattr("src.generate_embeddings.EventStore", lambda conninfo: SimpleNamespace(
+        ensure_schema=lambda: None, upsert=lambda name, events, header: stored.extend(events)))
+    generator.writer = PGVectorWriter(None)
+    assert generator.run_events == {}
+    generator.store_event_headers()
+    assert [(e["event_id"], e["event_name"]) for e in stored] == [(1, "KCD Antigua Guatemala 2025")]
+
+    stored.clear()
+    generator.source.event_ids = (99,)
+    generator.store_event_headers()
+    assert stored == []
+
+
+def test_agenda_content_uses_the_session_event(generator):
+    session = next(s for s in enriched_sessions(generator) if s["id"] == 5)
+    content = generator.generate_agenda_content(session)
+    assert "FECHA: 14 de junio de 2025" in content
+
+    other = dict(session, event_name=None, session_date=date(2026, 3, 2))
+    content = generator.generate_agenda_content(other)
+    assert "FECHA: 2 de marzo de 2026" in content
+    assert "KCD" not in content and "14 de junio" not in content
+
+
+def test_sessions_without_speakers_get_defaults(generator):
+    session = next(s for s in enriched_sessions(generator) if s["id"] == 2)
+    assert session["speakers_info"] == "Speaker por determinar"
+    assert session["session_tags"] == "General"
+
+
+def test_process_writes_every_session_once(generator):
+    processed = generator.process_sessions_for_agenda(enriched_sessions(generator))
+    assert processed == 27
+    assert len(generator.writer) == 27
+    assert max(generator.embeddings_model.batch_sizes) <= 8
+    assert set(generator.embeddings_model.forward_batch_sizes) == {8}
+
+    # Re-running upserts the same document ids
+    generator.process_sessions_for_agenda(enriched_sessions(generator))
+    assert len(generator.writer) == 27
+
+
+class _CrashingStore(InMemoryVectorStore):
+    """In-memory store that records every written id and fails on the ``crash_on``-th batch"""
+
+    def __init__(self, crash_on=None, **kwargs):
+        super().__init__(**kwargs)
+        self.crash_on, self.batches, self.written = crash_on, 0, []
+
+    def add(self, texts, embeddings, metadatas, ids):
+        self.batches += 1
+        if self.batches == self.crash_on:
+            raise ConnectionError("pod evicted")
+        self.written.extend(ids)
+        super().add(texts, embeddings, metadatas, ids)
+
+
+def test_sync_run_resumes_after_a_crash_writing_each_session_once(generator, monkeypatch):
+    db = sqlite3.connect(":memory:")
+
+    def checkpoint_store(conninfo, **kwargs):
+        store = CheckpointStore(conninfo, **kwargs)
+        store._connect = lambda: _SQLiteConnection(db)
+        return store
+
+    monkeypatch.setattr("src.generate_embeddings.CheckpointStore", checkpoint_store)
+    monkeypatch.setenv("CHECKPOINT_ENABLED", "true")
+    monkeypatch.delenv("RUN_ID", raising=False)
+    encoder = FakeEncoder()
+
+    crashing = _CrashingStore(crash_on=2, embed_query=encoder.embed_query)
+    first = SimpleAgendaEmbeddingsGenerator(source=SQLiteSourceReader.from_test_data(), writer=crashing,
+                                            embeddings_model=encoder)
+    with pytest.raises(ConnectionError):
+        first.run()
+    assert len(crashing.written) == 10
+
+    resumed_store = _CrashingStore(embed_query=encoder.embed_query)
+    resumed = SimpleAgendaEmbeddingsGenerator(source=SQLiteSourceReader.from_test_data(), writer=resumed_store,
+                                              embeddings_model=encoder)
+    assert resumed.run()
+    assert resumed.checkpoint.resumed and resumed.checkpoint.run_id == first.checkpoint.run_id
+    written = crashing.written + resumed_store.written
+    assert sorted(written) == sorted(f"agenda_session_{i}" for i in range(1, 28))
+    status = db.execute("SELECT status FROM embeddings_run_checkpoints").fetchall()
+    assert status == [("completed",)]
+
+
+class _FailingSource(SQLiteSourceReader):
+    def fetch_sessions(self, shard):
+        raise ConnectionError("source unavailable")
+
+
+class _RecordingRegistry:
+    def __init__(self, conninfo):
+        self.calls = []
+
+    def ensure_schema(self):
+        pass
+
+    def mark_started(self, shard):
+        self.calls.append("started")
+
+    def mark_done(self, shard, count):
+        self.calls.append(("done", count))
+
+
+class _FakeIndexManager:
+    def __init__(self, typed=True):
+        self.typed, self.drops = typed, 0
+
+    def ensure_typed_column(self, dimension):
+        return self.typed
+
+    def drop(self):
+        self.drops += 1
+
+
+@pytest.mark.parametrize("mode, full_load, rows, dropped", [
+    ("auto", True, None, True),
+    ("auto", False, 999, False),
+    ("auto", False, 1000, True),
+    ("rebuild", False, 1, True),
+    ("keep", True, None, False),
+    ("off", True, None, False),
+    ("bogus", True, None, True),
+])
+def test_index_mode_decides_whether_a_load_drops_the_index(generator, monkeypatch, mode, full_load, rows, dropped):
+    manager = _FakeIndexManager()
+    monkeypatch.setattr("src.generate_embeddings.HnswIndexManager.for_collection", lambda *a, **k: manager)
+    generator.index_mode, generator.index_bulk_threshold = mode, 1000
+    generator.prepare_index_for_load(full_load, expected_rows=rows)
+    assert (manager.drops == 1, generator.index_dropped) == (dropped, dropped)
+
+
+def test_untyped_column_skips_index_management(generator, monkeypatch):
+    manager = _FakeIndexManager(typed=False)
+    monkeypatch.setattr("src.generate_embeddings.HnswIndexManager.for_collection", lambda *a, **k: manager)
+    generator.index_mode = "rebuild"
+    generator.prepare_index_for_load(True)
+    assert generator.index_manager is None and not manager.drops
+
+
+def test_shard_with_a_failed_source_read_is_not_marked_done(generator, monkeypatch):
+    # A shard reported done with 0 rows would let finalize_run delete its part of the collection
+    monkeypatch.setattr("src.generate_embeddings.ShardRegistry", _RecordingRegistry)
+    generator.source = _FailingSource.from_test_data()
+    generator.shard = ShardSpec(index=0, count=2, run_id="run-1")
+    generator.pipeline_mode = "sync"
+    assert generator.run() is False
+    assert generator.shard_registry.calls == ["started"]
+    assert len(generator.writer) == 0
+
+
+def test_snapshot_is_read_back_from_the_store(generator, tmp_path):
+    generator.snapshot_dir = str(tmp_path)
+    generator.process_sessions_for_agenda(enriched_sessions(generator))
+    generator.finish_run(27, 1.0)
+
+    snapshot = AgendaSnapshot.load(str(tmp_path))
+    assert sorted(int(i) for i in snapshot.ids) == list(range(1, 28))
+    assert snapshot.vectors.dtype == np.float32 and snapshot.vectors.shape == (27, DIM)
+
+
+def test_snapshot_search_orders_by_similarity(tmp_path):
+    vectors = [[1.0, 0.0, 0.0], [0.6, 0.8, 0.0], [0.0, 1.0, 0.0], [-1.0, 0.0, 0.0]]
+    metadatas = [{"session_id": i, "session_name": f"s{i}"} for i in (10, 11, 12, 13)]
+    export_snapshot(str(tmp_path / "full"), [10, 11, 12, 13], vectors, metadatas, "fake")
+    snapshot = AgendaSnapshot.load(str(tmp_path / "full"))
+
+    hits = snapshot.search([2.0, 0.0, 0.0], k=2)
+    assert [h["session_id"] for h in hits] == [10, 11]
+    assert [h["score"] for h in hits] == pytest.approx([1.0, 0.6])
+    assert hits[1]["metadata"]["session_name"] == "s11"
+    everything = snapshot.search([1.0, 0.0, 0.0], k=50)
+    assert [h["session_id"] for h in everything] == [10, 11, 12, 13]
+    assert snapshot.search([1.0, 0.0, 0.0], k=0) == []
+
+    export_snapshot(str(tmp_path / "empty"), [], [], [], "fake")
+    empty = AgendaSnapshot.load(str(tmp_path / "empty"))
+    assert len(empty) == 0 and empty.search([1.0, 0.0, 0.0], k=5) == []
+
+
+def test_metadata_matches_written_documents(generator):
+    generator.process_sessions_for_agenda(enriched_sessions(generator))
+    text, metadata, vector = generator.writer.documents[next(iter(generator.writer.documents))]
+    assert metadata["session_id"] >= 1
+    assert metadata["session_name"] in text
+    assert vector.shape == (DIM,)
+
+
+def test_search_over_in_memory_store(generator):
+    sessions = enriched_sessions(generator)
+    generator.process_sessions_for_agenda(sessions)
+    query = generator.generate_agenda_content(next(s for s in sessions if s["id"] == 25))
+    hits = generator.writer.similarity_search(query, k=3)
+    assert hits[0].metadata["session_name"] == "Automatización con Argo CD"
+    assert hits[0].score == pytest.approx(1.0)
+
+
+def test_async_pipeline_matches_sync(generator):
+    generator.process_sessions_for_agenda(enriched_sessions(generator))
+    sync_docs = {k: v[0] for k, v in generator.writer.documents.items()}
+
+    generator.writer.documents.clear()
+    assert generator.run_async_pipeline() == 27
+    assert {k: v[0] for k, v in generator.writer.documents.items()} == sync_docs
+
+
+def test_concurrent_queries_are_encoded_in_one_batch(generator):
+    sessions = enriched_sessions(generator)
+    generator.process_sessions_for_agenda(sessions)
+    encoder = generator.embeddings_model
+    encoder.batch_sizes.clear()
+    queries = [generator.generate_agenda_content(s) for s in sessions[:12]]
+
+    async def serve():
+        async with QueryBatcher(encoder, store=generator.writer, window_ms=50, max_batch=8) as batcher:
+            return batcher, await asyncio.gather(*(batcher.search(q, k=2) for q in queries))
+
+    batcher, results = asyncio.run(serve())
+    assert encoder.batch_sizes == [8, 4]
+    assert [hits[0].metadata["session_id"] for hits in results] == [s["id"] for s in sessions[:12]]
+    assert batcher.batch_size.snapshot()["<=8"] == 1 and batcher.batch_size.count == 2
+    assert batcher.queue_depth.count == 12
+
+
+def test_latency_histogram_memory_is_bounded():
+    histogram = Histogram([1, 10, 100], reservoir_size=64)
+    for value in range(10_000):
+        histogram.observe(value % 200)
+    assert histogram.count == 10_000 and len(histogram.samples) == 64
+    assert histogram.mean == pytest.approx(99.5)
+    assert sum(histogram.counts) == 10_000 and histogram.snapshot()[">100"] == 4_950
+    assert 0 <= histogram.percentile(50) < 200
+
+
+def test_partitioned_queries_are_scoped_to_one_event():
+    batcher = QueryBatcher(FakeEncoder(), conninfo={}, partitioned=True)
+    assert batcher._scope({"event_id": 2, "session_type": "workshop"}, None) == ({"session_type": "workshop"}, 2)
+    assert batcher._scope(None, 3) == ({}, 3)
+    with pytest.raises(ValueError):
+        batcher._scope({"session_type": "workshop"}, None)
+
+    collection = QueryBatcher(FakeEncoder(), conninfo={})
+    assert collection._scope({}, 2) == ({"event_id": 2}, None)
+
+
+def test_structured_queries_skip_the_model(generator):
+    generator.process_sessions_for_agenda(enriched_sessions(generator))
+    generator.refresh_query_lexicon()
+    lexicon = generator.query_lexicon
+    assert lexicon.plan("charlas mañana").filters == {"period_of_day": "mañana"}
+    assert lexicon.plan("horarios de la mañana").pure
+    # Filler words alone are not a filter: they fall through to the vector search
+    for filler_only in ("quiero ver", "horarios disponibles"):
+        plan = lexicon.plan(filler_only)
+        assert not plan.pure and plan.route == "vector" and plan.filters == {}
+    assert lexicon.plan("workshops de la tarde").filters == {"session_type": "workshop", "period_of_day": "tarde"}
+    assert lexicon.plan("sesiones de Kubernetes").filters == {"tag_list": ["kubernetes"]}
+    mixed = lexicon.plan("buenas prácticas de kubernetes en producción")
+    assert mixed.route == "filtered-vector" and mixed.filters == {"tag_list": ["kubernetes"]}
+
+    encoder = generator.embeddings_model
+    encoder.batch_sizes.clear()
+
+    async def serve():
+        async with QueryBatcher(encoder, store=generator.writer, window_ms=0) as batcher:
+            router = QueryRouter(lexicon, batcher)
+            return router, await router.search("sesiones de kubernetes", k=30), await router.search(mixed.query, k=30)
+
+    router, fast, filtered = asyncio.run(serve())
+    assert encoder.batch_sizes == [1]
+    assert fast and all("kubernetes" in hit.metadata["tag_list"] for hit in fast + filtered)
+    assert {h.metadata["session_id"] for h in fast} == {h.metadata["session_id"] for h in filtered}
+    assert router.hit_rate == 0.5
+
+
+def test_lexicon_round_trips_and_drops_unknown_aliases():
+    lexicon = Lexicon.from_values([("session_type", "charla"), ("tag_list", "security")])
+    assert "charla" not in lexicon.terms
+    assert lexicon.terms["seguridad"] == ("tag_list", "security")
+    assert "talleres" not in lexicon.terms
+    assert Lexicon.from_dict(lexicon.to_dict()) == lexicon
+
+
+def test_centroid_routing_matches_flat_search(generator):
+    generator.process_sessions_for_agenda(enriched_sessions(generator))
+    generator.store_collection_artifacts()
+    clusters = generator.centroids
+    assert {c.kind for c in clusters} == {"track", "tag"}
+    kubernetes = next(c for c in clusters if c.kind == "tag" and c.name == "kubernetes")
+    assert all("kubernetes" in generator.writer.documents[f"agenda_session_{i}"][1]["tag_list"]
+               for i in kubernetes.member_ids)
+    assert np.linalg.norm(kubernetes.centroid) == pytest.approx(1.0)
+
+    ids, vectors = generator.writer.matrix()
+    session_ids = [generator.writer.documents[i][1]["session_id"] for i in ids]
+    index = CentroidIndex(clusters, session_ids, vectors)
+    query = vectors[4]
+    flat = [(session_ids[h], s) for h, s in enumerate(vectors @ query / np.linalg.norm(vectors, axis=1))]
+    best = max(flat, key=lambda x: x[1])[0]
+    assert index.search(query, k=1, n_probe=len(clusters))[0][0] == best
+    assert index.search(query, k=1, n_probe=1)[0][0] == best
+    assert len(index.candidates(query / np.linalg.norm(query), 1)) < len(ids)
+    assert index.related("tag", "kubernetes", k=3)
+
+
+def test_blocked_neighbors_match_full_matrix(generator):
+    generator.process_sessions_for_agenda(enriched_sessions(generator))
+    generator.store_collection_artifacts()
+    ids, vectors, metadatas = generator.collection_matrix()
+    assert sum(1 for row in generator.neighbors if row[2] <= 10) == 27 * 10
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ normalized.T
+    np.fill_diagonal(scores, -np.inf)
+    blocked = compute_neighbors(ids, vectors, k=3, block_size=4)
+    for session_id, neighbor_id, rank, score, conflict in blocked:
+        row = ids.index(session_id)
+        assert score == pytest.approx(np.sort(scores[row])[::-1][rank - 1], abs=1e-6)
+        assert neighbor_id != session_id and not conflict
+
+    # Both rankings come out of one table: the first k ranks, and the first k rows without conflict
+    both = compute_neighbors(ids, vectors, k=5, metadatas=metadatas)
+    slots = {i: tuple(s) for i, s in zip(ids, time_slots(metadatas))}
+    for session_id in ids:
+        ranked = sorted((r for r in both if r[0] == session_id), key=lambda r: r[2])
+        row = ids.index(session_id)
+        assert [r[3] for r in ranked[:5]] == pytest.approx(np.sort(scores[row])[::-1][:5].tolist(), abs=1e-6)
+        (day, start, end) = slots[session_id]
+        overlapping = [(n_day == day and start < n_end and n_start < end)
+                       for n_day, n_start, n_end in (slots[i] for i in ids)]
+        free = [scores[row, c] for c in range(len(ids)) if c != row and not overlapping[c]]
+        assert [r[3] for r in ranked if not r[4]][:5] == pytest.approx(sorted(free, reverse=True)[:5], abs=1e-6)
+        for _, neighbor_id, _, _, conflict in ranked:
+            assert conflict == overlapping[ids.index(neighbor_id)]
+
+
+def test_fractional_cpu_quota_rounds_down(monkeypatch):
+    monkeypatch.setattr(cpu, "affinity_cpus", lambda: 8)
+    monkeypatch.setattr(cpu, "cgroup_cpu_quota", lambda: 1.5)
+    assert cpu.effective_cpus() == 1
+    monkeypatch.setattr(cpu, "cgroup_cpu_quota", lambda: 0.5)
+    assert cpu.effective_cpus() == 1
+    plan = cpu.plan_threads(reserved=1, cpus=4)
+    assert (plan.intra_op, plan.reserved) == (3, 1)
+
+
+def test_calibrate_times_every_grid_point(generator):
+    texts = autotune.sample_agenda_texts(generator, 16)
+    assert len(texts) == 16
+    encoder, threads_set = FakeEncoder(), []
+
+    def encode(batch, batch_size):
+        encoder.encode_kwargs["batch_size"] = batch_size
+        encoder.embed_documents(batch)
+
+    points = autotune.calibrate(encode, texts, [4, 8], [1, 2], threads_set.append)
+    assert threads_set == [1, 2]
+    assert [(p.threads, p.batch_size) for p in points] == [(1, 4), (1, 8), (2, 4), (2, 8)]
+    # One warm-up pass per thread setting, then the full sample per batch size
+    assert encoder.batch_sizes == [8, 16, 16, 8, 16, 16]
+    assert encoder.forward_batch_sizes == [8, 4, 8, 8, 4, 8]
+    assert all(p.texts_per_sec > 0 for p in points)
+
+
+def test_best_point_prefers_fewer_threads_within_tolerance():
+    points = [
+        autotune.TunePoint(16, 1, 100.0, 1.0),
+        autotune.TunePoint(32, 4, 101.0, 1.0),
+        autotune.TunePoint(8, 2, 90.0, 1.0),
+    ]
+    assert (autotune.best_point(points).threads, autotune.best_point(points).batch_size) == (1, 16)
+    assert autotune.best_point(points, tolerance=0.0).threads == 4
+
+
+def test_autotune_profile_round_trips_into_the_generator(generator, monkeypatch, tmp_path):
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("AUTOTUNE", "auto")
+    points = [autotune.TunePoint(64, 2, 120.0, 0.5), autotune.TunePoint(32, 1, 80.0, 0.8)]
+    profile = autotune.TuneProfile(generator.embedding_model_name, autotune.cpu_signature(),
+                                   64, 2, 120.0, 60, points=points)
+    autotune.save_profile(str(tmp_path), profile)
+    assert autotune.load_profile(str(tmp_path), generator.embedding_model_name) == profile
+    assert autotune.load_profile(str(tmp_path), "another-model") is None
+
+    tuned = SimpleAgendaEmbeddingsGenerator(source=SQLiteSourceReader.from_test_data(),
+                                            writer=InMemoryVectorStore(), embeddings_model=FakeEncoder())
+    assert (tuned.encode_batch_size, tuned.encode_threads) == (64, 2)
+
+
+def _fake_cgroup(monkeypatch, tmp_path, v2=None, v1=None):
+    tmp_path.mkdir(exist_ok=True)
+    for name, attr, raw in (("memory.max", "CGROUP_V2_LIMIT", v2), ("limit_in_bytes", "CGROUP_V1_LIMIT", v1)):
+        path = tmp_path / name
+        if raw is not None:
+            path.write_text(raw + "\n")
+        monkeypatch.setattr(memory, attr, str(path))
+
+
+def test_memory_budget_is_capped_by_the_cgroup_limit(monkeypatch, tmp_path):
+    _fake_cgroup(monkeypatch, tmp_path, v2=str(1000 * 1024 * 1024))
+    assert memory.MemoryGovernor(budget_mb=0).effective_budget_mb == pytest.approx(900)
+    assert memory.MemoryGovernor(budget_mb=500).effective_budget_mb == 500
+    assert memory.MemoryGovernor(budget_mb=2000).effective_budget_mb == pytest.approx(900)
+
+    _fake_cgroup(monkeypatch, tmp_path / "v1", v1=str(2000 * 1024 * 1024))
+    assert memory.MemoryGovernor(budget_mb=0).effective_budget_mb == pytest.approx(1800)
+    _fake_cgroup(monkeypatch, tmp_path / "unlimited", v2="max", v1=str(1 << 62))
+    assert memory.MemoryGovernor(budget_mb=0).effective_budget_mb is None
+    assert memory.MemoryGovernor(budget_mb=300).effective_budget_mb == 300
+
+
+def test_memory_governor_halves_and_doubles_batches_between_watermarks(monkeypatch, tmp_path):
+    _fake_cgroup(monkeypatch, tmp_path)
+    rss = SimpleNamespace(mb=900.0)
+    monkeypatch.setattr(memory, "current_rss_mb", lambda: rss.mb)
+    governor = memory.MemoryGovernor(budget_mb=1000)
+
+    assert governor.adjust("encode", 64, ceiling=64) == 32
+    assert governor.adjust("encode", 1) == 1
+    rss.mb = 700.0
+    assert governor.adjust("encode", 32) == 32
+    rss.mb = 500.0
+    assert governor.adjust("encode", 32) == 64
+    assert governor.adjust("encode", 64) == 64
+    assert [(d.old_size, d.new_size) for d in governor.decisions] == [(64, 32), (32, 64)]
+
+    observer = memory.MemoryGovernor(budget_mb=0)
+    rss.mb = 10_000.0
+    assert observer.adjust("write", 128) == 128 and not observer.decisions
+
+
+def test_memory_stages_record_their_own_peaks(monkeypatch, tmp_path):
+    _fake_cgroup(monkeypatch, tmp_path)
+    readings = iter([100.0, 150.0, 150.0, 120.0])
+    peaks = iter([400.0, 180.0])
+    monkeypatch.setattr(memory, "current_rss_mb", lambda: next(readings))
+    monkeypatch.setattr(memory, "reset_peak_rss", lambda: True)
+    monkeypatch.setattr(memory, "peak_rss_mb", lambda: next(peaks))
+    governor = memory.MemoryGovernor()
+    with governor.stage("encode"):
+        pass
+    with governor.stage("write"):
+        pass
+    assert [(s.name, s.rss_start_mb, s.rss_end_mb, s.peak_rss_mb) for s in governor.stages] == [
+        ("encode", 100.0, 150.0, 400.0), ("write", 150.0, 120.0, 180.0),
+    ]
+
+    # Without a resettable peak counter the stage peak falls back to its start/end readings
+    readings = iter([200.0, 260.0])
+    monkeypatch.setattr(memory, "current_rss_mb", lambda: next(readings))
+    monkeypatch.setattr(memory, "reset_peak_rss", lambda: False)
+    with governor.stage("load"):
+        pass
+    assert governor.stages[-1].peak_rss_mb == 260.0